@@ -0,0 +1,206 @@
+"""Population analytics over predictions, served from precomputed daily rollups.
+
+The prediction_rollups table keeps one row per day x disease x risk_level
+bucket with the prediction count and the sum of probabilities. Dashboard
+queries read buckets only, so they cost O(buckets) however many predictions
+are stored, and never touch form_data.
+
+Rollups.record() folds rows into in-memory deltas as the prediction writer
+inserts them; flush() adds the deltas to the stored buckets with one call to
+the apply_prediction_rollups() SQL function, which only the service role may
+execute. Deltas that fail to apply are
+kept and retried at the next flush. Deltas lost with a crashed worker are
+recovered by the backfill, which streams the predictions table in keyset
+pages and rebuilds every bucket before a cutoff day:
+
+    python analytics.py backfill [--until 2026-01-31] [--page-size 1000]
+
+The table and SQL functions are in supabase_analytics.sql.
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLUMNS = "day,disease,risk_level,prediction_count,probability_sum"
+RISK_LEVELS = ("Very Low", "Low", "Moderate", "High", "Very High")
+
+
+def bucket_key(row):
+    # Days are UTC, like the backfill's timestamptz; rows queued before insert may not have a created_at yet
+    created_at = row.get("created_at")
+    if created_at is None:
+        day = datetime.now(timezone.utc)
+    else:
+        day = created_at if isinstance(created_at, datetime) else datetime.fromisoformat(str(created_at))
+        # Naive timestamps (spilled by older versions) are server local time
+        day = day.astimezone(timezone.utc)
+    return day.date().isoformat(), row["disease"], row["risk_level"]
+
+
+def accumulate(buckets, rows):
+    for row in rows:
+        bucket = buckets.setdefault(bucket_key(row), [0, 0.0])
+        bucket[0] += 1
+        bucket[1] += float(row["probability"])
+    return buckets
+
+
+def _payload(buckets):
+    return [{"day": day, "disease": disease, "risk_level": risk_level,
+             "prediction_count": count, "probability_sum": total}
+            for (day, disease, risk_level), (count, total) in buckets.items()]
+
+
+class Rollups:
+    def __init__(self, client, table="prediction_rollups", page_size=1000):
+        self.client = client
+        self.table = table
+        self.page_size = page_size
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "flushes": 0, "failures": 0}
+
+    def record(self, rows):
+        """Count inserted prediction rows towards their buckets (no I/O)."""
+        with self._lock:
+            accumulate(self._deltas, rows)
+            self.stats["recorded"] += len(rows)
+
+    def pending(self):
+        with self._lock:
+            return len(self._deltas)
+
+    def flush(self):
+        """Apply pending deltas to the stored rollups; returns False if they were kept for a retry."""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return True
+        try:
+            with metrics.supabase_call("prediction_rollups.apply"):
+                self.client.rpc("apply_prediction_rollups", {"deltas": _payload(deltas)}).execute()
+        except Exception as e:
+            with self._lock:
+                for key, (count, total) in deltas.items():
+                    bucket = self._deltas.setdefault(key, [0, 0.0])
+                    bucket[0] += count
+                    bucket[1] += total
+                self.stats["failures"] += 1
+            logger.warning("Applying %d rollup buckets failed, keeping them for the next flush: %s", len(deltas), e)
+            return False
+        self.stats["flushes"] += 1
+        return True
+
+    def query(self, start=None, end=None, disease=None):
+        """Stored buckets with start <= day <= end (ISO dates), optionally for one disease."""
+        buckets = []
+        offset = 0
+        while True:
+            q = self.client.table(self.table).select(ROLLUP_COLUMNS)
+            if start:
+                q = q.gte("day", start)
+            if end:
+                q = q.lte("day", end)
+            if disease:
+                q = q.eq("disease", disease)
+            q = q.order("day").order("disease").order("risk_level").range(offset, offset + self.page_size - 1)
+            with metrics.supabase_call("prediction_rollups.select"):
+                page = q.execute().data or []
+            buckets.extend(page)
+            if len(page) < self.page_size:
+                return buckets
+            offset += self.page_size
+
+
+def summarize(buckets):
+    """Dashboard view of rollup buckets: totals, per disease, and a per day x disease series."""
+    def entry():
+        return {"count": 0, "probability_sum": 0.0, "risk_levels": dict.fromkeys(RISK_LEVELS, 0)}
+
+    total = entry()
+    diseases = {}
+    series = {}
+    for b in buckets:
+        count = int(b["prediction_count"])
+        for e in (total, diseases.setdefault(b["disease"], entry()),
+                  series.setdefault((str(b["day"]), b["disease"]), entry())):
+            e["count"] += count
+            e["probability_sum"] += float(b["probability_sum"])
+            e["risk_levels"][b["risk_level"]] = e["risk_levels"].get(b["risk_level"], 0) + count
+
+    def finish(e, **keys):
+        probability_sum = e.pop("probability_sum")
+        e["mean_probability"] = probability_sum / e["count"] if e["count"] else None
+        return {**keys, **e}
+
+    return {
+        "total": finish(total),
+        "by_disease": [finish(e, disease=d) for d, e in sorted(diseases.items())],
+        "series": [finish(e, day=day, disease=d) for (day, d), e in sorted(series.items())],
+    }
+
+
+def stream_predictions(client, until, page_size=1000, table="predictions"):
+    """Yield pages of predictions created before `until`, keyset-paginated on the primary key."""
+    last_id = None
+    while True:
+        q = client.table(table).select("id,created_at,disease,probability,risk_level").lt("created_at", until)
+        if last_id is not None:
+            q = q.gt("id", last_id)
+        with metrics.supabase_call(f"{table}.select"):
+            page = q.order("id").limit(page_size).execute().data or []
+        if page:
+            yield page
+            last_id = page[-1]["id"]
+        if len(page) < page_size:
+            return
+
+
+def backfill(client, until=None, page_size=1000):
+    """Rebuild every bucket before `until` (default: today, UTC) from the predictions table.
+
+    Buckets from `until` on are left to live updates, so the backfill does not race
+    with predictions being counted for the current day.
+    """
+    until = until or datetime.now(timezone.utc).date().isoformat()
+    buckets = {}
+    rows = 0
+    for page in stream_predictions(client, until, page_size):
+        accumulate(buckets, page)
+        rows += len(page)
+    with metrics.supabase_call("prediction_rollups.replace"):
+        client.rpc("replace_prediction_rollups", {"rollups": _payload(buckets), "until_day": until}).execute()
+    return rows, len(buckets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the prediction analytics rollups.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("backfill", help="Rebuild rollups from the predictions table.")
+    rebuild.add_argument("--until", type=lambda s: date.fromisoformat(s).isoformat(),
+                         help="Rebuild days before this date (default: today, UTC)")
+    rebuild.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Row Level Security hides other users' predictions from the anon key
+    service_key = os.environ.get("SUPABASE_SERVICE_KEY")
+    if service_key:
+        from supabase import create_client
+        client = create_client(os.environ["SUPABASE_URL"], service_key)
+    else:
+        from models import supabase as client
+    rows, buckets = backfill(client, args.until, args.page_size)
+    print(f"Rebuilt {buckets} buckets from {rows} predictions before {args.until or 'today'}")
+
+
+if __name__ == "__main__":
+    main()
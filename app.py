@@ -1,9 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, g
+from contextlib import nullcontext
 from functools import wraps
-import joblib
+import atexit
+import hashlib
+from datetime import date, datetime, timezone
+import itertools
+import time
+import analytics
+import batch_predict
+import feature_schema
+import metrics
+from inference import DISEASE_LABELS
+from model_registry import ModelManager
+from disease_catalog import CatalogLoader
+from prediction_writer import PredictionWriter
+from local_store import SQLiteStore, SupabaseSync
+from cache import analytics_cache, caches, page_cache, prediction_cache, recent_predictions_cache
 import numpy as np
-import pandas as pd
-from models import User, supabase
+from auth import AuthError, TokenExpired
+from models import User, supabase, token_refresher, token_verifier
 from dotenv import load_dotenv
 load_dotenv()
 import os
@@ -13,6 +28,7 @@ from supabase import create_client
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_KEY")
+SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
 
 
 app = Flask(__name__)
@@ -22,81 +38,203 @@ app.secret_key = "supersecretkey"
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user' not in session:
+        if 'user' not in session or not authenticate():
             return redirect(url_for('login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
+def store_session_tokens(tokens):
+    session['access_token'] = tokens['access_token']
+    session['refresh_token'] = tokens['refresh_token']
+
+def end_session():
+    for key in ('user', 'access_token', 'refresh_token'):
+        session.pop(key, None)
+
+def authenticate():
+    """Verify the session's access token locally, refreshing it before it expires.
+
+    A refresh finished in the background is picked up here; an expired token is
+    refreshed on the spot. Returns False, and ends the session, if the user has to
+    log in again.
+    """
+    tokens = token_refresher.collect(session.get('refresh_token'))
+    if tokens:
+        store_session_tokens(tokens)
+    try:
+        try:
+            claims = token_verifier.verify(session.get('access_token'))
+        except TokenExpired:
+            tokens = token_refresher.refresh(session.get('refresh_token'))
+            store_session_tokens(tokens)
+            claims = token_verifier.verify(tokens['access_token'])
+    except AuthError:
+        end_session()
+        return False
+    if tokens:
+        # A new token carries the current user_metadata
+        session['user'] = User.profile_from_claims(claims) or session['user']
+    if token_refresher.due(claims):
+        token_refresher.schedule(session['refresh_token'])
+    g.token_claims = claims
+    return True
+
+atexit.register(token_refresher.close)
+
 def current_user():
     if 'user' in session:
         return session['user']
     return None
 
-# Load model
-model = joblib.load("disease_predictor_model.pkl")
+# Micro-batch concurrent /predict calls into one forest evaluation (threaded or async workers).
+# INFERENCE_BATCH_SIZE=1, the default, scores each request on its own.
+inference_batching = None
+if int(os.environ.get("INFERENCE_BATCH_SIZE", 1)) > 1:
+    inference_batching = dict(
+        max_batch_size=int(os.environ["INFERENCE_BATCH_SIZE"]),
+        max_wait=float(os.environ.get("INFERENCE_BATCH_WAIT_MS", 2)) / 1e3
+    )
+
+# Load model: the CURRENT version of MODEL_REGISTRY_DIR, or the default model file. New versions
+# are loaded and warmed up in the background and swapped in; requests use model_manager.engine.
+model_manager = ModelManager(
+    registry=os.environ.get("MODEL_REGISTRY_DIR") or None,
+    poll_interval=float(os.environ.get("MODEL_RELOAD_INTERVAL", 5)),
+    batching=inference_batching,
+    # Cached results are keyed by model version, so entries of the old version are dead weight
+    on_swap=lambda engine: prediction_cache.clear()
+)
+model_manager.load()
+model_manager.start()
+atexit.register(model_manager.close)
 
 # Disease label map
-disease_labels = {
-    0: "Thalassemia",
-    1: "Hemophilia",
-    2: "Breast Cancer",
-    3: "Sickle Cell Anemia",
-    4: "Cystic Fibrosis"
-}
-
-# Dummy disease data for explorer/detail (replace with DB if needed)
-disease_info = [
-    {
-        "id": 0,
-        "name": "Thalassemia",
-        "description": "A blood disorder involving less than normal amounts of an oxygen-carrying protein.",
-        "inheritance_pattern": "Autosomal recessive",
-        "gene_involved": "HBB, HBA1, HBA2",
-        "prevalence": "Common in Mediterranean, South Asian populations",
-        "symptoms": ["Fatigue", "Pale skin", "Shortness of breath"],
-        "risk_factors": ["Family history", "Certain ethnic backgrounds"]
-    },
-    {
-        "id": 1,
-        "name": "Hemophilia",
-        "description": "A disorder in which blood doesn't clot normally.",
-        "inheritance_pattern": "X-linked recessive",
-        "gene_involved": "F8, F9",
-        "prevalence": "Rare, mostly males",
-        "symptoms": ["Excessive bleeding", "Easy bruising", "Joint pain"],
-        "risk_factors": ["Family history", "Male gender"]
-    },
-    {
-        "id": 2,
-        "name": "Breast Cancer",
-        "description": "A cancer that forms in the cells of the breasts.",
-        "inheritance_pattern": "Multifactorial",
-        "gene_involved": "BRCA1, BRCA2",
-        "prevalence": "Common worldwide",
-        "symptoms": ["Lump in breast", "Change in breast shape", "Skin changes"],
-        "risk_factors": ["Family history", "BRCA mutations", "Age"]
-    },
-    {
-        "id": 3,
-        "name": "Sickle Cell Anemia",
-        "description": "A group of inherited red blood cell disorders.",
-        "inheritance_pattern": "Autosomal recessive",
-        "gene_involved": "HBB",
-        "prevalence": "Common in African, Mediterranean populations",
-        "symptoms": ["Pain episodes", "Anemia", "Swelling in hands/feet"],
-        "risk_factors": ["Family history", "Certain ethnic backgrounds"]
-    },
-    {
-        "id": 4,
-        "name": "Cystic Fibrosis",
-        "description": "A disorder that causes severe damage to the lungs and digestive system.",
-        "inheritance_pattern": "Autosomal recessive",
-        "gene_involved": "CFTR",
-        "prevalence": "Rare, mostly Caucasians",
-        "symptoms": ["Persistent cough", "Frequent lung infections", "Poor growth"],
-        "risk_factors": ["Family history", "Northern European descent"]
-    }
-]
+disease_labels = DISEASE_LABELS
+
+# Where predictions are stored and read back: Supabase, or with PREDICTION_STORE=sqlite a local
+# WAL database (works offline) that a background thread syncs up to Supabase
+prediction_sync = None
+if os.environ.get("PREDICTION_STORE", "supabase") == "sqlite":
+    prediction_store = SQLiteStore(os.environ.get("PREDICTION_DB_PATH", "predictions.db"))
+    prediction_sync = SupabaseSync(
+        prediction_store, supabase, interval=float(os.environ.get("PREDICTION_SYNC_INTERVAL", 5.0))
+    )
+    prediction_sync.start()
+    atexit.register(prediction_sync.close)
+else:
+    prediction_store = supabase
+
+# Per day x disease x risk level counts for the analytics dashboard, kept up to date as rows land.
+# apply_prediction_rollups() is executable by the service role only, so live updates need
+# SUPABASE_SERVICE_KEY; without it the rollups are left to `python analytics.py backfill`.
+if SUPABASE_SERVICE_KEY:
+    rollups = analytics.Rollups(create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY))
+else:
+    rollups = analytics.Rollups(supabase)
+    app.logger.warning("SUPABASE_SERVICE_KEY is not set: prediction rollups are only updated by the backfill")
+atexit.register(rollups.flush)
+
+def invalidate_recent_predictions(rows):
+    # Drop cached history once rows actually land, in case a view re-cached it meanwhile
+    for user_id in {row.get("user_id") for row in rows}:
+        recent_predictions_cache.invalidate(user_id)
+    if prediction_sync is not None:
+        prediction_sync.notify()
+    if SUPABASE_SERVICE_KEY:
+        rollups.record(rows)
+        rollups.flush()
+
+# Prediction rows are written to the store in the background, in batches
+prediction_writer = PredictionWriter(
+    prediction_store,
+    max_batch_size=int(os.environ.get("PREDICTION_BATCH_SIZE", 100)),
+    flush_interval=float(os.environ.get("PREDICTION_FLUSH_INTERVAL", 1.0)),
+    spill_path=os.environ.get("PREDICTION_SPILL_PATH", "predictions_spill.jsonl"),
+    dead_letter_path=os.environ.get("PREDICTION_DEAD_LETTER_PATH", "predictions_dead_letter.jsonl"),
+    on_flush=invalidate_recent_predictions,
+    remote=prediction_sync is None
+)
+atexit.register(prediction_writer.close)
+
+# Cache and write-behind queue stats, read when /metrics is scraped
+metrics.CallbackGauge(
+    "cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"),
+    lambda: {(name, result): c.stats()[result] for name, c in caches.items() for result in ("hits", "misses")},
+    kind="counter"
+)
+metrics.CallbackGauge("cache_entries", "Entries held per cache.", ("cache",),
+                      lambda: {(name,): c.stats()["size"] for name, c in caches.items()})
+if prediction_sync is not None:
+    metrics.CallbackGauge("prediction_sync_pending", "Local prediction rows not yet synced to Supabase.", (),
+                          lambda: {(): prediction_store.pending_sync()})
+metrics.CallbackGauge("prediction_rollups_pending", "Rollup buckets with deltas not yet applied.", (),
+                      lambda: {(): rollups.pending()})
+metrics.CallbackGauge(
+    "model_info", "Model versions loaded in this worker (role: serving or candidate).", ("version", "role"),
+    lambda: {(e.version, role): 1 for role, e in (("serving", model_manager.engine),
+                                                   ("candidate", model_manager.candidate)) if e is not None}
+)
+metrics.CallbackGauge("prediction_writer_pending", "Prediction rows queued for insert.", (),
+                      lambda: {(): prediction_writer.pending()})
+metrics.CallbackGauge("prediction_writer_events_total", "Write-behind queue counters (rows, batches, retries, rejected rows).",
+                      ("event",), lambda: {(k,): v for k, v in prediction_writer.stats.items()}, kind="counter")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = metrics.profiler.start()
+
+@app.before_request
+def ensure_model_reloader():
+    # Restarts the reload/shadow threads in workers forked after import
+    model_manager.start()
+
+def record_request(status):
+    # Label by URL rule, not path, so /disease/<int:id> stays one series
+    if 'request_start' not in g:
+        return
+    elapsed = time.perf_counter() - g.pop('request_start')
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_latency.observe(elapsed, route, request.method, status)
+    metrics.profiler.stop(g.pop('profile', None), elapsed, f"{request.method} {route}")
+
+@app.after_request
+def record_request_metrics(response):
+    record_request(str(response.status_code))
+    return response
+
+@app.teardown_request
+def record_failed_request(exc):
+    # after_request does not run when a view raises
+    if exc is not None:
+        record_request("500")
+
+# Disease explorer/detail catalog, indexed by id and re-read when the data file changes
+catalog_loader = CatalogLoader(check_interval=float(os.environ.get("DISEASE_CATALOG_CHECK_INTERVAL", 5)))
+
+def render_cached_page(catalog, key, render):
+    """Serve a catalog page from the rendered-page cache, answering revalidations with 304.
+
+    render() builds the HTML. Pages depend only on the catalog and the template, so one
+    copy per catalog version serves every user; the ETag is a hash of the body.
+    """
+    if '_flashes' in session or app.jinja_env.auto_reload:
+        # Pending flash messages are rendered into (and consumed by) this response only
+        return render()
+    key = (catalog.version,) + key
+    entry = page_cache.get(key)
+    if entry is None:
+        body = render()
+        entry = (body, hashlib.sha256(body.encode()).hexdigest()[:32])
+        page_cache.set(key, entry)
+    body, etag = entry
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.last_modified = catalog.last_modified
+    # Browsers may keep the page but must revalidate, since it is behind the login
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -114,8 +252,9 @@ def login():
                 session['access_token'] = auth_response.session.access_token
                 session['refresh_token'] = auth_response.session.refresh_token
                 
-                # Get and store user data
-                user_data = User.get_user_by_id(auth_response.user.id)
+                # The profile comes with the sign-in response (user_metadata), or from the user cache
+                user = auth_response.user
+                user_data = User.profile({"sub": user.id, "email": user.email, "user_metadata": user.user_metadata})
                 if user_data:
                     session['user'] = user_data
                     next_page = request.args.get('next')
@@ -165,8 +304,11 @@ def signup():
 @app.route("/logout")
 @login_required
 def logout():
-    User.logout()
-    session.pop('user', None)
+    try:
+        User.logout(session['access_token'])
+    except Exception as e:
+        app.logger.warning("Revoking the session failed, ending it locally: %s", e)
+    end_session()
     return redirect(url_for('home'))
 
 @app.route("/")
@@ -178,16 +320,95 @@ def home():
 @app.route("/diseases")
 @login_required
 def diseases():
-    return render_template("disease_explorer.html", diseases=disease_info)
+    catalog = catalog_loader.maybe_reload()
+    return render_cached_page(catalog, ("diseases",), lambda: render_template(
+        "disease_explorer.html", diseases=catalog.entries))
 
 @app.route("/disease/<int:id>")
 @login_required
 def disease_detail(id):
-    disease = next((d for d in disease_info if d["id"] == id), None)
+    catalog = catalog_loader.maybe_reload()
+    disease = catalog.get(id)
     if not disease:
         flash("Disease not found.", "error")
         return redirect(url_for("diseases"))
-    return render_template("disease_detail.html", disease=disease)
+    return render_cached_page(catalog, ("disease", id), lambda: render_template(
+        "disease_detail.html", disease=disease))
+
+def run_prediction(engine, features_dict, warnings_count, gender, family_history, hemoglobin,
+                   sickled_rbc, brca1_expression, p53_mutation, sweat_chloride):
+    """Model call, male/Breast Cancer masking and risk level for one patient."""
+    pred, proba_all = engine.predict_one(features_dict)
+    # Score the same row with the candidate model, if one is set, off the request path
+    model_manager.shadow(features_dict, proba_all)
+    # Prevent breast cancer prediction for males
+    if gender == 1 and disease_labels.get(pred) == "Breast Cancer":
+        breast_cancer_idx = [k for k, v in disease_labels.items() if v == "Breast Cancer"]
+        if breast_cancer_idx:
+            proba_all[breast_cancer_idx[0]] = 0
+            pred = int(np.argmax(proba_all))
+    probability = proba_all[pred]
+
+    # Calculate risk level based on multiple factors
+    def calculate_risk_level(prob, warnings_count, family_hist, disease_specific_factors):
+        # Base risk from probability
+        if prob < 0.2:
+            risk = "Very Low"
+        elif prob < 0.4:
+            risk = "Low"
+        elif prob < 0.6:
+            risk = "Moderate"
+        elif prob < 0.8:
+            risk = "High"
+        else:
+            risk = "Very High"
+
+        # Adjust for number of out-of-range values
+        if warnings_count >= 3:
+            risk = "High" if risk == "Moderate" else risk
+
+        # Adjust for family history
+        if family_hist == 1 and risk in ["Low", "Moderate"]:
+            risk = "Moderate" if risk == "Low" else "High"
+
+        # Adjust for disease-specific factors
+        if disease_specific_factors:
+            if risk != "Very High":
+                risk = "High"
+
+        return risk
+
+    # Check for disease-specific risk factors
+    disease_specific_risk = False
+    predicted_disease = disease_labels.get(pred)
+
+    if predicted_disease == "Thalassemia" and hemoglobin < 9:
+        disease_specific_risk = True
+    elif predicted_disease == "Sickle Cell Anemia" and sickled_rbc > 40:
+        disease_specific_risk = True
+    elif predicted_disease == "Breast Cancer" and (brca1_expression < 0.3 or p53_mutation == 1):
+        disease_specific_risk = True
+    elif predicted_disease == "Cystic Fibrosis" and sweat_chloride > 60:
+        disease_specific_risk = True
+
+    risk_level = calculate_risk_level(
+        probability,
+        warnings_count,
+        family_history,
+        disease_specific_risk
+    )
+    return pred, proba_all, risk_level
+
+def prediction_json(prediction, probability, risk_level, explanation, warnings, model_version):
+    return {
+        "prediction": int(prediction),
+        "disease": disease_labels.get(int(prediction)),
+        "probability": float(probability),
+        "risk_level": risk_level,
+        "explanation": explanation,
+        "warnings": warnings,
+        "model_version": model_version,
+    }
 
 @app.route("/predict", methods=["GET", "POST"])
 @login_required
@@ -200,139 +421,56 @@ def predict():
     prediction = None
     probability = None
     form_data = None
+    # ?format=json answers the POST with the result and its explanation instead of redirecting
+    as_json = request.args.get('format') == 'json'
     if request.method == "POST":
         try:
             # Get raw input values
-            age = float(request.form.get("age", 0))
-            gender = int(request.form.get("gender", 1))
-            family_history = int(request.form.get("family_history", 0))
-            hemoglobin = float(request.form.get("hemoglobin", 0))
-            fetal_hemoglobin = float(request.form.get("fetal_hemoglobin", 0))
-            rdw_cv = float(request.form.get("rdw_cv", 0))
-            serum_ferritin = float(request.form.get("serum_ferritin", 0))
-            brca1_expression = float(request.form.get("brca1_expression", 0))
-            p53_mutation = int(request.form.get("p53_mutation", 0))
-            sweat_chloride = float(request.form.get("sweat_chloride", 0))
-            sickled_rbc = float(request.form.get("sickled_rbc_percent", 0))
-            il6_level = float(request.form.get("il6_level", 0))
+            with metrics.predict_stage.time("parse"):
+                raw = feature_schema.parse_form(request.form)
+                values = dict(zip(feature_schema.FIELDS, raw))
 
             # Flag (not reject) out-of-range values
-            warnings = []
-            if not (0 <= age <= 120): warnings.append("Unusual age: please check entry (years: 0–120).")
-            if gender not in [0, 1]: warnings.append("Gender must be 0 (Female) or 1 (Male).")
-            if family_history not in [0, 1]: warnings.append("Family history must be 0 or 1.")
-            if not (3.0 <= hemoglobin <= 20.0): warnings.append("Hemoglobin outside typical range (3–20 g/dL).")
-            if not (0 <= fetal_hemoglobin <= 100): warnings.append("Fetal Hemoglobin % outside typical range (0–100%).")
-            if not (8 <= rdw_cv <= 30): warnings.append("RDW-CV outside typical range (8–30%).")
-            if not (1 <= serum_ferritin <= 2000): warnings.append("Serum Ferritin outside typical range (1–2000 ng/mL).")
-            if not (0 <= brca1_expression <= 1): warnings.append("BRCA1 expression outside 0–1 (check units).")
-            if p53_mutation not in [0, 1]: warnings.append("p53 mutation must be 0 or 1.")
-            if not (0 <= sweat_chloride <= 200): warnings.append("Sweat chloride outside typical range (0–200 mmol/L).")
-            if not (0 <= sickled_rbc <= 100): warnings.append("Sickled RBC % outside 0–100%.")
-            if not (0 <= il6_level <= 1000): warnings.append("IL-6 outside typical range (0–1000 pg/mL).")
-
-            for warn in warnings:
-                flash(warn, "warning")
-
-            # Normalize for model input
-            age_norm = age / 100
-            hemoglobin_norm = (hemoglobin - 6) / (9.5 - 6)
-            fetal_hemoglobin_norm = (fetal_hemoglobin - 7) / (18 - 7)
-            rdw_cv_norm = (rdw_cv - 13) / (21 - 13)
-            serum_ferritin_norm = (serum_ferritin - 20) / (60 - 20)
-            brca1_expression_norm = brca1_expression / 0.4
-            sweat_chloride_norm = (sweat_chloride - 30) / (60 - 30)
-            sickled_rbc_norm = sickled_rbc / 2
-            il6_level_norm = (il6_level - 1) / (9 - 1)
-
-            # Create features with column names matching training data
-            features_dict = {
-                'Age': age_norm,
-                'Gender': gender,
-                'Family_History': family_history,
-                'Hemoglobin': hemoglobin_norm,
-                'Fetal_Hemoglobin': fetal_hemoglobin_norm,
-                'RDW_CV': rdw_cv_norm,
-                'Serum_Ferritin': serum_ferritin_norm,
-                'BRCA1_Expression': brca1_expression_norm,
-                'p53_Mutation': p53_mutation,
-                'Sweat_Chloride': sweat_chloride_norm,
-                'Sickled_RBC_Percent': sickled_rbc_norm,
-                'IL6_Level': il6_level_norm
-            }
-            X = pd.DataFrame([features_dict])
-            proba_all = model.predict_proba(X)[0]
-            pred = model.predict(X)[0]
-            # Prevent breast cancer prediction for males
-            if gender == 1 and disease_labels.get(pred) == "Breast Cancer":
-                breast_cancer_idx = [k for k, v in disease_labels.items() if v == "Breast Cancer"]
-                if breast_cancer_idx:
-                    proba_all[breast_cancer_idx[0]] = 0
-                    pred = int(np.argmax(proba_all))
-            proba = proba_all[pred]
-            prediction = pred
-            probability = proba
-            
-            # Calculate risk level based on multiple factors
-            def calculate_risk_level(prob, warnings_count, family_hist, disease_specific_factors):
-                # Base risk from probability
-                if prob < 0.2:
-                    risk = "Very Low"
-                elif prob < 0.4:
-                    risk = "Low"
-                elif prob < 0.6:
-                    risk = "Moderate"
-                elif prob < 0.8:
-                    risk = "High"
-                else:
-                    risk = "Very High"
-                
-                # Adjust for number of out-of-range values
-                if warnings_count >= 3:
-                    risk = "High" if risk == "Moderate" else risk
-                
-                # Adjust for family history
-                if family_hist == 1 and risk in ["Low", "Moderate"]:
-                    risk = "Moderate" if risk == "Low" else "High"
-                
-                # Adjust for disease-specific factors
-                if disease_specific_factors:
-                    if risk != "Very High":
-                        risk = "High"
-                
-                return risk
-            
-            # Check for disease-specific risk factors
-            disease_specific_risk = False
-            predicted_disease = disease_labels.get(pred)
-            
-            if predicted_disease == "Thalassemia" and hemoglobin < 9:
-                disease_specific_risk = True
-            elif predicted_disease == "Sickle Cell Anemia" and sickled_rbc > 40:
-                disease_specific_risk = True
-            elif predicted_disease == "Breast Cancer" and (brca1_expression < 0.3 or p53_mutation == 1):
-                disease_specific_risk = True
-            elif predicted_disease == "Cystic Fibrosis" and sweat_chloride > 60:
-                disease_specific_risk = True
-            
-            risk_level = calculate_risk_level(
-                probability,
-                len(warnings),
-                family_history,
-                disease_specific_risk
-            )
+            with metrics.predict_stage.time("validate"):
+                warnings = feature_schema.warning_messages(raw)
+                if not as_json:
+                    for warn in warnings:
+                        flash(warn, "warning")
+
+            # Normalize for model input, keyed by the training column names
+            with metrics.predict_stage.time("normalize"):
+                features_dict = dict(zip(feature_schema.COLUMNS, feature_schema.normalize(raw)))
+            # Identical panels (e.g. resubmitted after a validation warning) reuse the cached result
+            # One engine for the whole request, even if a new version is swapped in meanwhile
+            engine = model_manager.engine
+            cache_key = (engine.version, tuple(features_dict.values()))
+            cached = prediction_cache.get(cache_key)
+            if cached is None:
+                with metrics.predict_stage.time("model"):
+                    cached = run_prediction(
+                        engine, features_dict, len(warnings), values['gender'], values['family_history'],
+                        values['hemoglobin'], values['sickled_rbc_percent'], values['brca1_expression'],
+                        values['p53_mutation'], values['sweat_chloride']
+                    )
+                with metrics.predict_stage.time("explain"):
+                    # Top contributing features, cached with the prediction they explain
+                    cached += (engine.explain_one(features_dict, cached[0]),)
+                prediction_cache.set(cache_key, cached)
+            prediction, proba_all, risk_level, explanation = cached
+            probability = proba_all[prediction]
             
             result = True
             form_data = request.form
             
             # Convert NumPy types to Python native types before storing in session
-            session['prediction_result'] = {
-                'prediction': int(prediction),
-                'probability': float(probability),
-                'risk_level': risk_level,
-                'result': bool(result),
-                'form_data': dict(request.form)
-            }
+            if not as_json:
+                session['prediction_result'] = {
+                    'prediction': int(prediction),
+                    'probability': float(probability),
+                    'risk_level': risk_level,
+                    'result': bool(result),
+                    'form_data': dict(request.form)
+                }
             # Store prediction in Supabase for logged-in user
             user_data = session.get('user', {})
             prediction_data = {
@@ -341,14 +479,19 @@ def predict():
                 "probability": float(probability),
                 "risk_level": risk_level,
                 "form_data": dict(request.form),
-                "created_at": pd.Timestamp.now().isoformat()
+                "model_version": engine.version,
+                "created_at": datetime.now(timezone.utc).isoformat()
             }
-            try:
-                supabase.table('predictions').insert(prediction_data).execute()
-            except Exception as e:
-                flash(f"Could not save prediction: {str(e)}", "warning")
+            with metrics.predict_stage.time("enqueue"):
+                prediction_writer.enqueue(prediction_data)
+                recent_predictions_cache.invalidate(user_data.get('id'))
+            if as_json:
+                return jsonify(prediction_json(prediction, probability, risk_level, explanation, warnings,
+                                               engine.version))
             return redirect(url_for('predict'))
         except Exception as e:
+            if as_json:
+                return jsonify(error=f"Error in prediction: {str(e)}"), 400
             flash(f"Error in prediction: {str(e)}", "error")
     # Only pass form_data if POST, otherwise None (so form is blank on refresh)
     if request.method == "POST":
@@ -365,7 +508,7 @@ def predict():
                              risk_level=prediction_result['risk_level'], 
                              form_data=prediction_result['form_data'],
                              disease_labels=disease_labels,
-                             disease_info=disease_info)
+                             disease_info=catalog_loader.catalog.entries)
     return render_template("predict.html", 
                          result=None, 
                          prediction=None, 
@@ -373,7 +516,50 @@ def predict():
                          risk_level=None, 
                          form_data=None,
                          disease_labels=disease_labels,
-                         disease_info=disease_info)
+                         disease_info=catalog_loader.catalog.entries)
+
+# Batch scoring: CSV / JSON / NDJSON upload or body, streamed back as CSV or NDJSON
+@app.route("/predict/batch", methods=["POST"])
+@login_required
+def predict_batch():
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('csv', 'ndjson'):
+        return jsonify(error="format must be 'csv' or 'ndjson'"), 400
+    chunk_size = request.args.get('chunk_size', batch_predict.DEFAULT_CHUNK_SIZE, type=int)
+    explain_top = request.args.get('explain', 0, type=int)
+    if not 0 <= explain_top <= len(feature_schema.COLUMNS):
+        return jsonify(error=f"explain must be between 0 and {len(feature_schema.COLUMNS)}"), 400
+
+    upload = request.files.get('file')
+    try:
+        if upload:
+            input_format = batch_predict.detect_format(upload.filename)
+            chunks = batch_predict.read_chunks(upload.stream, input_format, chunk_size)
+        elif request.is_json:
+            chunks = batch_predict.records_to_chunks(request.get_json(), chunk_size)
+        elif request.mimetype in ('text/csv', 'application/x-ndjson'):
+            input_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+            chunks = batch_predict.read_chunks(request.stream, input_format, chunk_size)
+        else:
+            return jsonify(error="Send a 'file' upload, a JSON array of rows, or a text/csv body."), 400
+        # Pull the first chunk eagerly so malformed input is a 400, not a broken stream
+        results = batch_predict.score_chunks(model_manager.engine, chunks, explain_top=explain_top)
+        first = next(results, None)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        if first is None:
+            return
+        yield from batch_predict.write_stream(itertools.chain([first], results), output_format)
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def fetch_recent_predictions(user_id):
+    with metrics.supabase_call("predictions.select") if prediction_sync is None else nullcontext():
+        response = prediction_store.table('predictions').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(10).execute()
+    return response.data if response and hasattr(response, 'data') else []
 
 # Route to show recent predictions for logged-in user
 @app.route("/recent-predictions")
@@ -382,12 +568,60 @@ def recent_predictions():
     user_data = session.get('user', {})
     predictions = []
     try:
-        response = supabase.table('predictions').select('*').eq('user_id', user_data.get('id')).order('created_at', desc=True).limit(10).execute()
-        predictions = response.data if response and hasattr(response, 'data') else []
+        predictions = recent_predictions_cache.get_or_load(
+            user_data.get('id'), lambda: fetch_recent_predictions(user_data.get('id'))
+        )
     except Exception as e:
         flash(f"Could not fetch predictions: {str(e)}", "error")
     return render_template("recent_predictions.html", predictions=predictions, disease_labels=disease_labels)
 
+# Hit/miss counters for sizing the read caches
+@app.route("/stats/cache")
+@login_required
+def cache_stats():
+    return jsonify({name: c.stats() for name, c in caches.items()})
+
+# Batch fill and queue wait of the inference micro-batcher
+@app.route("/stats/inference")
+@login_required
+def inference_stats():
+    engine = model_manager.engine
+    if engine.batcher is None:
+        return jsonify(batching=False)
+    return jsonify(batching=True, **engine.batcher.stats())
+
+def load_analytics(start, end, disease):
+    return analytics.summarize(rollups.query(start, end, disease))
+
+# Prediction counts, mean probability and risk mix per disease over time, read from the rollups
+@app.route("/analytics/predictions")
+@login_required
+def prediction_analytics():
+    try:
+        start, end = (request.args.get(k) and date.fromisoformat(request.args[k]).isoformat() for k in ('start', 'end'))
+    except ValueError:
+        return jsonify(error="start and end must be YYYY-MM-DD dates"), 400
+    disease = request.args.get('disease')
+    try:
+        summary = analytics_cache.get_or_load((start, end, disease), lambda: load_analytics(start, end, disease))
+    except Exception as e:
+        return jsonify(error=f"Could not load analytics: {str(e)}"), 502
+    return jsonify(start=start, end=end, disease=disease, **summary)
+
+# Served and shadow model versions with their registry metadata, reload and shadow agreement counts
+@app.route("/stats/models")
+@login_required
+def model_stats():
+    return jsonify(model_manager.describe())
+
+# Prometheus scrape endpoint (per worker process); set METRICS_TOKEN to require a bearer token
+@app.route("/metrics")
+def prometheus_metrics():
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/contact", methods=["GET", "POST"])
 @login_required
 def contact():
@@ -415,7 +649,8 @@ def contact():
             }
             
             # Use the global supabase client from models
-            result = supabase.table('contact_messages').insert(insert_data).execute()
+            with metrics.supabase_call("contact_messages.insert"):
+                result = supabase.table('contact_messages').insert(insert_data).execute()
             
             if result.data:
                 success = True
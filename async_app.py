@@ -0,0 +1,596 @@
+"""ASGI serving mode: the routes of app.py on Quart, with non-blocking Supabase I/O.
+
+Login, signup, profile lookups, history reads and contact messages go through
+supabase's AsyncClient, so a worker keeps serving other users while a request
+waits on the network. Table calls made for a user send that user's access
+token, so Row Level Security applies to them as it does to the user. All
+Supabase clients in the worker share one httpx connection pool
+(SUPABASE_MAX_CONNECTIONS). Model inference and batch scoring
+run on a bounded thread pool (INFERENCE_THREADS) so they never block the event
+loop. The model, caches, risk rules and the write-behind prediction queue are
+the ones app.py uses.
+
+Needs `pip install -r requirements-async.txt`. Run with:
+    hypercorn async_app:app --bind 0.0.0.0:8000 --workers 2
+"""
+import asyncio
+import hashlib
+import io
+import itertools
+import os
+import time
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from quart import Quart, Response, flash, g, jsonify, redirect, render_template, request, session, url_for
+from supabase import AsyncClientOptions, acreate_client
+
+import app as wsgi
+from auth import AuthError, TokenExpired
+import batch_predict
+import feature_schema
+import metrics
+from cache import analytics_cache, caches, page_cache, prediction_cache, recent_predictions_cache, user_cache
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+
+app = Quart(__name__)
+app.secret_key = wsgi.app.secret_key
+
+model_manager = wsgi.model_manager
+User = wsgi.User
+token_verifier = wsgi.token_verifier
+token_refresher = wsgi.token_refresher
+disease_labels = wsgi.disease_labels
+catalog_loader = wsgi.catalog_loader
+prediction_writer = wsgi.prediction_writer
+
+inference_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("INFERENCE_THREADS", 4)), thread_name_prefix="inference"
+)
+
+# Created per worker once the event loop is running
+http_pool = None
+# Anon-key client; table calls made for a user go through user_db() so RLS applies to them
+db = None
+# Sign-in / sign-up only, so a login never changes the Authorization header db sends
+auth_client = None
+
+
+@app.before_serving
+async def open_supabase():
+    global http_pool, db, auth_client
+    http_pool = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=int(os.environ.get("SUPABASE_MAX_CONNECTIONS", 100)),
+                            max_keepalive_connections=int(os.environ.get("SUPABASE_MAX_KEEPALIVE", 20))),
+        timeout=httpx.Timeout(float(os.environ.get("SUPABASE_TIMEOUT", 10.0))),
+        follow_redirects=True,
+    )
+
+    def options():
+        return AsyncClientOptions(httpx_client=http_pool, persist_session=False, auto_refresh_token=False)
+
+    db = await acreate_client(SUPABASE_URL, SUPABASE_KEY, options=options())
+    auth_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY, options=options())
+
+
+@app.before_serving
+async def start_model_reloader():
+    # Hypercorn workers are forked after import; the reload and shadow threads start here
+    model_manager.start()
+
+
+@app.after_serving
+async def close_supabase():
+    await http_pool.aclose()
+    inference_pool.shutdown(wait=False)
+
+
+async def run_in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(inference_pool, fn, *args)
+
+
+class BodyStream(io.RawIOBase):
+    """Blocking, read-only file over the request body for pool threads.
+
+    Each read pulls the next chunk of the body from the event loop, so batch input
+    is parsed as it arrives instead of being buffered whole. Must not be read on the loop.
+    """
+
+    def __init__(self, body, loop):
+        self._chunks = aiter(body)
+        self._loop = loop
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    async def _next_chunk(self):
+        return await anext(self._chunks, None)
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = asyncio.run_coroutine_threadsafe(self._next_chunk(), self._loop).result()
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_latency.observe(time.perf_counter() - g.pop('request_start'), route, request.method,
+                                        str(response.status_code))
+    return response
+
+
+# Custom login required decorator
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if 'user' not in session or not await authenticate():
+            return redirect(url_for('login', next=request.url))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+def store_session_tokens(tokens):
+    session['access_token'] = tokens['access_token']
+    session['refresh_token'] = tokens['refresh_token']
+
+
+def end_session():
+    for key in ('user', 'access_token', 'refresh_token'):
+        session.pop(key, None)
+
+
+async def verify_token(token):
+    # A token seen before is checked in memory; a new one may need the JWKS or auth.get_user()
+    # over the network, so it is verified on the pool
+    return token_verifier.cached(token) or await run_in_pool(token_verifier.verify, token)
+
+
+async def authenticate():
+    """Async counterpart of app.authenticate; token checks and refreshes stay off the event loop."""
+    tokens = token_refresher.collect(session.get('refresh_token'))
+    if tokens:
+        store_session_tokens(tokens)
+    try:
+        try:
+            claims = await verify_token(session.get('access_token'))
+        except TokenExpired:
+            if not session.get('refresh_token'):
+                raise
+            tokens = await asyncio.wrap_future(token_refresher.schedule(session['refresh_token']))
+            store_session_tokens(tokens)
+            claims = await verify_token(tokens['access_token'])
+    except AuthError:
+        end_session()
+        return False
+    if tokens:
+        session['user'] = User.profile_from_claims(claims) or session['user']
+    if token_refresher.due(claims):
+        token_refresher.schedule(session['refresh_token'])
+    g.token_claims = claims
+    return True
+
+
+def user_db(access_token=None):
+    """PostgREST client acting as the signed-in user, so Row Level Security sees auth.uid().
+
+    Built per request around the shared connection pool; db only carries the anon key.
+    """
+    headers = dict(db.postgrest.headers)
+    headers["authorization"] = f"Bearer {access_token or session['access_token']}"
+    return AsyncPostgrestClient(str(db.postgrest.base_url), headers=headers, http_client=http_pool)
+
+
+async def get_user_by_id(user_id, access_token=None):
+    user = user_cache.get(user_id)
+    if user is None:
+        try:
+            with metrics.supabase_call("users.select"):
+                response = await user_db(access_token).table('users').select("*").eq('id', user_id).execute()
+        except Exception as e:
+            raise Exception(f"Error fetching user: {str(e)}")
+        user = response.data[0] if response.data else None
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+
+async def fetch_recent_predictions(user_id):
+    if wsgi.prediction_sync is not None:
+        # Local SQLite store: a fast indexed read, kept off the event loop
+        return await run_in_pool(wsgi.fetch_recent_predictions, user_id)
+    with metrics.supabase_call("predictions.select"):
+        response = await user_db().table('predictions').select('*').eq('user_id', user_id).order(
+            'created_at', desc=True).limit(10).execute()
+    return response.data if response and hasattr(response, 'data') else []
+
+
+@app.route("/login", methods=["GET", "POST"])
+async def login():
+    if 'user' in session:
+        return redirect(url_for('home'))
+
+    if request.method == "POST":
+        form = await request.form
+        try:
+            try:
+                with metrics.supabase_call("auth.sign_in"):
+                    auth_response = await auth_client.auth.sign_in_with_password({
+                        "email": form.get('email'),
+                        "password": form.get('password')
+                    })
+            except Exception as e:
+                raise Exception(f"Error logging in: {str(e)}")
+            if auth_response and auth_response.user:
+                session['access_token'] = auth_response.session.access_token
+                session['refresh_token'] = auth_response.session.refresh_token
+
+                user = auth_response.user
+                user_data = (User.profile_from_claims({"sub": user.id, "email": user.email,
+                                                       "user_metadata": user.user_metadata})
+                             or await get_user_by_id(user.id, auth_response.session.access_token))
+                if user_data:
+                    session['user'] = user_data
+                    next_page = request.args.get('next')
+                    return redirect(next_page or url_for('home'))
+                else:
+                    raise Exception("Failed to fetch user data")
+            else:
+                await flash('Invalid email or password', 'error')
+        except Exception as e:
+            await flash(str(e), 'error')
+
+    return await render_template('login.html')
+
+
+@app.route("/signup", methods=["GET", "POST"])
+async def signup():
+    if 'user' in session:
+        return redirect(url_for('home'))
+
+    if request.method == "POST":
+        form = await request.form
+        email = form.get('email')
+        password = form.get('password')
+
+        if password != form.get('confirm_password'):
+            await flash('Passwords do not match', 'error')
+            return await render_template('signup.html')
+
+        try:
+            with metrics.supabase_call("auth.sign_up"):
+                auth_response = await auth_client.auth.sign_up({
+                    "email": email,
+                    "password": password,
+                    "options": {"data": {"username": form.get('username'), "first_name": form.get('first_name'),
+                                         "last_name": form.get('last_name')}}
+                })
+            if auth_response.user:
+                user_data = {
+                    "id": auth_response.user.id,
+                    "username": form.get('username'),
+                    "email": email,
+                    "first_name": form.get('first_name'),
+                    "last_name": form.get('last_name')
+                }
+                # Without email confirmation sign-up returns a session, and the row is inserted as the new user
+                client = user_db(auth_response.session.access_token) if auth_response.session else db
+                with metrics.supabase_call("users.insert"):
+                    await client.table('users').insert(user_data).execute()
+            await flash('Registration successful! Please login.', 'success')
+            return redirect(url_for('login'))
+        except Exception as e:
+            await flash(f"Error creating user: {str(e)}", 'error')
+            return await render_template('signup.html')
+
+    return await render_template('signup.html')
+
+
+@app.route("/logout")
+@login_required
+async def logout():
+    # Revoke this session only: auth_client is shared by the worker, and its sign_out() would
+    # revoke (scope "global") the sessions of whoever signed in on it last
+    try:
+        with metrics.supabase_call("auth.sign_out"):
+            await auth_client.auth.admin.sign_out(session['access_token'], "local")
+    except Exception as e:
+        app.logger.warning("Revoking the session failed, ending it locally: %s", e)
+    end_session()
+    return redirect(url_for('home'))
+
+
+@app.route("/")
+async def home():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    return await render_template("home.html")
+
+
+async def render_cached_page(catalog, key, render):
+    """Async counterpart of app.render_cached_page; shares its page cache and ETags."""
+    if '_flashes' in session or app.jinja_env.auto_reload:
+        return await render()
+    key = (catalog.version,) + key
+    entry = page_cache.get(key)
+    if entry is None:
+        body = await render()
+        entry = (body, hashlib.sha256(body.encode()).hexdigest()[:32])
+        page_cache.set(key, entry)
+    body, etag = entry
+    if request.if_none_match:
+        unmodified = request.if_none_match.contains_weak(etag)
+    else:
+        unmodified = request.if_modified_since is not None and catalog.last_modified <= request.if_modified_since
+    response = Response("" if unmodified else body, status=304 if unmodified else 200, mimetype="text/html")
+    response.set_etag(etag)
+    response.last_modified = catalog.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/diseases")
+@login_required
+async def diseases():
+    catalog = catalog_loader.maybe_reload()
+    return await render_cached_page(catalog, ("diseases",), lambda: render_template(
+        "disease_explorer.html", diseases=catalog.entries))
+
+
+@app.route("/disease/<int:id>")
+@login_required
+async def disease_detail(id):
+    catalog = catalog_loader.maybe_reload()
+    disease = catalog.get(id)
+    if not disease:
+        await flash("Disease not found.", "error")
+        return redirect(url_for("diseases"))
+    return await render_cached_page(catalog, ("disease", id), lambda: render_template(
+        "disease_detail.html", disease=disease))
+
+
+@app.route("/predict", methods=["GET", "POST"])
+@login_required
+async def predict():
+    as_json = request.args.get('format') == 'json'
+    if request.method == "POST":
+        form = await request.form
+        try:
+            with metrics.predict_stage.time("parse"):
+                raw = feature_schema.parse_form(form)
+                values = dict(zip(feature_schema.FIELDS, raw))
+
+            with metrics.predict_stage.time("validate"):
+                warnings = feature_schema.warning_messages(raw)
+                if not as_json:
+                    for warn in warnings:
+                        await flash(warn, "warning")
+
+            with metrics.predict_stage.time("normalize"):
+                features_dict = dict(zip(feature_schema.COLUMNS, feature_schema.normalize(raw)))
+
+            engine = model_manager.engine
+            cache_key = (engine.version, tuple(features_dict.values()))
+            cached = prediction_cache.get(cache_key)
+            if cached is None:
+                with metrics.predict_stage.time("model"):
+                    cached = await run_in_pool(
+                        wsgi.run_prediction, engine, features_dict, len(warnings), values['gender'],
+                        values['family_history'], values['hemoglobin'], values['sickled_rbc_percent'],
+                        values['brca1_expression'], values['p53_mutation'], values['sweat_chloride']
+                    )
+                with metrics.predict_stage.time("explain"):
+                    # Top contributing features, cached with the prediction they explain
+                    cached += (await run_in_pool(engine.explain_one, features_dict, cached[0]),)
+                prediction_cache.set(cache_key, cached)
+            prediction, proba_all, risk_level, explanation = cached
+            probability = proba_all[prediction]
+
+            if not as_json:
+                session['prediction_result'] = {
+                    'prediction': int(prediction),
+                    'probability': float(probability),
+                    'risk_level': risk_level,
+                    'result': True,
+                    'form_data': dict(form)
+                }
+            user_data = session.get('user', {})
+            with metrics.predict_stage.time("enqueue"):
+                prediction_writer.enqueue({
+                    "user_id": user_data.get('id'),
+                    "disease": disease_labels.get(int(prediction)),
+                    "probability": float(probability),
+                    "risk_level": risk_level,
+                    "form_data": dict(form),
+                    "model_version": engine.version,
+                    "created_at": datetime.now(timezone.utc).isoformat()
+                })
+                recent_predictions_cache.invalidate(user_data.get('id'))
+            if as_json:
+                return jsonify(wsgi.prediction_json(prediction, probability, risk_level, explanation, warnings,
+                                                    engine.version))
+            return redirect(url_for('predict'))
+        except Exception as e:
+            if as_json:
+                return jsonify(error=f"Error in prediction: {str(e)}"), 400
+            await flash(f"Error in prediction: {str(e)}", "error")
+
+    prediction_result = session.pop('prediction_result', None)
+    if prediction_result:
+        return await render_template("predict.html",
+                                     result=prediction_result['result'],
+                                     prediction=prediction_result['prediction'],
+                                     probability=prediction_result['probability'],
+                                     risk_level=prediction_result['risk_level'],
+                                     form_data=prediction_result['form_data'],
+                                     disease_labels=disease_labels,
+                                     disease_info=catalog_loader.catalog.entries)
+    return await render_template("predict.html", result=None, prediction=None, probability=None,
+                                 risk_level=None, form_data=None, disease_labels=disease_labels,
+                                 disease_info=catalog_loader.catalog.entries)
+
+
+@app.route("/predict/batch", methods=["POST"])
+@login_required
+async def predict_batch():
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('csv', 'ndjson'):
+        return jsonify(error="format must be 'csv' or 'ndjson'"), 400
+    chunk_size = request.args.get('chunk_size', batch_predict.DEFAULT_CHUNK_SIZE, type=int)
+    explain_top = request.args.get('explain', 0, type=int)
+    if not 0 <= explain_top <= len(feature_schema.COLUMNS):
+        return jsonify(error=f"explain must be between 0 and {len(feature_schema.COLUMNS)}"), 400
+
+    upload = (await request.files).get('file')
+    try:
+        if upload:
+            input_format = batch_predict.detect_format(upload.filename)
+            chunks = batch_predict.read_chunks(upload.stream, input_format, chunk_size)
+        elif request.is_json:
+            chunks = batch_predict.records_to_chunks(await request.get_json(), chunk_size)
+        elif request.mimetype in ('text/csv', 'application/x-ndjson'):
+            input_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+            body = io.BufferedReader(BodyStream(request.body, asyncio.get_running_loop()), 64 * 1024)
+            chunks = batch_predict.read_chunks(body, input_format, chunk_size)
+        else:
+            return jsonify(error="Send a 'file' upload, a JSON array of rows, or a text/csv body."), 400
+        results = batch_predict.score_chunks(model_manager.engine, chunks, explain_top=explain_top)
+        first = await run_in_pool(next, results, None)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    async def generate():
+        if first is None:
+            return
+        # Parsing and scoring of every later chunk happens on the pool too
+        texts = batch_predict.write_stream(itertools.chain([first], results), output_format)
+        while (text := await run_in_pool(next, texts, None)) is not None:
+            yield text.encode()
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype)
+
+
+@app.route("/recent-predictions")
+@login_required
+async def recent_predictions():
+    user_id = session.get('user', {}).get('id')
+    predictions = []
+    try:
+        predictions = recent_predictions_cache.get(user_id)
+        if predictions is None:
+            predictions = await fetch_recent_predictions(user_id)
+            recent_predictions_cache.set(user_id, predictions)
+    except Exception as e:
+        await flash(f"Could not fetch predictions: {str(e)}", "error")
+    return await render_template("recent_predictions.html", predictions=predictions or [],
+                                 disease_labels=disease_labels)
+
+
+@app.route("/stats/cache")
+@login_required
+async def cache_stats():
+    return jsonify({name: c.stats() for name, c in caches.items()})
+
+
+@app.route("/stats/inference")
+@login_required
+async def inference_stats():
+    engine = model_manager.engine
+    if engine.batcher is None:
+        return jsonify(batching=False)
+    return jsonify(batching=True, **engine.batcher.stats())
+
+
+@app.route("/analytics/predictions")
+@login_required
+async def prediction_analytics():
+    try:
+        start, end = (request.args.get(k) and date.fromisoformat(request.args[k]).isoformat() for k in ('start', 'end'))
+    except ValueError:
+        return jsonify(error="start and end must be YYYY-MM-DD dates"), 400
+    disease = request.args.get('disease')
+    key = (start, end, disease)
+    try:
+        summary = analytics_cache.get(key)
+        if summary is None:
+            summary = await run_in_pool(wsgi.load_analytics, start, end, disease)
+            analytics_cache.set(key, summary)
+    except Exception as e:
+        return jsonify(error=f"Could not load analytics: {str(e)}"), 502
+    return jsonify(start=start, end=end, disease=disease, **summary)
+
+
+@app.route("/stats/models")
+@login_required
+async def model_stats():
+    return jsonify(model_manager.describe())
+
+
+@app.route("/metrics")
+async def prometheus_metrics():
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/contact", methods=["GET", "POST"])
+@login_required
+async def contact():
+    success = False
+    user_data = session.get('user', {})
+    name = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
+    email = user_data.get('email', '')
+
+    if request.method == "POST":
+        form = await request.form
+        try:
+            subject = form.get('subject')
+            message = form.get('message')
+
+            if not subject or not message:
+                await flash("Subject and message are required.", "error")
+                return await render_template("contact.html", success=False, name=name, email=email)
+
+            with metrics.supabase_call("contact_messages.insert"):
+                result = await user_db().table('contact_messages').insert({
+                    "user_id": user_data.get('id'),
+                    "subject": subject,
+                    "message": message,
+                    "email": email,
+                    "name": name
+                }).execute()
+
+            if result.data:
+                success = True
+                await flash("Your message has been sent successfully!", "success")
+            else:
+                await flash("Failed to send message.", "error")
+        except Exception:
+            await flash("Error sending message. Please try again.", "error")
+
+    return await render_template("contact.html", success=success, name=name, email=email)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
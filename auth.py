@@ -0,0 +1,207 @@
+"""Local verification of Supabase access tokens, with background token refresh.
+
+TokenVerifier checks an access token's signature, expiry, audience and issuer
+in-process. Asymmetric tokens (RS256/ES256) are checked against the project's
+signing keys, fetched from /auth/v1/.well-known/jwks.json and cached. HS256
+tokens, issued by projects on the legacy shared secret, need SUPABASE_JWT_SECRET.
+Without it, and while the signing keys cannot be fetched, tokens are checked
+remotely with auth.get_user(). Verified claims are memoized per token until the
+token expires, so only the first request with a new token does any work.
+
+TokenRefresher exchanges refresh tokens for new sessions on a small thread
+pool. Requests schedule a refresh when their token gets within the refresh
+margin of its expiry, and keep being served with the old token meanwhile; a
+later request picks up the new session. Refreshes are single-flight per
+refresh token, and finished ones are kept for a grace period, so concurrent
+requests carrying the same cookie reuse one result instead of spending the
+rotated refresh token again.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import jwt
+
+import metrics
+from cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class AuthError(Exception):
+    pass
+
+
+class TokenExpired(AuthError):
+    pass
+
+
+class TokenVerifier:
+    def __init__(self, supabase_url, jwt_secret=None, client=None, audience="authenticated", leeway=30,
+                 jwks_lifespan=600):
+        self.issuer = f"{supabase_url.rstrip('/')}/auth/v1"
+        self.jwt_secret = jwt_secret
+        # Remote fallback: a supabase client whose auth.get_user(token) checks the token server-side
+        self.client = client
+        self.audience = audience
+        self.leeway = leeway
+        self.jwks = jwt.PyJWKClient(f"{self.issuer}/.well-known/jwks.json", cache_jwk_set=True,
+                                    lifespan=jwks_lifespan, timeout=10)
+
+    def verify(self, token):
+        """Claims of a valid access token; raises TokenExpired or AuthError otherwise."""
+        if not token:
+            raise AuthError("No access token")
+        claims = token_cache.get(token)
+        if claims is None:
+            claims = self._verify(token)
+            token_cache.set(token, claims)
+        if claims["exp"] + self.leeway <= time.time():
+            raise TokenExpired("Access token has expired")
+        return claims
+
+    def cached(self, token):
+        """Claims of an already verified, unexpired token; None when verify() has work to do."""
+        claims = token_cache.get(token) if token else None
+        if claims is None or claims["exp"] + self.leeway <= time.time():
+            return None
+        return claims
+
+    def _verify(self, token):
+        try:
+            alg = jwt.get_unverified_header(token).get("alg")
+            if alg == "HS256" and self.jwt_secret:
+                key = self.jwt_secret
+            elif alg == "HS256":
+                return self._verify_remote(token)
+            elif alg in ASYMMETRIC_ALGORITHMS:
+                signing_key = self.jwks.get_signing_key_from_jwt(token)
+                key, alg = signing_key.key, signing_key.algorithm_name
+            else:
+                raise AuthError(f"Unsupported token algorithm {alg!r}")
+            claims = jwt.decode(token, key, algorithms=[alg], audience=self.audience, issuer=self.issuer,
+                                leeway=self.leeway, options={"require": ["exp", "sub"]})
+        except jwt.ExpiredSignatureError as e:
+            metrics.auth_token_checks.inc("expired")
+            raise TokenExpired(str(e)) from e
+        except jwt.PyJWKClientConnectionError as e:
+            logger.warning("Fetching the Supabase signing keys failed, checking the token remotely: %s", e)
+            return self._verify_remote(token)
+        except (jwt.PyJWTError, AuthError) as e:
+            metrics.auth_token_checks.inc("invalid")
+            raise AuthError(f"Invalid access token: {e}") from e
+        metrics.auth_token_checks.inc("local")
+        return claims
+
+    def _verify_remote(self, token):
+        if self.client is None:
+            raise AuthError("Cannot verify HS256 tokens without SUPABASE_JWT_SECRET")
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False})["exp"]
+        except (jwt.PyJWTError, KeyError) as e:
+            metrics.auth_token_checks.inc("invalid")
+            raise AuthError(f"Invalid access token: {e}") from e
+        if exp + self.leeway <= time.time():
+            metrics.auth_token_checks.inc("expired")
+            raise TokenExpired("Access token has expired")
+        try:
+            with metrics.supabase_call("auth.get_user"):
+                response = self.client.auth.get_user(token)
+        except Exception as e:
+            metrics.auth_token_checks.inc("invalid")
+            raise AuthError(f"Invalid access token: {e}") from e
+        if response is None or response.user is None:
+            metrics.auth_token_checks.inc("invalid")
+            raise AuthError("Invalid access token")
+        metrics.auth_token_checks.inc("remote")
+        user = response.user
+        return {"sub": user.id, "email": user.email, "user_metadata": user.user_metadata or {}, "exp": exp}
+
+
+class TokenRefresher:
+    def __init__(self, supabase_url, api_key, margin=300.0, grace=60.0, timeout=10.0, max_workers=2):
+        self.url = f"{supabase_url.rstrip('/')}/auth/v1/token"
+        self.api_key = api_key
+        self.margin = margin
+        self.grace = grace
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._pending = {}
+        # Reentrant: a future that is already done runs its callback in schedule()
+        self._lock = threading.RLock()
+        self._pool = None
+        self._http = None
+        self._pid = None
+
+    def due(self, claims):
+        return claims["exp"] - time.time() < self.margin
+
+    def schedule(self, refresh_token):
+        """Start refreshing in the background (once per refresh token); returns its future."""
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Thread pools and connections do not survive fork()
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="token-refresh")
+                self._http = httpx.Client(timeout=self.timeout)
+                self._pending = {}
+                self._pid = os.getpid()
+            for token, (future, finished) in list(self._pending.items()):
+                if finished is not None and now - finished > self.grace:
+                    del self._pending[token]
+            entry = self._pending.get(refresh_token)
+            if entry is None:
+                future = self._pool.submit(self._refresh, refresh_token)
+                self._pending[refresh_token] = (future, None)
+                future.add_done_callback(lambda f: self._finished(refresh_token, f))
+                return future
+            return entry[0]
+
+    def _finished(self, refresh_token, future):
+        with self._lock:
+            if self._pending.get(refresh_token, (None,))[0] is future:
+                self._pending[refresh_token] = (future, time.monotonic())
+
+    def refresh(self, refresh_token):
+        """New session for refresh_token, waiting for a refresh already in flight."""
+        if not refresh_token:
+            raise AuthError("No refresh token")
+        return self.schedule(refresh_token).result()
+
+    def collect(self, refresh_token):
+        """The new session if a background refresh of refresh_token has finished, else None."""
+        with self._lock:
+            entry = self._pending.get(refresh_token) if refresh_token else None
+        if entry is None or not entry[0].done():
+            return None
+        try:
+            return entry[0].result()
+        except AuthError:
+            return None
+
+    def _refresh(self, refresh_token):
+        try:
+            with metrics.supabase_call("auth.refresh"):
+                response = self._http.post(self.url, params={"grant_type": "refresh_token"},
+                                           json={"refresh_token": refresh_token},
+                                           headers={"apikey": self.api_key, "Authorization": f"Bearer {self.api_key}"})
+                response.raise_for_status()
+            data = response.json()
+            return {"access_token": data["access_token"], "refresh_token": data["refresh_token"],
+                    "expires_at": data.get("expires_at")}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.warning("Refreshing a Supabase session failed: %s", e)
+            raise AuthError(f"Could not refresh the session: {e}") from e
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False)
+                self._http.close()
+            self._pool = None
+            self._pid = None
@@ -0,0 +1,332 @@
+"""Batch scoring for lab exports.
+
+Scores CSV / JSON / NDJSON patient rows in chunks with the same normalization,
+male/Breast Cancer masking and risk-level rules as the single-patient /predict
+route, and streams the results back out as CSV, NDJSON or Parquet. With
+explain=k each row also gets its k top contributing features (feature_1,
+contribution_1, ...) for the predicted disease. Input is
+read out of core: CSV chunks are parsed straight into typed columns (float64
+measurements, nullable int8 flags) and each scored chunk is written before the
+next one is read, so memory stays flat however large the file is. A chunk with
+a non-numeric cell is re-read as text, and only its bad rows get an error.
+
+Usage:
+    python batch_predict.py patients.csv -o predictions.csv
+    python batch_predict.py patients.ndjson --format ndjson --chunk-size 10000
+    python batch_predict.py lab_export.csv --format parquet -o predictions.parquet
+    python batch_predict.py patients.csv --explain 3 -o explained.csv
+    cat patients.csv | python batch_predict.py - > predictions.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_schema
+from feature_schema import count_warnings, normalize
+from inference import DISEASE_LABELS, load_engine
+
+BREAST_CANCER = 2
+
+RISK_LEVELS = np.array(["Very Low", "Low", "Moderate", "High", "Very High"], dtype=object)
+RISK_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+
+ID_COLUMN = "patient_id"
+DEFAULT_CHUNK_SIZE = 5000
+
+_COL = feature_schema.INDEX
+
+
+def risk_levels(probability, n_warnings, family_history, disease_specific):
+    # Base risk from probability
+    risk = np.searchsorted(RISK_THRESHOLDS, probability, side='right')
+    # Adjust for number of out-of-range values
+    risk[(n_warnings >= 3) & (risk == 2)] = 3
+    # Adjust for family history
+    risk[(family_history == 1) & ((risk == 1) | (risk == 2))] += 1
+    # Adjust for disease-specific factors
+    risk[disease_specific & (risk != 4)] = 3
+    return RISK_LEVELS[risk]
+
+
+def score(engine, raw):
+    """Score an (n, 12) array of raw, unnormalized inputs.
+
+    Returns (prediction, probability, risk_level, n_warnings) arrays.
+    """
+    n_warnings = count_warnings(raw)
+    proba = engine.predict_proba(normalize(raw))
+    pred = proba.argmax(axis=1)
+
+    # Prevent breast cancer prediction for males
+    gender = raw[:, _COL['gender']]
+    masked = (gender == 1) & (pred == BREAST_CANCER)
+    if masked.any():
+        proba[masked, BREAST_CANCER] = 0
+        pred[masked] = proba[masked].argmax(axis=1)
+    probability = proba[np.arange(len(pred)), pred]
+
+    disease_specific = (
+        ((pred == 0) & (raw[:, _COL['hemoglobin']] < 9))
+        | ((pred == 3) & (raw[:, _COL['sickled_rbc_percent']] > 40))
+        | ((pred == 2) & ((raw[:, _COL['brca1_expression']] < 0.3) | (raw[:, _COL['p53_mutation']] == 1)))
+        | ((pred == 4) & (raw[:, _COL['sweat_chloride']] > 60))
+    )
+    risk = risk_levels(probability, n_warnings, raw[:, _COL['family_history']], disease_specific)
+    return engine.classes_.take(pred), probability, risk, n_warnings
+
+
+def explain(engine, raw, prediction, top):
+    """Top contributing feature columns and their contributions to each row's predicted class."""
+    classes = np.searchsorted(engine.classes_, prediction)
+    _, order, contributions = engine.explain(normalize(raw), classes, top)
+    return np.asarray(feature_schema.COLUMNS, dtype=object)[order], contributions
+
+
+def frame_to_raw(df):
+    """Pull the 12 input fields out of a chunk (case-insensitive headers).
+
+    Missing columns and empty cells take the form defaults. Returns the raw
+    float64 matrix and a mask of rows whose values all parsed as numbers, with
+    0/1 flags exactly 0 or 1.
+    """
+    columns = {str(c).strip().lower(): c for c in df.columns}
+    raw = np.empty((len(df), len(feature_schema.FIELDS)), dtype=np.float64)
+    valid = np.ones(len(df), dtype=bool)
+    for j, field in enumerate(feature_schema.FIELDS):
+        col = columns.get(field)
+        if col is None:
+            raw[:, j] = feature_schema.DEFAULTS[j]
+            continue
+        values = df[col]
+        missing = values.isna().to_numpy(copy=True)
+        # object or str columns (pandas 3 reads text as str): blank cells take the default too
+        if pd.api.types.is_string_dtype(values.dtype):
+            missing |= (values.astype(str).str.strip() == "").to_numpy()
+        parsed = pd.to_numeric(values.where(~missing), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        if feature_schema.BINARY[j]:
+            # Like int() on the form, only 0 and 1 pass; 1.5 would skip the male mask in score()
+            valid &= missing | (parsed == 0) | (parsed == 1)
+        else:
+            valid &= missing | ~np.isnan(parsed)
+        raw[:, j] = np.where(missing, feature_schema.DEFAULTS[j], parsed)
+    return raw, valid
+
+
+def score_frame(engine, df, start=0, id_column=ID_COLUMN, explain_top=0):
+    n = len(df)
+    raw, valid = frame_to_raw(df)
+
+    prediction = np.full(n, -1, dtype=np.int64)
+    probability = np.full(n, np.nan)
+    risk = np.full(n, "", dtype=object)
+    n_warnings = np.zeros(n, dtype=np.int64)
+    if valid.any():
+        prediction[valid], probability[valid], risk[valid], n_warnings[valid] = score(engine, raw[valid])
+
+    out = pd.DataFrame({'row': np.arange(start, start + n)})
+    if id_column in df.columns:
+        out[id_column] = df[id_column].to_numpy()
+    out['prediction'] = pd.Series(prediction, dtype="Int64").mask(~valid)
+    out['disease'] = [DISEASE_LABELS.get(p, "") for p in prediction]
+    out['probability'] = probability
+    out['risk_level'] = risk
+    out['warnings'] = n_warnings
+    out['error'] = np.where(valid, "", "Invalid numeric value")
+    explain_top = min(explain_top, len(feature_schema.COLUMNS))
+    if explain_top:
+        features = np.full((n, explain_top), "", dtype=object)
+        contributions = np.full((n, explain_top), np.nan)
+        if valid.any():
+            features[valid], contributions[valid] = explain(engine, raw[valid], prediction[valid], explain_top)
+        for k in range(explain_top):
+            out[f'feature_{k + 1}'] = features[:, k]
+            out[f'contribution_{k + 1}'] = contributions[:, k]
+    return out
+
+
+def detect_format(filename):
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".json"):
+        return "json"
+    return "csv"
+
+
+def read_chunks(f, input_format="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrame chunks of at most chunk_size rows from a file object."""
+    if input_format == "csv":
+        yield from read_csv_chunks(f, chunk_size)
+    elif input_format == "ndjson":
+        yield from pd.read_json(f, lines=True, chunksize=chunk_size)
+    elif input_format == "json":
+        yield from records_to_chunks(json.load(f), chunk_size)
+    else:
+        raise ValueError(f"Unsupported input format: {input_format}")
+
+
+def read_csv_chunks(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Headers are matched case-insensitively, so read them first to build the dtype map
+    line = f.readline()
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.lstrip("\ufeff")
+    if not line.strip():
+        return
+    header = next(csv.reader([line]))
+    dtypes = {col: feature_schema.DTYPES[col.strip().lower()] for col in header
+              if col.strip().lower() in feature_schema.DTYPES}
+    for text in csv_blocks(f, chunk_size):
+        try:
+            yield pd.read_csv(io.StringIO(text), header=None, names=header, dtype=dtypes)
+        except (TypeError, ValueError):
+            # A non-numeric cell (or 1.5 in a 0/1 flag) fails typed parsing for the whole chunk:
+            # re-read it as text so frame_to_raw flags just the bad rows
+            try:
+                yield pd.read_csv(io.StringIO(text), header=None, names=header, dtype=str)
+            except ValueError as e:
+                raise ValueError(f"Invalid CSV input: {e}")
+
+
+def csv_blocks(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the text of at most chunk_size CSV records at a time, never splitting a quoted field."""
+    lines = []
+    records = 0
+    quoted = False
+    for line in f:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        lines.append(line)
+        # An odd number of quotes opens or closes a field that spans lines
+        if line.count('"') % 2:
+            quoted = not quoted
+        if not quoted:
+            records += 1
+            if records >= chunk_size:
+                yield from _nonblank("".join(lines))
+                lines, records = [], 0
+    yield from _nonblank("".join(lines))
+
+
+def _nonblank(text):
+    # read_csv rejects a chunk of nothing but blank lines
+    if text.strip():
+        yield text
+
+
+def records_to_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Accept a bare list of rows or {"rows": [...]}
+    if isinstance(records, dict):
+        records = records.get("rows", [])
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array of rows")
+    for i in range(0, len(records), chunk_size):
+        yield pd.DataFrame.from_records(records[i:i + chunk_size])
+
+
+def score_chunks(engine, chunks, id_column=ID_COLUMN, explain_top=0):
+    start = 0
+    for df in chunks:
+        yield score_frame(engine, df, start=start, id_column=id_column, explain_top=explain_top)
+        start += len(df)
+
+
+def write_stream(results, output_format="csv"):
+    """Serialize scored chunks one at a time so output can be streamed."""
+    first = True
+    for out in results:
+        if output_format == "csv":
+            yield out.to_csv(index=False, header=first)
+        elif output_format == "ndjson":
+            text = out.to_json(orient='records', lines=True)
+            yield text if text.endswith("\n") else text + "\n"
+        else:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        first = False
+
+
+def write_parquet(results, path, id_column=ID_COLUMN):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs the 'pyarrow' package.")
+    writer = None
+    try:
+        for out in results:
+            # Keep the schema stable across chunks whatever the ids look like
+            if id_column in out.columns:
+                out[id_column] = out[id_column].astype(str)
+            table = pa.Table.from_pandas(out, preserve_index=False, schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def report_throughput(results, every=20, stream=sys.stderr):
+    """Pass scored chunks through, logging rows/s every `every` chunks and at the end."""
+    start = time.perf_counter()
+    rows = 0
+    for i, out in enumerate(results, 1):
+        rows += len(out)
+        if every and i % every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)", file=stream)
+        yield out
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)", file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of patients with the disease predictor.")
+    parser.add_argument("input", help="CSV, JSON or NDJSON file of patients ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--input-format", choices=["csv", "json", "ndjson"], help="Defaults to the input file extension")
+    parser.add_argument("--format", dest="output_format", choices=["csv", "ndjson", "parquet"], default="csv",
+                        help="Parquet needs pyarrow and an --output file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--model", help="Model bundle directory or .pkl; defaults to the app's model")
+    parser.add_argument("--id-column", default=ID_COLUMN)
+    parser.add_argument("--explain", type=int, default=0, metavar="K",
+                        help="Add the K top contributing features per row")
+    parser.add_argument("--progress-every", type=int, default=20, help="Log rows/s every N chunks (0: only at the end)")
+    parser.add_argument("--quiet", action="store_true", help="Do not report throughput on stderr")
+    args = parser.parse_args(argv)
+    if args.output_format == "parquet" and args.output == "-":
+        parser.error("--format parquet needs an --output file")
+
+    engine = load_engine(args.model)
+    input_format = args.input_format or detect_format(args.input)
+
+    src = sys.stdin if args.input == "-" else open(args.input, newline="")
+    try:
+        chunks = read_chunks(src, input_format, args.chunk_size)
+        results = score_chunks(engine, chunks, args.id_column, args.explain)
+        if not args.quiet:
+            results = report_throughput(results, args.progress_every)
+        if args.output_format == "parquet":
+            write_parquet(results, args.output, args.id_column)
+            return
+        dst = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+        try:
+            for text in write_stream(results, args.output_format):
+                dst.write(text)
+        finally:
+            if dst is not sys.stdout:
+                dst.close()
+    finally:
+        if src is not sys.stdin:
+            src.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Load test: one sync Flask worker vs one async (Quart/ASGI) worker against a mocked Supabase.
+
+Starts benchmarks/mock_supabase.py in-process with a fixed per-call latency,
+then runs each serving mode as a single worker process pointed at it:
+    sync:  app.py on a single-threaded WSGI server (like one gunicorn sync worker)
+    async: async_app.py on hypercorn (needs quart and hypercorn installed)
+Each virtual user logs in, then alternates POST /predict and GET
+/recent-predictions until the duration is up. Reports requests/s, latency
+percentiles and Supabase reads the mock rejected for lacking a user token per
+mode.
+
+Usage: python benchmarks/bench_async_serving.py [--users 50] [--duration 20] [--latency-ms 50] [--modes sync async]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_supabase import MOCK_JWT_SECRET, serve  # noqa: E402
+
+SYNC_SERVER = (
+    "import sys; from werkzeug.serving import run_simple; from app import app; "
+    "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=False)"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, env):
+    if mode == "sync":
+        cmd = [sys.executable, "-c", SYNC_SERVER, str(port)]
+    else:
+        cmd = [sys.executable, "-m", "hypercorn", "async_app:app", "--bind", f"127.0.0.1:{port}", "--workers", "1"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{mode} server exited: {proc.stderr.read().decode()[-2000:]}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def sample_forms(n):
+    df = pd.read_csv(os.path.join(ROOT, "genetic_disease_dataset.csv")).drop("Disease", axis=1)
+    df.columns = [c.lower() for c in df.columns]
+    df[["gender", "family_history", "p53_mutation"]] = df[["gender", "family_history", "p53_mutation"]].astype(int)
+    return [{k: str(v) for k, v in row.items()} for row in df.sample(n, replace=True, random_state=0).to_dict("records")]
+
+
+async def virtual_user(base_url, user, forms, deadline, latencies, errors):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/login", data={"email": f"user{user}@example.com", "password": "secret"})
+        i = user
+        while time.monotonic() < deadline:
+            for name, call in (("predict", lambda: client.post("/predict", data=forms[i % len(forms)])),
+                               ("recent", lambda: client.get("/recent-predictions"))):
+                start = time.perf_counter()
+                try:
+                    response = await call()
+                    ok = response.status_code < 500
+                except httpx.HTTPError:
+                    ok = False
+                latencies[name].append(time.perf_counter() - start)
+                if not ok:
+                    errors[name] += 1
+            i += 1
+
+
+async def drive(base_url, users, duration, forms):
+    latencies = {"predict": [], "recent": []}
+    errors = {"predict": 0, "recent": 0}
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(base_url, u, forms, deadline, latencies, errors) for u in range(users)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_mode(mode, args, supabase_url, mock, forms):
+    port = free_port()
+    rejected = mock.rejected
+    env = dict(os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY="mock-anon-key",
+               SUPABASE_JWT_SECRET=MOCK_JWT_SECRET,
+               PREDICTION_SPILL_PATH=os.path.join(tempfile.gettempdir(), f"bench_spill_{mode}.jsonl"))
+    proc = start_server(mode, port, env)
+    try:
+        latencies, errors, elapsed = asyncio.run(drive(f"http://127.0.0.1:{port}", args.users, args.duration, forms))
+    finally:
+        proc.terminate()
+        proc.wait()
+    all_ms = np.array(latencies["predict"] + latencies["recent"]) * 1e3
+    return {
+        "mode": mode,
+        "users": args.users,
+        "requests": int(len(all_ms)),
+        "errors": sum(errors.values()),
+        # Supabase reads the mock refused for lacking a user token (RLS would hide every row)
+        "rls_rejected": mock.rejected - rejected,
+        "rps": round(len(all_ms) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(all_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(all_ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(all_ms, 99)), 1),
+        "predict_p95_ms": round(float(np.percentile(np.array(latencies["predict"]) * 1e3, 95)), 1),
+        "recent_p95_ms": round(float(np.percentile(np.array(latencies["recent"]) * 1e3, 95)), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per mode")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated latency per Supabase call")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    server, mock = serve(0, args.latency_ms / 1e3)
+    forms = sample_forms(1000)
+    results = [run_mode(mode, args, f"http://127.0.0.1:{server.server_port}", mock, forms) for mode in args.modes]
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.users} users, {args.duration:g}s per mode, {args.latency_ms:g} ms per Supabase call")
+    print(f"{'mode':<7}{'requests':>9}{'errors':>8}{'rls rej':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'predict p95':>13}{'recent p95':>12}")
+    for r in results:
+        print(f"{r['mode']:<7}{r['requests']:>9}{r['errors']:>8}{r['rls_rejected']:>9}{r['rps']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['predict_p95_ms']:>13}{r['recent_p95_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Per-request latency of the /predict forward pass, before and after the engine.
+
+before: one-row DataFrame, then predict_proba and predict (two passes over the forest)
+after:  InferenceEngine.predict_one (preallocated row, one predict_proba, argmax)
+flat:   InferenceEngine.predict_one on the flat-array export of the same forest
+
+Usage: python benchmarks/bench_inference.py [--requests 300]
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from feature_schema import normalize  # noqa: E402
+from flat_forest import FlatForest  # noqa: E402
+from inference import FEATURE_COLUMNS, MODEL_PATH, InferenceEngine  # noqa: E402
+
+
+def sample_features(n):
+    df = pd.read_csv(os.path.join(ROOT, "genetic_disease_dataset.csv"), usecols=FEATURE_COLUMNS)
+    return normalize(df.sample(n, replace=True, random_state=0)).to_dict("records")
+
+
+def time_calls(fn, inputs):
+    timings = np.empty(len(inputs))
+    for i, features in enumerate(inputs):
+        start = time.perf_counter()
+        fn(features)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def report(name, timings):
+    print(f"{name:<8} median {np.median(timings):9.1f} us   p95 {np.percentile(timings, 95):9.1f} us   "
+          f"mean {timings.mean():9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--model", default=os.path.join(ROOT, MODEL_PATH))
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    model = joblib.load(args.model)
+    engine = InferenceEngine(copy.deepcopy(model))
+    flat_engine = InferenceEngine(FlatForest.from_model(model))
+    inputs = sample_features(args.requests)
+
+    def before(features):
+        X = pd.DataFrame([features])
+        proba_all = model.predict_proba(X)[0]
+        pred = model.predict(X)[0]
+        return pred, proba_all
+
+    # Warm up both paths
+    time_calls(before, inputs[:10])
+    time_calls(engine.predict_one, inputs[:10])
+    time_calls(flat_engine.predict_one, inputs[:10])
+
+    old = time_calls(before, inputs)
+    new = time_calls(engine.predict_one, inputs)
+    flat = time_calls(flat_engine.predict_one, inputs)
+    report("before", old)
+    report("after", new)
+    report("flat", flat)
+    print(f"speedup  {np.median(old) / np.median(new):.2f}x after, {np.median(old) / np.median(flat):.2f}x flat (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Worker startup time and per-worker memory: pickle vs memory-mapped bundle.
+
+Starts N worker processes per format, the way gunicorn would. Each worker
+imports the inference module, loads the model, scores a few rows and reports
+its startup time, RSS and PSS. PSS (proportional set size) splits shared pages
+across the processes that map them, so it shows the page-cache sharing that
+RSS hides. Linux only (reads /proc/self/status and /proc/self/smaps_rollup).
+
+Usage: python benchmarks/bench_model_load.py [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = r"""
+import json, sys, time, warnings
+t0 = time.perf_counter()
+warnings.filterwarnings("ignore", category=UserWarning)
+from inference import load_model
+t1 = time.perf_counter()
+model = load_model(sys.argv[1])
+t2 = time.perf_counter()
+import numpy as np
+model.predict_proba(np.random.default_rng(0).random((64, 12)))
+
+def proc_kb(path, key):
+    with open(path) as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1])
+    return None
+
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1e3,
+    "load_ms": (t2 - t1) * 1e3,
+    "rss_kb": proc_kb("/proc/self/status", "VmRSS"),
+    "pss_kb": proc_kb("/proc/self/smaps_rollup", "Pss"),
+}), flush=True)
+sys.stdin.read()  # stay alive until every worker has reported
+"""
+
+
+def run_workers(model_path, workers):
+    procs = [
+        subprocess.Popen([sys.executable, "-c", WORKER, model_path], cwd=ROOT,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        reports = [json.loads(p.stdout.readline()) for p in procs]
+        # Re-read PSS now that all workers are alive and sharing pages
+        for p, report in zip(procs, reports):
+            with open(f"/proc/{p.pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        report["pss_kb"] = int(line.split()[1])
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+    return reports
+
+
+def summarize(name, reports):
+    def mean(key):
+        return sum(r[key] for r in reports) / len(reports)
+    return {
+        "format": name,
+        "workers": len(reports),
+        "import_ms": round(mean("import_ms"), 1),
+        "load_ms": round(mean("load_ms"), 2),
+        "startup_ms": round(mean("import_ms") + mean("load_ms"), 1),
+        "rss_mb": round(mean("rss_kb") / 1024, 1),
+        "pss_mb": round(mean("pss_kb") / 1024, 1),
+        "total_pss_mb": round(sum(r["pss_kb"] for r in reports) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pickle", default="disease_predictor_model.pkl")
+    parser.add_argument("--bundle", default="disease_predictor_model")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = [
+        summarize("pickle", run_workers(args.pickle, args.workers)),
+        summarize("mmap", run_workers(args.bundle, args.workers)),
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'format':<8}{'workers':>8}{'import ms':>11}{'load ms':>10}{'startup ms':>12}"
+          f"{'RSS MB':>9}{'PSS MB':>9}{'total PSS MB':>14}")
+    for r in results:
+        print(f"{r['format']:<8}{r['workers']:>8}{r['import_ms']:>11}{r['load_ms']:>10}{r['startup_ms']:>12}"
+              f"{r['rss_mb']:>9}{r['pss_mb']:>9}{r['total_pss_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Local stand-in for the Supabase endpoints the app calls, with simulated latency.
+
+Implements just enough of GoTrue (/auth/v1) and PostgREST (/rest/v1) for the
+app: password sign-in and sign-up, sign-out, `select` with `eq` filters,
+`order` and `limit`, and inserts. Any email/password signs in; each email maps
+to a stable user id that has a row in `users`. Access tokens are HS256 JWTs
+signed with MOCK_JWT_SECRET (start the app with it as SUPABASE_JWT_SECRET), and
+refresh tokens can be exchanged for new sessions. Data lives in memory.
+
+Reads of users, predictions and contact_messages follow their Row Level
+Security policies: a request without a user's access token (anon key only) is
+rejected with 401 and counted in `rejected`, and a user only sees their own
+rows.
+
+Usage: python benchmarks/mock_supabase.py [--port 54321] [--latency-ms 50]
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import jwt
+
+MOCK_JWT_SECRET = "mock-jwt-secret-for-local-benchmarks-only"
+
+# Table -> column that RLS compares with auth.uid()
+RLS_OWNER_COLUMNS = {"users": "id", "predictions": "user_id", "contact_messages": "user_id"}
+
+
+def fake_jwt(user, issuer, expires_in=3600):
+    now = int(time.time())
+    claims = {"sub": user["id"], "email": user["email"], "role": "authenticated", "aud": "authenticated",
+              "iss": issuer, "iat": now, "exp": now + expires_in, "user_metadata": user["user_metadata"]}
+    return jwt.encode(claims, MOCK_JWT_SECRET, algorithm="HS256")
+
+
+class MockSupabase:
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.tables = {"users": [], "predictions": [], "contact_messages": []}
+        self.refresh_tokens = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        # (user id, scope) of each sign-out
+        self.sign_outs = []
+
+    def user_for(self, email):
+        user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, email))
+        with self.lock:
+            if not any(row["id"] == user_id for row in self.tables["users"]):
+                self.tables["users"].append({"id": user_id, "email": email, "username": email.split("@")[0],
+                                             "first_name": "Load", "last_name": "Test"})
+        return {"id": user_id, "aud": "authenticated", "role": "authenticated", "email": email,
+                "app_metadata": {"provider": "email"},
+                "user_metadata": {"username": email.split("@")[0], "first_name": "Load", "last_name": "Test"},
+                "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z"}
+
+    def session_for(self, email, issuer):
+        user = self.user_for(email)
+        refresh_token = uuid.uuid4().hex
+        with self.lock:
+            self.refresh_tokens[refresh_token] = email
+        return {"access_token": fake_jwt(user, issuer), "refresh_token": refresh_token,
+                "token_type": "bearer", "expires_in": 3600, "expires_at": int(time.time()) + 3600, "user": user}
+
+    def refresh(self, refresh_token, issuer):
+        with self.lock:
+            email = self.refresh_tokens.pop(refresh_token, None)
+        return None if email is None else self.session_for(email, issuer)
+
+    @staticmethod
+    def caller(authorization):
+        """User id (auth.uid()) of the access token in an Authorization header, None for the anon key."""
+        token = (authorization or "").partition(" ")[2].split(",")[0].strip()
+        try:
+            return jwt.decode(token, MOCK_JWT_SECRET, algorithms=["HS256"], audience="authenticated")["sub"]
+        except jwt.PyJWTError:
+            return None
+
+    def select(self, table, query):
+        with self.lock:
+            rows = list(self.tables.setdefault(table, []))
+        order, limit = None, None
+        for key, value in query:
+            if key == "order":
+                column, _, direction = value.partition(".")
+                order = (column, direction.startswith("desc"))
+            elif key == "limit":
+                limit = int(value)
+            elif key not in ("select", "offset") and value.startswith("eq."):
+                rows = [row for row in rows if str(row.get(key)) == value[3:]]
+        if order:
+            rows.sort(key=lambda row: str(row.get(order[0])), reverse=order[1])
+        return rows[:limit] if limit is not None else rows
+
+    def insert(self, table, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        with self.lock:
+            self.tables.setdefault(table, []).extend(rows)
+        return rows
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length)) if length else None
+
+        def _reply(self, status, payload=None):
+            body = b"" if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self, method):
+            mock.requests += 1
+            time.sleep(mock.latency)
+            url = urlsplit(self.path)
+            query = parse_qsl(url.query)
+            body = self._body() if method in ("POST", "PATCH") else None
+            issuer = f"http://{self.headers['Host']}/auth/v1"
+            if url.path == "/auth/v1/token" and dict(query).get("grant_type") == "refresh_token":
+                session = mock.refresh(body["refresh_token"], issuer)
+                if session is None:
+                    return self._reply(400, {"error": "invalid_grant", "error_description": "Invalid Refresh Token"})
+                return self._reply(200, session)
+            if url.path == "/auth/v1/token":
+                return self._reply(200, mock.session_for(body["email"], issuer))
+            if url.path == "/auth/v1/signup":
+                return self._reply(200, mock.session_for(body["email"], issuer))
+            if url.path == "/auth/v1/logout":
+                with mock.lock:
+                    mock.sign_outs.append((mock.caller(self.headers.get("Authorization")),
+                                           dict(query).get("scope", "global")))
+                return self._reply(204)
+            if url.path.startswith("/rest/v1/"):
+                table = url.path[len("/rest/v1/"):]
+                if method == "GET":
+                    rows = mock.select(table, query)
+                    owner = RLS_OWNER_COLUMNS.get(table)
+                    if owner:
+                        uid = mock.caller(self.headers.get("Authorization"))
+                        if uid is None:
+                            with mock.lock:
+                                mock.rejected += 1
+                            return self._reply(401, {"message": f"anon reads of {table} are not allowed"})
+                        rows = [row for row in rows if str(row.get(owner)) == uid]
+                    return self._reply(200, rows)
+                if method == "POST":
+                    return self._reply(201, mock.insert(table, body))
+            self._reply(404, {"message": f"{method} {url.path} is not mocked"})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+def serve(port=0, latency=0.05):
+    """Start the mock in a background thread; returns (server, mock). server.server_port has the port."""
+    mock = MockSupabase(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+    server, _ = serve(args.port, args.latency_ms / 1e3)
+    print(f"Mock Supabase on http://127.0.0.1:{server.server_port} ({args.latency_ms:g} ms per call)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
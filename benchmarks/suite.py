@@ -0,0 +1,390 @@
+"""Reproducible benchmark suite for the request path, with JSON output for tracking across commits.
+
+micro:  feature normalization and form validation, model load (pickle and
+        memory-mapped bundle), predict_proba on 1, 100 and 10k rows for both
+        model formats, and batch scoring of a 10k-row frame.
+e2e:    /predict and /recent-predictions through the Flask test client, with
+        app.py's Supabase client replaced by an in-memory stand-in
+        (--supabase-latency-ms simulates network time per call).
+
+Every benchmark reports throughput, p50/p95/p99/mean latency and process RSS.
+Inputs are seeded. --compare flags benchmarks whose p50 got slower than the
+baseline file by more than --tolerance, and exits 1 if any did.
+
+Usage:
+    python benchmarks/suite.py -o bench.json
+    python benchmarks/suite.py --only micro --compare bench.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import batch_predict  # noqa: E402
+import feature_schema  # noqa: E402
+import metrics  # noqa: E402
+from inference import FLAT_MODEL_PATH, MODEL_PATH, InferenceEngine, load_model  # noqa: E402
+
+ROW_COUNTS = (1, 100, 10_000)
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(name, group, timings, rows_per_call=1):
+    timings = np.asarray(timings)
+    total = timings.sum()
+    return {
+        "name": name,
+        "group": group,
+        "calls": int(len(timings)),
+        "rows_per_call": rows_per_call,
+        "calls_per_s": round(len(timings) / total, 1) if total else None,
+        "rows_per_s": round(len(timings) * rows_per_call / total, 1) if total else None,
+        "p50_ms": round(float(np.percentile(timings, 50)) * 1e3, 4),
+        "p95_ms": round(float(np.percentile(timings, 95)) * 1e3, 4),
+        "p99_ms": round(float(np.percentile(timings, 99)) * 1e3, 4),
+        "mean_ms": round(float(timings.mean()) * 1e3, 4),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def measure(fn, repeats, warmup=3):
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def repeats_for(rows, base):
+    # Keep large-batch benchmarks short without starving small ones of samples
+    return max(20, base // max(1, rows // 100))
+
+
+def load_dataset():
+    return pd.read_csv(os.path.join(ROOT, "genetic_disease_dataset.csv"))
+
+
+def sample_raw(df, n, seed=0):
+    rng = np.random.default_rng(seed)
+    return df[feature_schema.COLUMNS].to_numpy(dtype=np.float64)[rng.integers(0, len(df), n)]
+
+
+def run_micro(args):
+    df = load_dataset()
+    results = []
+
+    for rows in ROW_COUNTS:
+        raw = sample_raw(df, rows)
+        results.append(summarize(f"normalize[{rows}]", "micro",
+                                 measure(lambda: feature_schema.normalize(raw), repeats_for(rows, args.repeats)), rows))
+
+    form = {field: str(value) for field, value in zip(feature_schema.FIELDS, sample_raw(df, 1)[0])}
+    for field in ("gender", "family_history", "p53_mutation"):
+        form[field] = str(int(float(form[field])))
+
+    def parse_and_validate():
+        raw = feature_schema.parse_form(form)
+        feature_schema.warning_messages(raw)
+        return feature_schema.normalize(raw)
+    results.append(summarize("form_parse_validate_normalize", "micro", measure(parse_and_validate, args.repeats)))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for label, path in (("pickle", MODEL_PATH), ("bundle", FLAT_MODEL_PATH)):
+            path = os.path.join(ROOT, path)
+            results.append(summarize(f"model_load[{label}]", "micro",
+                                     measure(lambda: load_model(path), args.load_repeats, warmup=1)))
+        engines = {label: InferenceEngine(load_model(os.path.join(ROOT, path)))
+                   for label, path in (("sklearn", MODEL_PATH), ("flat", FLAT_MODEL_PATH))}
+
+        for label, engine in engines.items():
+            for rows in ROW_COUNTS:
+                X = feature_schema.normalize(sample_raw(df, rows, seed=rows))
+                results.append(summarize(f"predict_proba[{label},{rows}]", "micro",
+                                         measure(lambda: engine.predict_proba(X), repeats_for(rows, args.repeats)),
+                                         rows))
+
+        for rows in ROW_COUNTS:
+            X = feature_schema.normalize(sample_raw(df, rows, seed=rows))
+            classes = engines["flat"].predict_proba(X).argmax(axis=1)
+            results.append(summarize(f"explain[flat,{rows}]", "micro",
+                                     measure(lambda: engines["flat"].explain(X, classes), repeats_for(rows, args.repeats)),
+                                     rows))
+
+        frame = df.drop("Disease", axis=1).sample(10_000, replace=True, random_state=0)
+        frame.columns = [c.lower() for c in frame.columns]
+        results.append(summarize("score_frame[flat,10000]", "micro",
+                                 measure(lambda: batch_predict.score_frame(engines["flat"], frame), 20), 10_000))
+    return results
+
+
+class StandInSupabase:
+    """In-memory replacement for the supabase client calls app.py makes."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = defaultdict(list)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def table(self, name):
+        return _StandInQuery(self, name)
+
+    def rpc(self, name, params):
+        # SQL function calls (the analytics rollups) are recorded like inserts into "rpc.<name>"
+        query = _StandInQuery(self, f"rpc.{name}")
+        query.rows_to_insert = [params]
+        return query
+
+
+class _StandInQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.rows_to_insert = None
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def insert(self, rows):
+        self.rows_to_insert = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        self.db.calls += 1
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            if self.rows_to_insert is not None:
+                self.db.tables[self.table].extend(self.rows_to_insert)
+                return SimpleNamespace(data=self.rows_to_insert)
+            rows = [r for r in self.db.tables[self.table] if all(r.get(c) == v for c, v in self.filters)]
+        if self.order_by:
+            rows.sort(key=lambda r: str(r.get(self.order_by[0])), reverse=self.order_by[1])
+        return SimpleNamespace(data=rows[:self.row_limit] if self.row_limit is not None else rows)
+
+
+def load_app(stand_in):
+    # models.py refuses to import without credentials; the stand-in replaces the client anyway
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark-anon-key")
+    # Live rollup updates need a service-role client; the stand-in replaces it too
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark-service-key")
+    # Session tokens are minted with this secret, so they verify locally like real HS256 tokens
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-jwt-secret-not-for-production")
+    os.environ.setdefault("PREDICTION_SPILL_PATH", os.devnull + ".spill" if os.name == "nt" else "/tmp/bench_spill.jsonl")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import app as app_module
+    app_module.supabase = stand_in
+    app_module.prediction_store = stand_in
+    app_module.prediction_writer.client = stand_in
+    app_module.rollups.client = stand_in
+    if not os.path.isdir(os.path.join(ROOT, app_module.app.template_folder)):
+        raise SystemExit("e2e benchmarks render the app's templates; extract templates/ first")
+    return app_module
+
+
+def session_for(user_id, profile, expires_in=3600):
+    import jwt
+    claims = {"sub": user_id, "email": profile["email"], "aud": "authenticated", "role": "authenticated",
+              "iss": os.environ["SUPABASE_URL"].rstrip("/") + "/auth/v1", "exp": int(time.time()) + expires_in,
+              "user_metadata": {k: profile[k] for k in ("username", "first_name", "last_name")}}
+    return {"user": {"id": user_id, **profile},
+            "access_token": jwt.encode(claims, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256"),
+            "refresh_token": f"refresh-{user_id}"}
+
+
+def run_e2e(args):
+    stand_in = StandInSupabase(args.supabase_latency_ms / 1e3)
+    app_module = load_app(stand_in)
+    app_module.app.config["TESTING"] = True
+    df = load_dataset().drop("Disease", axis=1)
+    df.columns = [c.lower() for c in df.columns]
+    forms = [{k: str(int(v)) if k in ("gender", "family_history", "p53_mutation") else str(v) for k, v in row.items()}
+             for row in df.to_dict("records")]
+
+    timings = {"predict": [], "recent_predictions": [], "disease_detail": []}
+    errors = defaultdict(int)
+    timings_lock = threading.Lock()
+
+    disease_ids = list(app_module.catalog_loader.catalog.by_id)
+
+    # Some routes report a failed Supabase call with an error flash and a 200
+    from flask import message_flashed
+    flashed = threading.local()
+
+    def record_flash(sender, message, category, **extra):
+        if category == "error":
+            flashed.errors += 1
+
+    message_flashed.connect(record_flash, app_module.app)
+
+    def virtual_user(user, n_requests):
+        client = app_module.app.test_client()
+        with client.session_transaction() as session:
+            session.update(session_for(f"bench-user-{user}", {"email": f"user{user}@example.com",
+                                                              "username": f"user{user}",
+                                                              "first_name": "Bench", "last_name": str(user)}))
+        for i in range(n_requests):
+            form = forms[(user * n_requests + i) % len(forms)]
+            disease_id = disease_ids[i % len(disease_ids)]
+            for name, call in (("predict", lambda: client.post("/predict", data=form)),
+                               ("recent_predictions", lambda: client.get("/recent-predictions")),
+                               ("disease_detail", lambda: client.get(f"/disease/{disease_id}"))):
+                flashed.errors = 0
+                start = time.perf_counter()
+                response = call()
+                elapsed = time.perf_counter() - start
+                with timings_lock:
+                    timings[name].append(elapsed)
+                    if response.status_code >= 400 or flashed.errors:
+                        errors[name] += 1
+
+    # Warm up templates, caches and the writer thread outside the measurement
+    virtual_user(-1, 5)
+    for t in timings.values():
+        t.clear()
+    errors.clear()
+    app_module.prediction_cache.clear()
+
+    per_user = max(1, args.requests // args.concurrency)
+    supabase_errors = metrics.supabase_errors.total()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(u, per_user)) for u in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    app_module.prediction_writer.close()
+
+    results = []
+    for name, values in timings.items():
+        result = summarize(f"e2e/{name}[c={args.concurrency}]", "e2e", values)
+        result["errors"] = errors[name]
+        results.append(result)
+    total = sum(len(v) for v in timings.values())
+    results.append({"name": f"e2e/mixed[c={args.concurrency}]", "group": "e2e", "calls": total,
+                    "calls_per_s": round(total / wall, 1), "rss_mb": round(rss_mb(), 1),
+                    "supabase_calls": stand_in.calls,
+                    "supabase_errors": metrics.supabase_errors.total() - supabase_errors,
+                    "rows_written": len(stand_in.tables["predictions"])})
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import sklearn
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\n{'benchmark':<42}{'base p50 ms':>13}{'p50 ms':>11}{'change':>9}")
+    for r in results:
+        old = baseline.get(r["name"])
+        if not old or not old.get("p50_ms") or "p50_ms" not in r:
+            continue
+        change = r["p50_ms"] / old["p50_ms"] - 1
+        flag = "  REGRESSION" if change > tolerance else ""
+        if flag:
+            regressions.append(r["name"])
+        print(f"{r['name']:<42}{old['p50_ms']:>13.4f}{r['p50_ms']:>11.4f}{change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", choices=["micro", "e2e"], help="Run one group")
+    parser.add_argument("-o", "--output", help="Write results as JSON (default: print JSON to stdout)")
+    parser.add_argument("--repeats", type=int, default=500, help="Samples per microbenchmark")
+    parser.add_argument("--load-repeats", type=int, default=10, help="Samples per model-load benchmark")
+    parser.add_argument("--requests", type=int, default=500, help="e2e /predict requests in total")
+    parser.add_argument("--concurrency", type=int, default=1, help="e2e virtual users (threads)")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0)
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown vs the baseline")
+    args = parser.parse_args()
+
+    results = []
+    if args.only in (None, "micro"):
+        results += run_micro(args)
+    if args.only in (None, "e2e"):
+        results += run_e2e(args)
+
+    report = {"environment": environment(), "config": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        for r in results:
+            p50 = f"{r['p50_ms']:.4f} ms p50" if "p50_ms" in r else ""
+            print(f"{r['name']:<42}{r['calls_per_s'] or 0:>12,.1f} calls/s  {p50}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
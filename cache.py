@@ -0,0 +1,166 @@
+"""Read-through TTL + LRU caches for Supabase reads and prediction results.
+
+Each cache keeps a bounded per-process LRU of entries that expire after a TTL.
+When CACHE_REDIS_URL is set (and the redis package is installed), entries are
+also shared between processes through Redis. Writers call invalidate() so that
+their own process sees fresh data immediately; other processes see it within
+the local TTL. Hit/miss counters are kept per cache for sizing.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RedisBackend:
+    def __init__(self, url, prefix="genetic-disease:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class TTLCache:
+    def __init__(self, name, maxsize=1024, ttl=30.0, backend=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _backend_key(self, key):
+        return f"{self.name}:{key}"
+
+    def _backend_call(self, method, *args):
+        # The shared backend is best effort; the local cache keeps working without it
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            logger.warning("Cache backend %s failed for %s: %s", method, self.name, e)
+            return None
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+        if self.backend is not None:
+            value = self._backend_call("get", self._backend_key(key))
+            if value is not None and value is not _MISSING:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.backend is not None:
+            self._backend_call("set", self._backend_key(key), value, self.ttl)
+
+    def _store(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value, or call loader() and cache its result (None is not cached)."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            self._backend_call("delete", self._backend_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _shared_backend():
+    url = os.environ.get("CACHE_REDIS_URL")
+    if not url:
+        return None
+    try:
+        return RedisBackend(url)
+    except ImportError:
+        raise ValueError("CACHE_REDIS_URL is set but the 'redis' package is not installed.")
+
+
+_backend = _shared_backend()
+_maxsize = int(os.environ.get("CACHE_MAXSIZE", 1024))
+
+user_cache = TTLCache("users", maxsize=_maxsize, ttl=float(os.environ.get("USER_CACHE_TTL", 300)), backend=_backend)
+recent_predictions_cache = TTLCache(
+    "recent_predictions", maxsize=_maxsize, ttl=float(os.environ.get("RECENT_PREDICTIONS_CACHE_TTL", 30)),
+    backend=_backend
+)
+
+# Dashboard summaries read from the prediction rollups; a short TTL bounds staleness
+analytics_cache = TTLCache(
+    "analytics", maxsize=256, ttl=float(os.environ.get("ANALYTICS_CACHE_TTL", 60)), backend=_backend
+)
+
+# Memoized /predict results keyed on (model version, normalized feature vector).
+# Local only: entries hold NumPy arrays, and a new model version never hits old keys.
+prediction_cache = TTLCache("predictions", maxsize=int(os.environ.get("PREDICTION_CACHE_SIZE", 4096)), ttl=None)
+
+# Rendered disease explorer/detail pages keyed on (catalog version, page); local only,
+# and a catalog edit changes the version, so entries never need invalidating.
+page_cache = TTLCache("pages", maxsize=int(os.environ.get("PAGE_CACHE_SIZE", 512)), ttl=None)
+
+# Verified access token claims, checked against their own expiry on every hit.
+# Local only: keys are bearer tokens and never leave the process.
+token_cache = TTLCache("access_tokens", maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 4096)), ttl=None)
+
+caches = {c.name: c for c in (user_cache, recent_predictions_cache, analytics_cache, prediction_cache, page_cache,
+                              token_cache)}
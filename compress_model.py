@@ -0,0 +1,133 @@
+"""Latency-aware compression of the serving forest.
+
+Tries fewer trees, shallower trees and float32 quantization of the flat-array
+forest. Every candidate is scored on a validation split, and the smallest one
+whose accuracy stays within --tolerance of the full forest is written as the
+serving bundle. The size / latency / accuracy trade-off of every candidate is
+printed. With about a hundred candidates, the best validation score is
+optimistic, so the selected forest's accuracy is reported on the test split,
+which took no part in the selection.
+
+The validation rows must not have been used to fit the model, or every
+candidate is scored on memorised data. train_model.py records its splits on
+the pickle (holdout_), and main() reuses them; it refuses a pickle fit without
+a validation split, such as one trained without --validation-size.
+
+Usage:
+    python train_model.py --validation-size 0.2 --model-out model.pkl
+    python compress_model.py model.pkl --tolerance 0.01
+"""
+import argparse
+import itertools
+import json
+
+import numpy as np
+
+import feature_schema
+from flat_forest import FlatForest, single_row_latency_ms
+
+TREE_COUNTS = [5, 10, 25, 50, 75, 100, 150, 200]
+DEPTHS = [4, 6, 8, 10, 12, None]
+
+# Held-out rows used to time single-row prediction for each candidate
+LATENCY_SAMPLES = 100
+
+
+def evaluate(flat, X, y):
+    accuracy = float(np.mean(flat.predict(X) == y))
+    p50, p95 = single_row_latency_ms(flat, X[:LATENCY_SAMPLES])
+    return {"accuracy": accuracy, "size_bytes": int(flat.nbytes), "n_nodes": int(len(flat.feature)),
+            "predict_p50_ms": float(p50), "predict_p95_ms": float(p95)}
+
+
+def holdout_splits(X, y, test_size=0.2, validation_size=0.2, seed=42):
+    """(X_train, X_val, X_test, y_train, y_val, y_test); the validation split comes out of the training rows.
+
+    With validation_size 0 the training split is kept whole and X_val, y_val are None.
+    """
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+    X_val = y_val = None
+    if validation_size:
+        X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=validation_size,
+                                                          random_state=seed)
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+
+def compress(flat, X, y, tolerance=0.01):
+    """Return (smallest forest within tolerance on the validation rows X, y, per-candidate results)."""
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    baseline = evaluate(flat, X, y)
+    results = [dict(baseline, n_trees=flat.n_trees, max_depth=None, quantize=False, baseline=True)]
+    best, best_result = flat, results[0]
+
+    tree_counts = [n for n in TREE_COUNTS if n < flat.n_trees] + [flat.n_trees]
+    for n_trees, max_depth, quantize in itertools.product(tree_counts, DEPTHS, (False, True)):
+        if n_trees == flat.n_trees and max_depth is None and not quantize:
+            continue
+        candidate = flat.compress(n_trees=n_trees, max_depth=max_depth, quantize=quantize)
+        result = dict(evaluate(candidate, X, y), n_trees=n_trees, max_depth=max_depth, quantize=quantize)
+        result["within_tolerance"] = result["accuracy"] >= baseline["accuracy"] - tolerance
+        results.append(result)
+        smaller = (result["size_bytes"], result["predict_p95_ms"]) < (best_result["size_bytes"], best_result["predict_p95_ms"])
+        if result["within_tolerance"] and smaller:
+            best, best_result = candidate, result
+    best_result["selected"] = True
+    return best, results
+
+
+def print_results(results):
+    print(f"{'trees':>6} {'depth':>6} {'f32':>4} {'val acc':>9} {'size KB':>9} {'nodes':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7}")
+    for r in sorted(results, key=lambda r: r["size_bytes"]):
+        marker = " <" if r.get("selected") else (" (full)" if r.get("baseline") else "")
+        ok = "" if r.get("within_tolerance", True) else " x"
+        print(f"{r['n_trees']:>6} {str(r['max_depth']):>6} {'y' if r['quantize'] else 'n':>4} "
+              f"{r['accuracy'] * 100:>8.2f}% {r['size_bytes'] / 1024:>9.1f} {r['n_nodes']:>7} "
+              f"{r['predict_p50_ms']:>7.3f} {r['predict_p95_ms']:>7.3f}{ok}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shrink the serving forest within an accuracy tolerance.")
+    parser.add_argument("model", help="Pickled RandomForestClassifier")
+    parser.add_argument("--data", default="genetic_disease_dataset.csv")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Max accuracy drop on the validation split")
+    parser.add_argument("-o", "--output", default="disease_predictor_model", help="Bundle directory to write")
+    parser.add_argument("--report", help="Write per-candidate results as JSON")
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    model = joblib.load(args.model)
+    df = pd.read_csv(args.data)
+    holdout = getattr(model, "holdout_", None)
+    if not holdout or not holdout.get("validation_size"):
+        raise SystemExit(f"'{args.model}' was fit without a validation split, so candidates would be compared "
+                         f"on its training rows. Retrain it with 'python train_model.py --validation-size 0.2', "
+                         f"or compress while training with --compress-tolerance.")
+    if holdout["rows"] != len(df):
+        raise SystemExit(f"'{args.model}' was trained on {holdout['rows']} rows, '{args.data}' has {len(df)}")
+    X = feature_schema.normalize(df[feature_schema.COLUMNS])
+    y = df["Disease"]
+    _, X_val, X_test, _, y_val, y_test = holdout_splits(X, y, holdout["test_size"], holdout["validation_size"],
+                                                        holdout["seed"])
+
+    flat = FlatForest.from_model(model)
+    best, results = compress(flat, X_val, y_val, args.tolerance)
+    print_results(results)
+    best.save(args.output)
+    selected = next(r for r in results if r.get("selected"))
+    test_accuracy = float(np.mean(best.predict(X_test.to_numpy()) == y_test.to_numpy()))
+    print(f"\nWrote {selected['n_trees']} trees, depth {selected['max_depth']}, "
+          f"{'float32' if selected['quantize'] else 'float64'} ({selected['size_bytes'] / 1024:.1f} KB, "
+          f"{test_accuracy * 100:.2f}% test accuracy) to '{args.output}'")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Disease catalog for the explorer and detail pages, loaded from a JSON data file.
+
+The catalog file (DISEASE_CATALOG_PATH, default disease_catalog.json) holds a
+list of entries with a unique integer "id". Entries are indexed by id, so the
+detail page is a dict lookup however large the catalog grows.
+
+Each load gets a version, the SHA-256 of the file contents, and the file's
+modification time. The app keys its rendered-page cache and ETags on the
+version, so editing the file invalidates both. maybe_reload() re-reads the
+file when its (inode, mtime, size) changes, at most once per check interval;
+a file that fails to load keeps the previous catalog.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ("id", "name", "description")
+
+
+def default_catalog_path():
+    return os.environ.get("DISEASE_CATALOG_PATH") or os.path.join(os.path.dirname(__file__), "disease_catalog.json")
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class DiseaseCatalog:
+    def __init__(self, entries, version=None, last_modified=None, path=None):
+        self.entries = list(entries)
+        self.by_id = {}
+        for entry in self.entries:
+            missing = [field for field in REQUIRED_FIELDS if field not in entry]
+            if missing:
+                raise ValueError(f"Disease catalog entry {entry.get('name', entry)!r} is missing {', '.join(missing)}")
+            if entry["id"] in self.by_id:
+                raise ValueError(f"Duplicate disease id {entry['id']} in the catalog")
+            self.by_id[entry["id"]] = entry
+        self.version = version or hashlib.sha256(json.dumps(self.entries, sort_keys=True).encode()).hexdigest()
+        self.last_modified = last_modified or datetime.now(timezone.utc)
+        self.path = path
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or default_catalog_path()
+        with open(path, "rb") as f:
+            raw = f.read()
+        mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).replace(microsecond=0)
+        return cls(json.loads(raw), version=hashlib.sha256(raw).hexdigest(), last_modified=mtime, path=path)
+
+    def get(self, disease_id):
+        return self.by_id.get(disease_id)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+class CatalogLoader:
+    """Holds the current catalog and swaps in a new one when the data file changes."""
+
+    def __init__(self, path=None, check_interval=5.0):
+        self.path = path or default_catalog_path()
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stat = _stat_key(self.path)
+        self.catalog = DiseaseCatalog.load(self.path)
+        self._checked = time.monotonic()
+        self.stats = {"reloads": 0, "failures": 0}
+
+    def maybe_reload(self):
+        """The current catalog, re-read first if the file changed since the last check."""
+        now = time.monotonic()
+        if self.check_interval is None or now - self._checked < self.check_interval:
+            return self.catalog
+        # One request per interval pays for the stat; the others keep serving the current catalog
+        if not self._lock.acquire(blocking=False):
+            return self.catalog
+        try:
+            self._checked = now
+            stat = _stat_key(self.path)
+            if stat != self._stat:
+                # Recorded first, so a broken file is reported once rather than at every check
+                self._stat = stat
+                self.catalog = DiseaseCatalog.load(self.path)
+                self.stats["reloads"] += 1
+                logger.info("Reloaded disease catalog %s (%d entries)", self.path, len(self.catalog))
+        except (OSError, ValueError) as e:
+            self.stats["failures"] += 1
+            logger.warning("Keeping the current disease catalog, reloading %s failed: %s", self.path, e)
+        finally:
+            self._lock.release()
+        return self.catalog
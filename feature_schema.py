@@ -0,0 +1,96 @@
+"""Declarative schema of the model's 12 input features.
+
+Each feature is declared once, in training column order. A declaration holds
+the CSV column, the form field name, whether the feature is a 0/1 flag, its
+default, the typical range (values outside it are flagged, not rejected) and
+the min/max normalization (x - offset) / scale. At import the declarations
+are compiled into column-aligned NumPy arrays, so validation and normalization
+are single vectorized expressions for one form row or a whole batch. The same
+normalization is applied by train_model.py before fitting, which keeps the
+model consistent with the features it is served.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+Feature = namedtuple("Feature", "column field binary default low high offset scale warning")
+
+FEATURES = [
+    Feature("Age", "age", False, 0, 0, 120, 0, 100,
+            "Unusual age: please check entry (years: 0–120)."),
+    Feature("Gender", "gender", True, 1, 0, 1, 0, 1,
+            "Gender must be 0 (Female) or 1 (Male)."),
+    Feature("Family_History", "family_history", True, 0, 0, 1, 0, 1,
+            "Family history must be 0 or 1."),
+    Feature("Hemoglobin", "hemoglobin", False, 0, 3.0, 20.0, 6, 9.5 - 6,
+            "Hemoglobin outside typical range (3–20 g/dL)."),
+    Feature("Fetal_Hemoglobin", "fetal_hemoglobin", False, 0, 0, 100, 7, 18 - 7,
+            "Fetal Hemoglobin % outside typical range (0–100%)."),
+    Feature("RDW_CV", "rdw_cv", False, 0, 8, 30, 13, 21 - 13,
+            "RDW-CV outside typical range (8–30%)."),
+    Feature("Serum_Ferritin", "serum_ferritin", False, 0, 1, 2000, 20, 60 - 20,
+            "Serum Ferritin outside typical range (1–2000 ng/mL)."),
+    Feature("BRCA1_Expression", "brca1_expression", False, 0, 0, 1, 0, 0.4,
+            "BRCA1 expression outside 0–1 (check units)."),
+    Feature("p53_Mutation", "p53_mutation", True, 0, 0, 1, 0, 1,
+            "p53 mutation must be 0 or 1."),
+    Feature("Sweat_Chloride", "sweat_chloride", False, 0, 0, 200, 30, 60 - 30,
+            "Sweat chloride outside typical range (0–200 mmol/L)."),
+    Feature("Sickled_RBC_Percent", "sickled_rbc_percent", False, 0, 0, 100, 0, 2,
+            "Sickled RBC % outside 0–100%."),
+    Feature("IL6_Level", "il6_level", False, 0, 0, 1000, 1, 9 - 1,
+            "IL-6 outside typical range (0–1000 pg/mL)."),
+]
+
+# Compiled, column-aligned views of the declarations
+COLUMNS = [f.column for f in FEATURES]
+FIELDS = [f.field for f in FEATURES]
+BINARY = np.array([f.binary for f in FEATURES])
+DEFAULTS = np.array([f.default for f in FEATURES], dtype=np.float64)
+LOW = np.array([f.low for f in FEATURES], dtype=np.float64)
+HIGH = np.array([f.high for f in FEATURES], dtype=np.float64)
+OFFSET = np.array([f.offset for f in FEATURES], dtype=np.float64)
+SCALE = np.array([f.scale for f in FEATURES], dtype=np.float64)
+WARNINGS = np.array([f.warning for f in FEATURES], dtype=object)
+
+# Parse dtypes for CSV input: nullable int8 flags, float64 measurements. float32 would
+# halve the chunk size but shifts normalized values across tree thresholds, so a few
+# rows per thousand would no longer match what /predict returns for the same patient.
+DTYPES = {f.field: ("Int8" if f.binary else "float64") for f in FEATURES}
+
+INDEX = {f.field: j for j, f in enumerate(FEATURES)}
+
+
+def parse_form(form):
+    """Raw (12,) float64 vector from a form-like mapping keyed by field name.
+
+    0/1 flags are parsed with int() and measurements with float(), so a bad
+    entry raises ValueError like the original per-field parsing did.
+    """
+    raw = DEFAULTS.copy()
+    for j, f in enumerate(FEATURES):
+        value = form.get(f.field)
+        if value is not None:
+            raw[j] = int(value) if f.binary else float(value)
+    return raw
+
+
+def out_of_range(raw):
+    """Boolean mask, same shape as raw, of values outside their typical range."""
+    in_range = (raw >= LOW) & (raw <= HIGH)
+    in_range &= ~BINARY | (raw == 0) | (raw == 1)
+    return ~in_range
+
+
+def count_warnings(raw):
+    return out_of_range(raw).sum(axis=-1)
+
+
+def warning_messages(raw):
+    """Messages for the out-of-range values of a single raw row."""
+    return list(WARNINGS[out_of_range(raw)])
+
+
+def normalize(raw):
+    """Model input for raw values; works on a row, a 2-D array or a DataFrame in COLUMNS order."""
+    return (raw - OFFSET) / SCALE
@@ -0,0 +1,297 @@
+"""Flat-array export of a fitted RandomForestClassifier.
+
+All trees are packed into shared node arrays (feature, threshold, left, right,
+value) and evaluated with plain NumPy, level by level for every tree at once.
+Probabilities match RandomForestClassifier.predict_proba exactly: inputs are
+compared as float32 like sklearn does, and per-tree leaf values are taken and
+averaged the same way, in the same order.
+
+contributions() explains a prediction by walking the same paths and
+crediting each split's feature with the change in node class fractions
+across it (Saabas path attributions). Internal nodes keep their class
+fractions in the value array, so no extra precomputation is needed.
+
+The on-disk format is a directory of uncompressed .npy files plus meta.json.
+load() memory-maps the arrays read-only, so every worker process on a host
+shares the same physical pages through the OS page cache instead of holding
+a private unpickled copy.
+
+Usage (export an existing pickle and verify it on the whole dataset):
+    python flat_forest.py disease_predictor_model.pkl -o disease_predictor_model
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes_", "feature_names")
+FORMAT_VERSION = 1
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, left, right, value, roots, classes_, feature_names=None, max_depth=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes_
+        self.feature_names_in_ = feature_names
+        self.n_trees = len(roots)
+        self.max_depth = _max_depth(left, right, roots) if max_depth is None else max_depth
+
+    @classmethod
+    def from_model(cls, model):
+        trees = [est.tree_ for est in model.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("Only single-output forests can be flattened")
+        counts = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        for tree, offset in zip(trees, roots):
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            # Leaves point at themselves so every tree can be walked max_depth steps
+            left.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            right.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+            # scikit-learn >= 1.4 stores class fractions and predict_proba returns them
+            # as is; older versions store counts and normalize them per leaf
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            if not np.allclose(normalizer[normalizer != 0.0], 1.0):
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            value.append(proba)
+
+        names = getattr(model, "feature_names_in_", None)
+        return cls(
+            feature=np.concatenate(feature).astype(np.int64),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.int64),
+            right=np.concatenate(right).astype(np.int64),
+            value=np.concatenate(value),
+            roots=roots,
+            classes_=np.asarray(model.classes_),
+            feature_names=None if names is None else np.asarray(names, dtype=str),
+        )
+
+    def apply(self, X):
+        """Leaf node index per (row, tree)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        # Walk every (row, tree) pair as one flat vector; a 1-D gather per level is
+        # much cheaper than 2-D fancy indexing once batches get large
+        values = X.ravel()
+        offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        for _ in range(self.max_depth):
+            go_left = values[offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        leaf_values = self.value[self.apply(X)]
+        # Accumulate tree by tree, in estimator order, as sklearn does
+        proba = np.zeros((leaf_values.shape[0], leaf_values.shape[2]), dtype=leaf_values.dtype)
+        for t in range(self.n_trees):
+            proba += leaf_values[:, t]
+        proba /= self.n_trees
+        return proba.astype(np.float64, copy=False)
+
+    def contributions(self, X, classes=None):
+        """Per-feature contributions to each row's probability of one class.
+
+        classes holds a column index into classes_ per row (default: the
+        predicted class). Returns (bias, contributions) with shapes (n_rows,)
+        and (n_rows, n_features); bias + contributions.sum(axis=1) equals the
+        probability up to float rounding.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        if classes is None:
+            classes = self.predict_proba(X).argmax(axis=1)
+        n_classes = self.value.shape[1]
+        # value[node, class] as a 1-D gather, for the explained class of each (row, tree) pair
+        value = self.value.reshape(-1)
+        class_offset = np.repeat(np.asarray(classes, dtype=np.int64), self.n_trees)
+
+        values = X.ravel()
+        offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        current = value[nodes * n_classes + class_offset].astype(np.float64)
+        bias = current.reshape(n_rows, self.n_trees).mean(axis=1)
+        contrib = np.zeros(n_rows * n_features)
+        for _ in range(self.max_depth):
+            split = offsets + self.feature[nodes]
+            go_left = values[split] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            # Leaves point at themselves, so finished paths add zero
+            reached = value[nodes * n_classes + class_offset].astype(np.float64)
+            contrib += np.bincount(split, weights=reached - current, minlength=len(contrib))
+            current = reached
+        return bias, contrib.reshape(n_rows, n_features) / self.n_trees
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ("feature", "threshold", "left", "right", "value", "roots"))
+
+    def node_depths(self):
+        depth = np.zeros(len(self.feature), dtype=np.int64)
+        frontier = np.asarray(self.roots)
+        level = 0
+        while len(frontier):
+            depth[frontier] = level
+            frontier = frontier[self.left[frontier] != frontier]
+            frontier = np.concatenate([self.left[frontier], self.right[frontier]])
+            level += 1
+        return depth
+
+    def compress(self, n_trees=None, max_depth=None, quantize=False):
+        """Return a smaller forest: the first n_trees trees, cut to max_depth.
+
+        Internal nodes at max_depth become leaves predicting their own class
+        fractions, and nodes below them are dropped. quantize stores thresholds
+        and node values as float32 and feature ids as int16; child indices stay
+        native-width since narrower ones slow down the fancy indexing.
+        """
+        n_trees = min(n_trees or self.n_trees, self.n_trees)
+        end = self.roots[n_trees] if n_trees < self.n_trees else len(self.feature)
+        node_ids = np.arange(end)
+        left = np.array(self.left[:end])
+        right = np.array(self.right[:end])
+        keep = np.ones(end, dtype=bool)
+        if max_depth is not None:
+            depth = self.node_depths()[:end]
+            cut = depth >= max_depth
+            left[cut] = node_ids[cut]
+            right[cut] = node_ids[cut]
+            keep = depth <= max_depth
+
+        # Renumber the surviving nodes
+        new_id = np.cumsum(keep) - 1
+        float_dtype = np.float32 if quantize else np.float64
+        return FlatForest(
+            feature=np.asarray(self.feature[:end][keep], dtype=np.int16 if quantize else np.int64),
+            threshold=np.asarray(self.threshold[:end][keep], dtype=float_dtype),
+            left=new_id[left[keep]],
+            right=new_id[right[keep]],
+            value=np.asarray(self.value[:end][keep], dtype=float_dtype),
+            roots=new_id[self.roots[:n_trees]],
+            classes_=np.asarray(self.classes_),
+            feature_names=self.feature_names_in_,
+        )
+
+    def save(self, path):
+        """Write the bundle directory: one .npy per array and meta.json.
+
+        The bundle is written next to path and swapped in, so workers that
+        have the previous bundle memory-mapped keep reading intact files.
+        """
+        path = os.path.normpath(path)
+        staging = path + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in ARRAYS:
+            array = self.feature_names_in_ if name == "feature_names" else getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        meta = {"format_version": FORMAT_VERSION, "n_trees": self.n_trees, "max_depth": int(self.max_depth),
+                "n_nodes": int(len(self.feature))}
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(path):
+            retired = path + ".old"
+            shutil.rmtree(retired, ignore_errors=True)
+            os.replace(path, retired)
+            os.replace(staging, path)
+            shutil.rmtree(retired)
+        else:
+            os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported flat model format {meta.get('format_version')!r} in '{path}'")
+        arrays = {}
+        for name in ARRAYS:
+            file = os.path.join(path, f"{name}.npy")
+            if os.path.exists(file):
+                array = np.load(file, mmap_mode=mmap_mode, allow_pickle=False)
+                # Plain ndarray views of the mapping: same shared pages, without the
+                # np.memmap subclass overhead on every gather in apply()
+                arrays[name] = np.asarray(array)
+        return cls(max_depth=meta["max_depth"], **arrays)
+
+
+def _max_depth(left, right, roots):
+    # Number of steps needed to bring every tree from its root to a leaf
+    frontier = roots
+    depth = 0
+    while True:
+        frontier = frontier[left[frontier] != frontier]
+        if len(frontier) == 0:
+            return depth
+        frontier = np.concatenate([left[frontier], right[frontier]])
+        depth += 1
+
+
+def single_row_latency_ms(flat, X):
+    """p50 and p95 latency of scoring the rows of X one at a time."""
+    timings = np.empty(len(X))
+    for i in range(len(X)):
+        row = X[i:i + 1]
+        start = time.perf_counter()
+        flat.predict_proba(row)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1e3, np.percentile(timings, 95) * 1e3
+
+
+def verify(model, flat, X):
+    """Raise if the flat forest disagrees with model.predict_proba on X."""
+    expected = model.predict_proba(X)
+    actual = flat.predict_proba(np.asarray(X, dtype=np.float64))
+    if not np.array_equal(expected, actual):
+        diff = np.abs(expected - actual).max()
+        raise AssertionError(f"Flat forest probabilities differ from predict_proba (max abs diff {diff:g})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pickled RandomForestClassifier to flat NumPy arrays.")
+    parser.add_argument("model", help="Pickled RandomForestClassifier")
+    parser.add_argument("-o", "--output", default="disease_predictor_model", help="Bundle directory to write")
+    parser.add_argument("--data", default="genetic_disease_dataset.csv", help="Dataset to verify equivalence on")
+    args = parser.parse_args()
+
+    # Export-only dependencies; serving workers import this module with NumPy alone
+    import joblib
+    import pandas as pd
+
+    import feature_schema
+
+    model = joblib.load(args.model)
+    flat = FlatForest.from_model(model)
+    X = feature_schema.normalize(pd.read_csv(args.data)[feature_schema.COLUMNS])
+    verify(model, flat, X)
+    flat.save(args.output)
+    print(f"Exported {flat.n_trees} trees ({len(flat.feature)} nodes, depth {flat.max_depth}) to '{args.output}'; "
+          f"probabilities identical on {len(X)} rows")
+
+
+if __name__ == "__main__":
+    main()
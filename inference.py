@@ -0,0 +1,159 @@
+"""Lean inference engine for the disease predictor.
+
+One predict_proba call per request on a preallocated float64 row in
+training column order; the label is the argmax of those probabilities.
+Explanations are path attributions from the flat forest (see
+FlatForest.contributions), flattened once from a pickled model if needed.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import feature_schema
+import metrics
+from flat_forest import FlatForest
+from micro_batcher import MicroBatcher
+
+MODEL_PATH = "disease_predictor_model.pkl"
+# Flat-array bundle written by train_model.py; memory-mapped and preferred over the pickle
+FLAT_MODEL_PATH = "disease_predictor_model"
+
+# Training column order (genetic_disease_dataset.csv without the label)
+FEATURE_COLUMNS = feature_schema.COLUMNS
+
+DISEASE_LABELS = {
+    0: "Thalassemia",
+    1: "Hemophilia",
+    2: "Breast Cancer",
+    3: "Sickle Cell Anemia",
+    4: "Cystic Fibrosis"
+}
+
+
+class InferenceEngine:
+    def __init__(self, model, version=None, metadata=None):
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            if list(names) != FEATURE_COLUMNS:
+                raise ValueError(f"Model was trained on columns {list(names)}, expected {FEATURE_COLUMNS}")
+            # Columns are checked once here; without this sklearn warns on every
+            # plain-array call, which is what the hot path passes.
+            del model.feature_names_in_
+        self.model = model
+        # Checksum of the artifact the model was loaded from; keys cached results
+        self.version = version
+        # Registry metadata (accuracy, parameters, publish time) when loaded from model_registry.py
+        self.metadata = metadata or {"version": version}
+        self.classes_ = model.classes_
+        self.n_features = len(FEATURE_COLUMNS)
+        self._local = threading.local()
+        # Set by start_batching(); concurrent predict_one calls then share forest evaluations
+        self.batcher = None
+        self._explainer = model if isinstance(model, FlatForest) else None
+        self._explainer_lock = threading.Lock()
+
+    def start_batching(self, max_batch_size=32, max_wait=0.002):
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size, max_wait)
+        return self.batcher
+
+    def _predict_batch(self, X):
+        with metrics.model_inference.time("microbatch"):
+            proba = self.model.predict_proba(X)
+        metrics.model_rows.inc("microbatch", amount=len(proba))
+        return proba
+
+    def _row(self):
+        # One preallocated (1, n_features) buffer per thread
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.empty((1, self.n_features), dtype=np.float64)
+        return row
+
+    def predict_proba(self, X):
+        with metrics.model_inference.time("batch"):
+            proba = self.model.predict_proba(X)
+        metrics.model_rows.inc("batch", amount=len(proba))
+        return proba
+
+    def predict_one(self, features):
+        """Score one patient given a dict of normalized features keyed by column name.
+
+        Returns (label, probabilities) from a single forward pass.
+        """
+        row = self._row()
+        for j, name in enumerate(FEATURE_COLUMNS):
+            row[0, j] = features[name]
+        if self.batcher is not None:
+            proba = self.batcher.predict(row[0])
+            return self.classes_[proba.argmax()], proba
+        with metrics.model_inference.time("single"):
+            proba = self.model.predict_proba(row)[0]
+        metrics.model_rows.inc("single")
+        return self.classes_[proba.argmax()], proba
+
+    @property
+    def explainer(self):
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    self._explainer = FlatForest.from_model(self.model)
+        return self._explainer
+
+    def explain(self, X, classes, top=5):
+        """Top features by absolute contribution to each row's probability of classes[i].
+
+        classes holds column indices into classes_. Returns (bias, feature
+        indices, contributions), the last two of shape (n_rows, top).
+        """
+        with metrics.model_inference.time("explain"):
+            bias, contributions = self.explainer.contributions(X, classes)
+        metrics.model_rows.inc("explain", amount=len(bias))
+        order = np.argsort(-np.abs(contributions), axis=1, kind="stable")[:, :top]
+        return bias, order, np.take_along_axis(contributions, order, axis=1)
+
+    def explain_one(self, features, label, top=5):
+        """Top contributing features, keyed by column name, behind one prediction of label."""
+        row = self._row()
+        for j, name in enumerate(FEATURE_COLUMNS):
+            row[0, j] = features[name]
+        class_index = int(np.flatnonzero(self.classes_ == label)[0])
+        bias, order, contributions = self.explain(row, [class_index], top)
+        return {
+            "base": float(bias[0]),
+            "features": [{"feature": FEATURE_COLUMNS[j], "contribution": float(c)}
+                         for j, c in zip(order[0], contributions[0])],
+        }
+
+
+def default_model_path():
+    return FLAT_MODEL_PATH if os.path.exists(FLAT_MODEL_PATH) else MODEL_PATH
+
+
+def model_fingerprint(path, exclude=()):
+    """Short SHA-256 over the model file, or over every file of a bundle directory."""
+    digest = hashlib.sha256()
+    files = [path] if not os.path.isdir(path) else [
+        os.path.join(path, name) for name in sorted(os.listdir(path)) if name not in exclude
+    ]
+    for file in files:
+        digest.update(os.path.basename(file).encode())
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def load_model(path=None):
+    path = path or default_model_path()
+    if os.path.isdir(path):
+        return FlatForest.load(path, mmap_mode="r")
+    # sklearn is only imported by workers that still serve the pickle
+    import joblib
+    return joblib.load(path)
+
+
+def load_engine(path=None):
+    path = path or default_model_path()
+    return InferenceEngine(load_model(path), version=model_fingerprint(path))
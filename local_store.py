@@ -0,0 +1,306 @@
+"""Local SQLite prediction store with background sync-up to Supabase.
+
+SQLiteStore offers the subset of the supabase client interface the app uses
+for predictions, so it can stand in for the client wherever predictions are
+read or written:
+
+    store.table('predictions').select('*').eq('user_id', uid).order('created_at', desc=True).limit(10).execute()
+    store.table('predictions').insert(rows).execute()
+
+The database runs in WAL mode, so history reads do not block the writer. It
+carries the indexes of supabase_predictions_table.sql plus a composite
+(user_id, created_at DESC) index that serves the history query without a
+sort. Statements are fixed parameterized SQL, so each connection's statement
+cache reuses them as prepared statements. Inserts of many rows are one
+executemany() in one transaction.
+
+SupabaseSync pushes rows that have not been synced yet to Supabase from a
+background thread. It upserts on id, so a retry after a lost response does not
+duplicate rows, and it marks rows synced once the upsert succeeds. The app
+keeps working from the local store while Supabase is unreachable. A row that
+Supabase rejects for its values (see prediction_writer.is_permanent) is
+isolated from its batch, kept locally with sync_rejected_at and sync_error
+set, and no longer retried, so the rows after it keep syncing.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import metrics
+from prediction_writer import write_isolating
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "user_id", "disease", "probability", "risk_level", "form_data", "model_version", "created_at",
+           "updated_at")
+JSON_COLUMNS = {"form_data"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    disease TEXT NOT NULL,
+    probability REAL NOT NULL CHECK (probability >= 0 AND probability <= 1),
+    risk_level TEXT NOT NULL CHECK (risk_level IN ('Very Low', 'Low', 'Moderate', 'High', 'Very High')),
+    form_data TEXT NOT NULL,
+    model_version TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    synced_at TEXT,
+    sync_rejected_at TEXT,
+    sync_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_user_id_created_at ON predictions(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_predictions_disease ON predictions(disease);
+CREATE INDEX IF NOT EXISTS idx_predictions_risk_level ON predictions(risk_level);
+CREATE INDEX IF NOT EXISTS idx_predictions_unsynced ON predictions(created_at) WHERE synced_at IS NULL;
+"""
+
+# Columns added after the table was first created, for databases that predate them
+ADDED_COLUMNS = {"model_version": "TEXT", "sync_rejected_at": "TEXT", "sync_error": "TEXT"}
+
+INSERT_SQL = (f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+              "ON CONFLICT(id) DO NOTHING")
+UNSYNCED_SQL = (f"SELECT {', '.join(COLUMNS)} FROM predictions WHERE synced_at IS NULL AND sync_rejected_at IS NULL "
+                "ORDER BY created_at LIMIT ?")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SQLiteStore:
+    def __init__(self, path="predictions.db"):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(predictions)")}
+        for column, declaration in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE predictions ADD COLUMN {column} {declaration}")
+
+    def connection(self):
+        # sqlite3 connections are per thread; each keeps its own prepared-statement cache
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: durable across app crashes, may lose the last commit on power loss
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def table(self, name):
+        if name != "predictions":
+            raise ValueError(f"SQLiteStore only holds the 'predictions' table, not '{name}'")
+        return _Query(self)
+
+    def insert(self, rows):
+        now = _now()
+        records = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+            records.append(row)
+        params = [tuple(json.dumps(r.get(c), default=str) if c in JSON_COLUMNS else r.get(c) for c in COLUMNS)
+                  for r in records]
+        conn = self.connection()
+        with conn:
+            conn.executemany(INSERT_SQL, params)
+        return records
+
+    def select(self, filters, order=None, limit=None):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM predictions"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{column} = ?" for column, _ in filters)
+        if order:
+            sql += f" ORDER BY {order[0]} {'DESC' if order[1] else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+        params = [value for _, value in filters] + ([int(limit)] if limit is not None else [])
+        return [_decode(row) for row in self.connection().execute(sql, params)]
+
+    def unsynced(self, limit=100):
+        return [_decode(row) for row in self.connection().execute(UNSYNCED_SQL, (limit,))]
+
+    def mark_synced(self, ids):
+        conn = self.connection()
+        with conn:
+            conn.executemany("UPDATE predictions SET synced_at = ? WHERE id = ?", [(_now(), i) for i in ids])
+
+    def mark_rejected(self, row_id, error):
+        conn = self.connection()
+        with conn:
+            conn.execute("UPDATE predictions SET sync_rejected_at = ?, sync_error = ? WHERE id = ?",
+                         (_now(), str(error), row_id))
+
+    def pending_sync(self):
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM predictions WHERE synced_at IS NULL AND sync_rejected_at IS NULL").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    # Connections belong to the thread that opened them
+                    pass
+            self._connections.clear()
+
+
+def _decode(row):
+    record = dict(row)
+    for column in JSON_COLUMNS:
+        if record.get(column) is not None:
+            record[column] = json.loads(record[column])
+    return record
+
+
+def _check_column(column):
+    if column not in COLUMNS:
+        raise ValueError(f"Unknown predictions column '{column}'")
+    return column
+
+
+class _Query:
+    """Builder mirroring the postgrest calls the app makes on the predictions table."""
+
+    def __init__(self, store):
+        self.store = store
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.rows = None
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((_check_column(column), value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (_check_column(column), desc)
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def insert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        if self.rows is not None:
+            return SimpleNamespace(data=self.store.insert(self.rows))
+        return SimpleNamespace(data=self.store.select(self.filters, self.order_by, self.row_limit))
+
+
+class SupabaseSync:
+    def __init__(self, store, client, table="predictions", interval=5.0, batch_size=100,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.store = store
+        self.client = client
+        self.table = table
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.stats = {"synced": 0, "batches": 0, "failures": 0, "rejected": 0}
+
+    def start(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="supabase-sync", daemon=True)
+            self._thread.start()
+
+    def notify(self, rows=None):
+        """Sync soon instead of at the next interval (usable as a writer on_flush callback)."""
+        self.start()
+        self._wake.set()
+
+    def close(self, timeout=10.0):
+        """Try one last sync, then stop the background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        failures = 0
+        while True:
+            try:
+                self.sync_once()
+                failures = 0
+                delay = self.interval
+            except Exception as e:
+                failures += 1
+                self.stats["failures"] += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+                logger.warning("Supabase sync failed (%d in a row), retrying in %.0fs: %s", failures, delay, e)
+            if self._stopping.is_set():
+                return
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def sync_once(self):
+        """Push every unsynced row in batches; returns the number of rows synced."""
+        synced = 0
+        while True:
+            rows = self.store.unsynced(self.batch_size)
+            if not rows:
+                return synced
+            errors = []
+            before = self.stats["synced"]
+
+            def upsert(batch):
+                try:
+                    with metrics.supabase_call(f"{self.table}.upsert"):
+                        self.client.table(self.table).upsert(batch, on_conflict="id").execute()
+                except Exception as e:
+                    errors.append(e)
+                    return e
+                self.store.mark_synced([row["id"] for row in batch])
+                self.stats["synced"] += len(batch)
+                self.stats["batches"] += 1
+                return None
+
+            unwritten = write_isolating(rows, upsert, self._reject)
+            synced += self.stats["synced"] - before
+            if unwritten:
+                raise errors[-1]
+            if len(rows) < self.batch_size:
+                return synced
+
+    def _reject(self, row, error):
+        self.store.mark_rejected(row["id"], error)
+        self.stats["rejected"] += 1
+        logger.error("Supabase rejected prediction %s, keeping it unsynced: %s", row["id"], error)
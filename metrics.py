@@ -0,0 +1,232 @@
+"""In-process request metrics in the Prometheus text format, plus a slow-request profiler.
+
+Counters and histograms are kept per worker process and rendered by render()
+for the /metrics route. Label values are passed positionally in labelnames
+order. Callback gauges read values (cache and writer stats) at scrape time.
+
+The profiler is opt-in: with PROFILE_SAMPLE_RATE > 0 that fraction of requests
+runs under cProfile, and those slower than PROFILE_SLOW_MS have their stats
+dumped to PROFILE_DIR (open them with `python -m pstats` or snakeviz).
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    label_str = _format_labels(self.labelnames + ("le",), labels + (le,))
+                    lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_str} {total}")
+                lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge whose values come from fn() at scrape time, as {label tuple: value}."""
+
+    def __init__(self, name, help, labelnames, fn, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            logger.warning("Metric callback %s failed: %s", self.name, e)
+            return lines
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Request latency by route, method and status.",
+    ("route", "method", "status")
+)
+predict_stage = Histogram(
+    "predict_stage_duration_seconds", "Time spent in each stage of the /predict pipeline.", ("stage",)
+)
+model_inference = Histogram(
+    "model_inference_duration_seconds", "Duration of model calls (predict_proba and explanations).", ("kind",)
+)
+model_rows = Counter("model_inference_rows_total", "Patient rows scored or explained by the model.", ("kind",))
+inference_batch_size = Histogram(
+    "inference_batch_size", "Rows per micro-batch scored by the inference scheduler.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+inference_queue_wait = Histogram(
+    "inference_queue_wait_seconds", "Time a /predict row waits in the micro-batch queue.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+model_reloads = Counter("model_reloads_total", "Model versions loaded in the background, by result.", ("result",))
+shadow_predictions = Counter(
+    "shadow_predictions_total", "Live rows scored by the shadow candidate, by agreement with the served model.",
+    ("candidate", "result")
+)
+shadow_probability_diff = Histogram(
+    "shadow_probability_diff", "Largest per-class probability difference between candidate and served model.",
+    ("candidate",), buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0)
+)
+auth_token_checks = Counter(
+    "auth_token_checks_total", "Access tokens verified on first use, by result (local, remote, expired, invalid).",
+    ("result",)
+)
+supabase_duration = Histogram(
+    "supabase_call_duration_seconds", "Duration of Supabase calls by operation.", ("operation",)
+)
+supabase_errors = Counter("supabase_call_errors_total", "Supabase calls that raised, by operation.", ("operation",))
+
+
+@contextmanager
+def supabase_call(operation):
+    """Time a Supabase call and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        supabase_errors.inc(operation)
+        raise
+    finally:
+        supabase_duration.observe(time.perf_counter() - start, operation)
+
+
+class SlowRequestProfiler:
+    def __init__(self, sample_rate=0.0, slow_ms=500.0, output_dir="profiles"):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.output_dir = output_dir
+        self.dumped = 0
+
+    def start(self):
+        """Return a running profiler for a sampled request, else None."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another request on this process is already being profiled
+            return None
+        return profile
+
+    def stop(self, profile, elapsed, name):
+        if profile is None:
+            return None
+        profile.disable()
+        if elapsed * 1e3 < self.slow_ms:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "root"
+        self.dumped += 1
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.dumped}-{slug}-{elapsed * 1e3:.0f}ms.prof"
+        path = os.path.join(self.output_dir, filename)
+        profile.dump_stats(path)
+        logger.info("Profiled slow request %s (%.0f ms) to %s", name, elapsed * 1e3, path)
+        return path
+
+
+profiler = SlowRequestProfiler(
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    slow_ms=float(os.environ.get("PROFILE_SLOW_MS", 500)),
+    output_dir=os.environ.get("PROFILE_DIR", "profiles"),
+)
@@ -0,0 +1,178 @@
+"""Dynamic micro-batching for concurrent single-row predictions.
+
+Request threads submit one feature row each and block on a future. A
+background thread collects rows until max_batch_size are pending or max_wait
+seconds have passed since the oldest one arrived, scores them with one
+vectorized predict_proba call and hands each caller its own row of
+probabilities. Under concurrent load this replaces many small forest
+evaluations with a few larger ones. A batch is also flushed as soon as it
+holds every caller that is currently waiting, so a lone request is scored
+without waiting and max_wait only applies while more rows are expected.
+Once closed, the batcher scores submitted rows inline on the caller's thread,
+so requests still holding a replaced engine are served without a new thread.
+
+Batch fill and queue wait are recorded in metrics.py and summarized by stats().
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(self, predict_proba, max_batch_size=32, max_wait=0.002):
+        self.predict_proba = predict_proba
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        # Rows submitted and not yet scored
+        self._outstanding = 0
+        self._outstanding_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.full_batches = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        with self._start_lock:
+            self._start()
+
+    def _start(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Queue one (n_features,) row; the future resolves to its probability vector."""
+        future = Future()
+        # Under the start lock, so no row can be queued behind close()'s stop marker
+        with self._start_lock:
+            if not self._closed:
+                self._start()
+                with self._outstanding_lock:
+                    self._outstanding += 1
+                self._queue.put((row, future, time.perf_counter()))
+                return future
+        try:
+            future.set_result(self.predict_proba(row[np.newaxis])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def predict(self, row):
+        return self.submit(row).result()
+
+    def close(self, timeout=5.0):
+        """Score everything already queued, then stop the background thread; later rows are scored inline."""
+        with self._start_lock:
+            self._closed = True
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._score(batch)
+            if stop:
+                return
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        # The deadline runs from when the oldest row was submitted
+        deadline = item[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if len(batch) >= self._outstanding:
+                # Every waiting caller is in this batch; waiting longer only adds latency
+                break
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, still take rows that are already queued
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._score(batch)
+                return self._drain(), True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not _STOP:
+                rows.append(item)
+
+    def _score(self, batch):
+        for start in range(0, len(batch), self.max_batch_size):
+            self._score_one_batch(batch[start:start + self.max_batch_size])
+
+    def _score_one_batch(self, batch):
+        started = time.perf_counter()
+        waits = [started - submitted for _, _, submitted in batch]
+        try:
+            proba = self.predict_proba(np.stack([row for row, _, _ in batch]))
+        except Exception as e:
+            logger.exception("Micro-batch of %d rows failed", len(batch))
+            for _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(proba[i])
+        with self._outstanding_lock:
+            self._outstanding -= len(batch)
+
+        metrics.inference_batch_size.observe(len(batch))
+        for wait in waits:
+            metrics.inference_queue_wait.observe(wait)
+        with self._stats_lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self.full_batches += len(batch) == self.max_batch_size
+            self.wait_total += sum(waits)
+            self.wait_max = max(self.wait_max, max(waits))
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1e3,
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "mean_fill": self.rows / (self.batches * self.max_batch_size) if self.batches else 0.0,
+                "full_batches": self.full_batches,
+                "mean_wait_ms": self.wait_total / self.rows * 1e3 if self.rows else 0.0,
+                "max_wait_ms_seen": self.wait_max * 1e3,
+                "pending": self._queue.qsize(),
+            }
@@ -0,0 +1,396 @@
+"""Versioned model registry, hot reload and shadow scoring.
+
+Registry layout (MODEL_REGISTRY_DIR):
+
+    models/
+        <version>/     flat-array bundle (see flat_forest.py) plus model.json
+        CURRENT        version the app serves
+        CANDIDATE      optional version scored in shadow on live traffic
+
+A version is the fingerprint of its bundle files (inference.model_fingerprint),
+so it is also the checksum: a bundle whose files no longer hash to its name is
+refused. model.json holds the metadata train_model.py records (held-out
+accuracy, parameters, seed) and when the version was published.
+
+ModelManager serves one engine at a time. A background thread polls CURRENT
+(or, without a registry, the model file the app loaded); a new version is
+loaded, verified and warmed up on that thread, then swapped in with a single
+assignment. Requests take the engine once and keep it, so they never wait on
+a load nor see a half-loaded model. When CANDIDATE is set, rows scored by
+/predict are queued for the candidate without blocking (dropped when the
+queue is full); a second thread scores them in batches and records agreement
+with the served model in metrics.py.
+
+Usage:
+    python model_registry.py publish disease_predictor_model --activate
+    python model_registry.py list
+    python model_registry.py activate <version>
+    python model_registry.py shadow <version>     # shadow --off to stop
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+import feature_schema
+import metrics
+from flat_forest import FlatForest
+from inference import FEATURE_COLUMNS, InferenceEngine, default_model_path, load_engine, model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = "model.json"
+CURRENT = "CURRENT"
+CANDIDATE = "CANDIDATE"
+
+# Rows scored by warm_up() before a version is swapped in
+WARMUP_ROWS = 64
+
+
+def read_pointer(registry, name):
+    try:
+        with open(os.path.join(registry, name)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(registry, name, version):
+    path = os.path.join(registry, name)
+    if version is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    if not os.path.isdir(os.path.join(registry, version)):
+        raise ValueError(f"Unknown model version '{version}' in '{registry}'")
+    # Written next to the pointer and renamed over it, so pollers never read a partial file
+    staging = f"{path}.{os.getpid()}.tmp"
+    with open(staging, "w") as f:
+        f.write(version + "\n")
+    os.replace(staging, path)
+
+
+def read_metadata(registry, version):
+    try:
+        with open(os.path.join(registry, version, METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": version}
+
+
+def list_versions(registry):
+    versions = [name for name in os.listdir(registry)
+                if os.path.isfile(os.path.join(registry, name, METADATA_FILE))] if os.path.isdir(registry) else []
+    return sorted((read_metadata(registry, v) for v in versions), key=lambda m: m.get("published_at", ""))
+
+
+def publish(source, registry, metadata=None):
+    """Add a flat bundle directory (or a pickled forest, flattened) to the registry; returns its version."""
+    os.makedirs(registry, exist_ok=True)
+    staging = os.path.join(registry, f".staging-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    if os.path.isdir(source):
+        shutil.copytree(source, staging, ignore=shutil.ignore_patterns(METADATA_FILE))
+    else:
+        # Export-only dependency, as in flat_forest.main()
+        import joblib
+        FlatForest.from_model(joblib.load(source)).save(staging)
+    version = model_fingerprint(staging, exclude=(METADATA_FILE,))
+    target = os.path.join(registry, version)
+    if os.path.isdir(target):
+        # Same bytes already published
+        shutil.rmtree(staging)
+        return version
+    info = {"version": version, "published_at": datetime.now(timezone.utc).isoformat(),
+            "source": os.path.abspath(source), **(metadata or {})}
+    with open(os.path.join(staging, METADATA_FILE), "w") as f:
+        json.dump(info, f, indent=2)
+    os.replace(staging, target)
+    return version
+
+
+def load_version(registry, version):
+    path = os.path.join(registry, version)
+    checksum = model_fingerprint(path, exclude=(METADATA_FILE,))
+    if checksum != version:
+        raise ValueError(f"Model version '{version}' fails its checksum (files hash to {checksum})")
+    return InferenceEngine(FlatForest.load(path), version=version, metadata=read_metadata(registry, version))
+
+
+def warm_up(engine, rows=WARMUP_ROWS, seed=0):
+    """Score and explain synthetic rows so the first live request pays no first-call costs.
+
+    Raises if the model does not return one probability vector per row.
+    """
+    raw = np.random.default_rng(seed).uniform(feature_schema.LOW, feature_schema.HIGH,
+                                              (rows, len(feature_schema.FIELDS)))
+    raw[:, feature_schema.BINARY] = raw[:, feature_schema.BINARY].round()
+    X = feature_schema.normalize(raw)
+    proba = engine.model.predict_proba(X)
+    if proba.shape != (rows, len(engine.classes_)) or not np.allclose(proba.sum(axis=1), 1.0):
+        raise ValueError(f"Model returned probabilities of shape {proba.shape} for {rows} warm-up rows")
+    engine.model.predict_proba(X[:1])
+    engine.explainer.contributions(X[:1])
+
+
+class ModelManager:
+    def __init__(self, registry=None, poll_interval=5.0, batching=None, on_swap=None,
+                 shadow_queue_size=1000, shadow_batch_size=64):
+        self.registry = registry
+        # Without a registry, the model file the app loads is watched instead
+        self.path = None if registry else default_model_path()
+        self.poll_interval = poll_interval
+        # start_batching() kwargs applied to every engine swapped in
+        self.batching = batching
+        # Called with the new engine after each swap
+        self.on_swap = on_swap
+        self.shadow_batch_size = shadow_batch_size
+
+        self.engine = None
+        self.candidate = None
+        self._loaded_key = None
+        self._failed_key = None
+        self._candidate_key = None
+        self._shadow_queue = queue.Queue(maxsize=shadow_queue_size)
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads = {}
+        self._pid = None
+        self.stats = {"reloads": 0, "reload_failures": 0, "shadow_scored": 0, "shadow_agreed": 0,
+                      "shadow_dropped": 0}
+
+    def _current_key(self):
+        if self.registry:
+            return read_pointer(self.registry, CURRENT)
+        # The bundle is replaced by a directory rename and the pickle rewritten, so both change these
+        st = os.stat(self.path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self, key):
+        if self.registry:
+            engine = load_version(self.registry, key)
+        else:
+            engine = load_engine(self.path)
+            engine.metadata = {"version": engine.version, "source": os.path.abspath(self.path)}
+        warm_up(engine)
+        return engine
+
+    def load(self):
+        """Load and serve the current version now (at startup)."""
+        key = self._current_key()
+        if key is None:
+            raise ValueError(f"Model registry '{self.registry}' has no {CURRENT} version; "
+                             f"run 'python model_registry.py publish <bundle> --activate'")
+        self._swap(self._load(key), key)
+        self._refresh_candidate()
+        return self.engine
+
+    def _swap(self, engine, key):
+        if self.batching:
+            engine.start_batching(**self.batching)
+        old, self.engine = self.engine, engine
+        self._loaded_key = key
+        if old is not None and old.batcher is not None:
+            # Rows already queued are still scored by the old version; requests still holding it score inline
+            old.batcher.close()
+        if self.on_swap is not None:
+            self.on_swap(engine)
+
+    def check(self):
+        """Swap in a changed CURRENT version and pick up CANDIDATE changes; True if the engine changed."""
+        try:
+            key = self._current_key()
+        except FileNotFoundError:
+            # Caught mid-replace; look again at the next poll
+            return False
+        swapped = False
+        if key is not None and key != self._loaded_key and key != self._failed_key:
+            try:
+                engine = self._load(key)
+            except Exception:
+                # Keep serving the old version, and do not retry this one until it changes
+                logger.exception("Loading model version %s failed", key)
+                self._failed_key = key
+                self.stats["reload_failures"] += 1
+                metrics.model_reloads.inc("failed")
+            else:
+                self._swap(engine, key)
+                self.stats["reloads"] += 1
+                metrics.model_reloads.inc("ok")
+                logger.info("Now serving model version %s", engine.version)
+                swapped = True
+        self._refresh_candidate()
+        return swapped
+
+    def _refresh_candidate(self):
+        if not self.registry:
+            return
+        version = read_pointer(self.registry, CANDIDATE)
+        if version == self._candidate_key:
+            return
+        self._candidate_key = version
+        if version is None:
+            self.candidate = None
+            return
+        try:
+            candidate = load_version(self.registry, version)
+            warm_up(candidate)
+        except Exception:
+            logger.exception("Loading shadow candidate %s failed", version)
+            self.candidate = None
+            return
+        self.candidate = candidate
+        logger.info("Shadow scoring candidate model %s", version)
+
+    def start(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads.values()):
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._threads = {}
+                self._pid = os.getpid()
+            self._stopping.clear()
+            for name, target in (("model-reload", self._run_reload), ("model-shadow", self._run_shadow)):
+                if name == "model-reload" and not self.poll_interval:
+                    continue
+                thread = self._threads.get(name)
+                if thread is None or not thread.is_alive():
+                    thread = self._threads[name] = threading.Thread(target=target, name=name, daemon=True)
+                    thread.start()
+
+    def close(self, timeout=5.0):
+        self._stopping.set()
+        try:
+            self._shadow_queue.put_nowait(None)
+        except queue.Full:
+            # The shadow thread sees _stopping after its current batch
+            pass
+        for thread in self._threads.values():
+            thread.join(timeout)
+
+    def _run_reload(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Model reload check failed")
+
+    def shadow(self, features, proba):
+        """Queue a row the served model scored, for the candidate to score too. Never blocks."""
+        candidate = self.candidate
+        if candidate is None:
+            return
+        self.start()
+        row = np.fromiter((features[name] for name in FEATURE_COLUMNS), dtype=np.float64, count=len(FEATURE_COLUMNS))
+        try:
+            self._shadow_queue.put_nowait((candidate, row, np.array(proba, dtype=np.float64)))
+        except queue.Full:
+            self.stats["shadow_dropped"] += 1
+
+    def _run_shadow(self):
+        while True:
+            item = self._shadow_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.shadow_batch_size:
+                try:
+                    item = self._shadow_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._stopping.set()
+                    break
+                batch.append(item)
+            try:
+                self._score_shadow(batch)
+            except Exception:
+                logger.exception("Shadow scoring of %d rows failed", len(batch))
+            if self._stopping.is_set():
+                return
+
+    def _score_shadow(self, batch):
+        by_candidate = {}
+        for candidate, row, served in batch:
+            by_candidate.setdefault(candidate, []).append((row, served))
+        for candidate, items in by_candidate.items():
+            X = np.stack([row for row, _ in items])
+            served = np.stack([proba for _, proba in items])
+            with metrics.model_inference.time("shadow"):
+                proba = candidate.model.predict_proba(X)
+            metrics.model_rows.inc("shadow", amount=len(X))
+            agree = proba.argmax(axis=1) == served.argmax(axis=1)
+            for same, diff in zip(agree, np.abs(proba - served).max(axis=1)):
+                metrics.shadow_predictions.inc(candidate.version, "agree" if same else "disagree")
+                metrics.shadow_probability_diff.observe(float(diff), candidate.version)
+            self.stats["shadow_scored"] += len(X)
+            self.stats["shadow_agreed"] += int(agree.sum())
+
+    def describe(self):
+        candidate = self.candidate
+        scored = self.stats["shadow_scored"]
+        return {
+            "registry": self.registry,
+            "serving": self.engine.metadata,
+            "candidate": candidate.metadata if candidate is not None else None,
+            "shadow_agreement": self.stats["shadow_agreed"] / scored if scored else None,
+            "shadow_pending": self._shadow_queue.qsize(),
+            **self.stats,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument("--registry", default=os.environ.get("MODEL_REGISTRY_DIR", "models"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("publish", help="Add a bundle directory or pickled forest")
+    add.add_argument("source")
+    add.add_argument("--metadata", help="JSON file of extra metadata (e.g. a train_model.py --report)")
+    add.add_argument("--activate", action="store_true", help="Serve it once published")
+    sub.add_parser("list", help="List published versions")
+    use = sub.add_parser("activate", help="Serve a version (running apps swap it in)")
+    use.add_argument("version")
+    shadow = sub.add_parser("shadow", help="Score a candidate version in shadow on live traffic")
+    shadow.add_argument("version", nargs="?")
+    shadow.add_argument("--off", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        metadata = None
+        if args.metadata:
+            with open(args.metadata) as f:
+                metadata = json.load(f)
+        version = publish(args.source, args.registry, metadata)
+        print(f"Published {version}")
+        if args.activate:
+            write_pointer(args.registry, CURRENT, version)
+            print(f"Serving {version}")
+    elif args.command == "list":
+        current = read_pointer(args.registry, CURRENT)
+        candidate = read_pointer(args.registry, CANDIDATE)
+        for m in list_versions(args.registry):
+            role = "serving" if m["version"] == current else "candidate" if m["version"] == candidate else ""
+            accuracy = m.get("test_accuracy")
+            print(f"{m['version']}  {m.get('published_at', '')[:19]:<19}  "
+                  f"{'' if accuracy is None else f'{accuracy * 100:.2f}%':>7}  {role}")
+    elif args.command == "activate":
+        write_pointer(args.registry, CURRENT, args.version)
+        print(f"Serving {args.version}")
+    else:
+        if not args.off and not args.version:
+            parser.error("shadow needs a version or --off")
+        write_pointer(args.registry, CANDIDATE, None if args.off else args.version)
+        print("Shadow scoring off" if args.off else f"Shadow scoring {args.version}")
+
+
+if __name__ == "__main__":
+    main()
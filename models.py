@@ -2,6 +2,9 @@
 from supabase import create_client
 from os import getenv
 from dotenv import load_dotenv
+from auth import AuthError, TokenRefresher, TokenVerifier
+from cache import user_cache
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -15,15 +18,25 @@ if not supabase_url or not supabase_key:
 
 supabase = create_client(supabase_url, supabase_key)
 
+# Access tokens are verified in-process; sessions are refreshed in the background
+# within AUTH_REFRESH_MARGIN seconds of expiry (see auth.py)
+token_verifier = TokenVerifier(supabase_url, jwt_secret=getenv('SUPABASE_JWT_SECRET') or None, client=supabase)
+token_refresher = TokenRefresher(supabase_url, supabase_key, margin=float(getenv('AUTH_REFRESH_MARGIN', 300)))
+
+# Profile fields kept in the auth user's user_metadata, so a verified token carries them
+PROFILE_FIELDS = ("username", "first_name", "last_name")
+
 class User:
     @staticmethod
     def create_user(email, password, username, first_name, last_name):
         try:
             # Create auth user - Supabase handles password hashing
-            auth_response = supabase.auth.sign_up({
-                "email": email,
-                "password": password
-            })
+            with metrics.supabase_call("auth.sign_up"):
+                auth_response = supabase.auth.sign_up({
+                    "email": email,
+                    "password": password,
+                    "options": {"data": {"username": username, "first_name": first_name, "last_name": last_name}}
+                })
             
             if auth_response.user:
                 user_data = {
@@ -35,7 +48,8 @@ class User:
                 }
                 
                 # Insert into users table
-                supabase.table('users').insert(user_data).execute()
+                with metrics.supabase_call("users.insert"):
+                    supabase.table('users').insert(user_data).execute()
                 return auth_response.user
                 
         except Exception as e:
@@ -44,10 +58,11 @@ class User:
     @staticmethod
     def login(email, password):
         try:
-            auth_response = supabase.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
+            with metrics.supabase_call("auth.sign_in"):
+                auth_response = supabase.auth.sign_in_with_password({
+                    "email": email,
+                    "password": password
+                })
             
             if auth_response.user:
                 return auth_response
@@ -55,10 +70,28 @@ class User:
         except Exception as e:
             raise Exception(f"Error logging in: {str(e)}")
     
+    @staticmethod
+    def profile_from_claims(claims):
+        """Session profile from token claims (or an auth user's fields), None if user_metadata lacks it."""
+        metadata = claims.get("user_metadata") or {}
+        if not all(field in metadata for field in PROFILE_FIELDS):
+            return None
+        return {"id": claims["sub"], "email": claims.get("email"), **{field: metadata[field] for field in PROFILE_FIELDS}}
+
+    @staticmethod
+    def profile(claims):
+        # Accounts created before the profile was kept in user_metadata are read from the users table
+        return User.profile_from_claims(claims) or User.get_user_by_id(claims["sub"])
+
     @staticmethod
     def get_user_by_id(user_id):
+        return user_cache.get_or_load(user_id, lambda: User._fetch_user(user_id))
+
+    @staticmethod
+    def _fetch_user(user_id):
         try:
-            response = supabase.table('users').select("*").eq('id', user_id).execute()
+            with metrics.supabase_call("users.select"):
+                response = supabase.table('users').select("*").eq('id', user_id).execute()
             if response.data:
                 return response.data[0]
             return None
@@ -66,18 +99,18 @@ class User:
             raise Exception(f"Error fetching user: {str(e)}")
     
     @staticmethod
-    def logout():
+    def logout(access_token):
+        # Revoke this session only: the shared client's sign_out() acts on whoever signed in
+        # on it last, with scope "global"
         try:
-            supabase.auth.sign_out()
+            with metrics.supabase_call("auth.sign_out"):
+                supabase.auth.admin.sign_out(access_token, "local")
         except Exception as e:
             raise Exception(f"Error logging out: {str(e)}")
             
     @staticmethod
-    def get_current_user():
+    def get_current_user(access_token):
         try:
-            user = supabase.auth.get_user()
-            if user:
-                return User.get_user_by_id(user.id)
-            return None
-        except Exception:
+            return User.profile(token_verifier.verify(access_token))
+        except AuthError:
             return None
@@ -0,0 +1,302 @@
+"""Write-behind queue for prediction inserts.
+
+Requests only enqueue rows. A background thread coalesces them into bulk
+multi-row inserts, flushing when max_batch_size rows are pending or
+flush_interval seconds have passed since the first one. Transient failures
+(network, timeouts, server errors) are retried with exponential backoff. When
+the backend stays unreachable, the rows are appended to a local JSON-lines
+spill file, which is replayed once inserts succeed again. close() drains
+everything still queued. Workers sharing a spill file take file locks, so
+only one of them replays it, and a replay records how many rows it has
+written after every batch, so an interrupted one resumes after them.
+
+Rows the server rejects for their values (data exceptions, CHECK, NOT NULL
+or foreign key violations) are not retried: a rejected batch is split in
+halves until the offending rows are isolated, the other rows are written,
+and the rejected ones go to a dead-letter file with the error. The
+dead-letter file is never replayed. Auth, schema and RLS errors fail every
+row alike, so they are treated as outages and the rows are spilled.
+
+The client only needs supabase's table(name).insert(rows).execute() interface,
+so a local stand-in can be passed in tests.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows; run one worker per spill file there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# SQLSTATE classes of rows the database will never accept for their values: data
+# exceptions (22) and integrity violations (23: CHECK, foreign key, NOT NULL, unique).
+# Everything else (bad key, unknown column, RLS) is a deployment problem that rejects
+# every row alike and can be fixed, so those rows are kept for a replay.
+PERMANENT_SQLSTATE_CLASSES = ("22", "23")
+
+
+def is_permanent(exc):
+    """True when the server rejected the rows themselves, so retrying cannot help."""
+    if isinstance(exc, sqlite3.IntegrityError):
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, str) and len(code) == 5 and code[:2] in PERMANENT_SQLSTATE_CLASSES
+
+
+def write_isolating(rows, insert, on_reject):
+    """Write rows with insert(rows), which returns None or the error that stopped it.
+
+    A batch the server rejects is split in halves until the rejected rows are
+    isolated; each is passed to on_reject(row, error) and the others are written.
+    Returns the rows a transient failure left unwritten, stopping at the first one.
+    """
+    error = insert(rows)
+    if error is None:
+        return []
+    if not is_permanent(error):
+        return rows
+    if len(rows) == 1:
+        on_reject(rows[0], error)
+        return []
+    mid = len(rows) // 2
+    unwritten = write_isolating(rows[:mid], insert, on_reject)
+    if unwritten:
+        return unwritten + rows[mid:]
+    return write_isolating(rows[mid:], insert, on_reject)
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive lock on path across processes; yields False if blocking=False and it is taken."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+        yield True
+
+
+class PredictionWriter:
+    def __init__(self, client, table="predictions", max_batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 spill_path="predictions_spill.jsonl", dead_letter_path="predictions_dead_letter.jsonl",
+                 on_flush=None, remote=True):
+        self.client = client
+        self.table = table
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        # Called with the list of rows after every successful insert
+        self.on_flush = on_flush
+        # Inserts are timed as Supabase calls unless the client is a local store
+        self.remote = remote
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0,
+                      "rejected": 0}
+
+    def start(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="prediction-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, row):
+        """Queue one row for insertion. Never blocks on the network."""
+        if self._stopping.is_set():
+            self._spill([row])
+            return
+        self.start()
+        self.stats["enqueued"] += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Backpressure: keep the row on local disk instead of blocking the request
+            self._spill([row])
+
+    def close(self, timeout=10.0):
+        """Flush everything queued, then stop the background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        self._replay()
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if stop:
+                return
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return self._drain(), True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch + self._drain(), True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not _STOP:
+                rows.append(item)
+
+    def _flush(self, rows):
+        for start in range(0, len(rows), self.max_batch_size):
+            unwritten = self._write(rows[start:start + self.max_batch_size])
+            if unwritten:
+                self._spill(unwritten)
+            elif os.path.exists(self.spill_path):
+                self._replay()
+
+    def _write(self, rows):
+        """Insert rows, dead-lettering the ones the server rejects; returns rows a transient failure left unwritten."""
+        return write_isolating(rows, self._insert, self._dead_letter)
+
+    def _insert(self, rows):
+        """Insert rows, retrying transient failures; returns None, or the error that ended the attempts."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.supabase_call(f"{self.table}.insert") if self.remote else nullcontext():
+                    self.client.table(self.table).insert(rows).execute()
+            except Exception as e:
+                logger.warning("Prediction insert of %d rows failed (attempt %d): %s", len(rows), attempt + 1, e)
+                if is_permanent(e) or attempt == self.max_retries or self._stopping.is_set():
+                    return e
+                self.stats["retries"] += 1
+                time.sleep(min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                continue
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(rows)
+                except Exception:
+                    logger.exception("on_flush callback failed")
+            return None
+
+    def _replay(self):
+        # The writer thread must outlive a failed replay; the spill file is kept for the next one
+        try:
+            self.replay_spill()
+        except Exception:
+            logger.exception("Replaying %s failed", self.spill_path)
+
+    def _spill(self, rows):
+        with self._spill_lock, file_lock(self.spill_path + ".lock"):
+            with open(self.spill_path, "a") as f:
+                f.write("".join(json.dumps(row, default=str) + "\n" for row in rows))
+        self.stats["spilled"] += len(rows)
+        logger.warning("Spilled %d prediction rows to %s", len(rows), self.spill_path)
+
+    def _dead_letter(self, row, error):
+        record = {"row": row, "error": str(error), "rejected_at": datetime.now(timezone.utc).isoformat()}
+        with self._spill_lock:
+            with open(self.dead_letter_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        self.stats["rejected"] += 1
+        logger.error("Prediction row rejected, written to %s: %s", self.dead_letter_path, error)
+
+    def replay_spill(self):
+        """Re-insert rows from the spill file; rows that still fail are spilled again."""
+        replaying = self.spill_path + ".replay"
+        with file_lock(replaying + ".lock", blocking=False) as locked:
+            if not locked:
+                # Another worker is replaying this spill file
+                return
+            with self._spill_lock, file_lock(self.spill_path + ".lock"):
+                # A leftover .replay file means a previous replay was interrupted
+                if not os.path.exists(replaying):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    self._remove(replaying + ".offset")
+                    os.replace(self.spill_path, replaying)
+            # Rows of an interrupted replay that were already written are skipped
+            done = self._read_offset(replaying + ".offset")
+            with open(replaying) as f:
+                rows = [json.loads(line) for line in f if line.strip()][done:]
+            for start in range(0, len(rows), self.max_batch_size):
+                end = start + self.max_batch_size
+                unwritten = self._write(rows[start:end])
+                if unwritten:
+                    # Still unreachable: put the rest back and try again after the next success
+                    self._spill(unwritten + rows[end:])
+                    break
+                self.stats["replayed"] += len(rows[start:end])
+                self._write_offset(replaying + ".offset", done + min(end, len(rows)))
+            # Offset first: a crash in between replays rows again rather than skipping new ones
+            self._remove(replaying + ".offset")
+            self._remove(replaying)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read_offset(path):
+        try:
+            with open(path) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_offset(path, offset):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, path)
@@ -0,0 +1,51 @@
+-- Daily prediction rollups for the analytics dashboard (see analytics.py)
+CREATE TABLE public.prediction_rollups (
+    day DATE NOT NULL,
+    disease VARCHAR(100) NOT NULL,
+    risk_level VARCHAR(20) NOT NULL CHECK (risk_level IN ('Very Low', 'Low', 'Moderate', 'High', 'Very High')),
+    prediction_count BIGINT NOT NULL DEFAULT 0,
+    probability_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, disease, risk_level)
+) TABLESPACE pg_default;
+
+CREATE INDEX idx_prediction_rollups_disease_day ON public.prediction_rollups(disease, day);
+
+-- Aggregates only, so any signed-in user may read them; writes go through the service-role functions below
+ALTER TABLE public.prediction_rollups ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Authenticated users can view prediction rollups" ON public.prediction_rollups
+    FOR SELECT USING (auth.role() = 'authenticated');
+
+-- Add a batch of bucket deltas: [{day, disease, risk_level, prediction_count, probability_sum}, ...]
+CREATE OR REPLACE FUNCTION apply_prediction_rollups(deltas JSONB)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO public.prediction_rollups AS r (day, disease, risk_level, prediction_count, probability_sum)
+    SELECT d.day, d.disease, d.risk_level, d.prediction_count, d.probability_sum
+    FROM jsonb_to_recordset(deltas)
+        AS d(day DATE, disease VARCHAR(100), risk_level VARCHAR(20), prediction_count BIGINT, probability_sum DOUBLE PRECISION)
+    ON CONFLICT (day, disease, risk_level) DO UPDATE
+        SET prediction_count = r.prediction_count + EXCLUDED.prediction_count,
+            probability_sum = r.probability_sum + EXCLUDED.probability_sum;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Replace every bucket before until_day with a rebuilt set, in one transaction (backfill)
+CREATE OR REPLACE FUNCTION replace_prediction_rollups(rollups JSONB, until_day DATE)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM public.prediction_rollups WHERE day < until_day;
+    INSERT INTO public.prediction_rollups (day, disease, risk_level, prediction_count, probability_sum)
+    SELECT d.day, d.disease, d.risk_level, d.prediction_count, d.probability_sum
+    FROM jsonb_to_recordset(rollups)
+        AS d(day DATE, disease VARCHAR(100), risk_level VARCHAR(20), prediction_count BIGINT, probability_sum DOUBLE PRECISION)
+    WHERE d.day < until_day;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Both functions bypass RLS, so only the service role (the app's rollup client, the backfill) may call them
+REVOKE EXECUTE ON FUNCTION apply_prediction_rollups(JSONB) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION replace_prediction_rollups(JSONB, DATE) FROM PUBLIC, anon, authenticated;
+
+COMMENT ON TABLE public.prediction_rollups IS 'Prediction count and probability sum per day, disease and risk level';
+COMMENT ON COLUMN public.prediction_rollups.probability_sum IS 'Sum of prediction probabilities; divide by prediction_count for the mean';
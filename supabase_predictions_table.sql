@@ -6,12 +6,17 @@ CREATE TABLE public.predictions (
     probability DECIMAL(5,4) NOT NULL CHECK (probability >= 0 AND probability <= 1),
     risk_level VARCHAR(20) NOT NULL CHECK (risk_level IN ('Very Low', 'Low', 'Moderate', 'High', 'Very High')),
     form_data JSONB NOT NULL,
+    model_version VARCHAR(64),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 ) TABLESPACE pg_default;
 
+-- For a table created before model versions were recorded:
+-- ALTER TABLE public.predictions ADD COLUMN IF NOT EXISTS model_version VARCHAR(64);
+
 -- Create index for better query performance
 CREATE INDEX idx_predictions_user_id ON public.predictions(user_id);
+CREATE INDEX idx_predictions_user_id_created_at ON public.predictions(user_id, created_at DESC);
 CREATE INDEX idx_predictions_created_at ON public.predictions(created_at DESC);
 CREATE INDEX idx_predictions_disease ON public.predictions(disease);
 CREATE INDEX idx_predictions_risk_level ON public.predictions(risk_level);
@@ -57,5 +62,6 @@ COMMENT ON COLUMN public.predictions.disease IS 'The predicted genetic disease';
 COMMENT ON COLUMN public.predictions.probability IS 'Prediction probability (0.0 to 1.0)';
 COMMENT ON COLUMN public.predictions.risk_level IS 'Risk level classification';
 COMMENT ON COLUMN public.predictions.form_data IS 'JSON data containing input parameters used for prediction';
+COMMENT ON COLUMN public.predictions.model_version IS 'Registry version (bundle checksum) of the model that made the prediction';
 COMMENT ON COLUMN public.predictions.created_at IS 'Timestamp when the prediction was created';
 COMMENT ON COLUMN public.predictions.updated_at IS 'Timestamp when the prediction was last updated';
\ No newline at end of file
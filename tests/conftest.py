@@ -0,0 +1,19 @@
+import os
+import sys
+import warnings
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    # models.py refuses to import without credentials; nothing in the tests calls Supabase
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "test-anon-key")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import app
+    return app
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import analytics
+
+
+def row(created_at, disease="Hemophilia", risk_level="Low", probability=0.5):
+    return {"created_at": created_at, "disease": disease, "risk_level": risk_level, "probability": probability}
+
+
+@pytest.mark.parametrize("created_at, day", [
+    ("2026-03-01T23:30:00+00:00", "2026-03-01"),
+    # Near midnight in UTC-5 is already the next day in UTC, as in the backfill
+    ("2026-03-01T20:30:00-05:00", "2026-03-02"),
+    ("2026-03-02T00:30:00+02:00", "2026-03-01"),
+    (datetime(2026, 3, 1, 23, 30, tzinfo=timezone(timedelta(hours=-3))), "2026-03-02"),
+])
+def test_bucket_key_uses_utc_days(created_at, day):
+    assert analytics.bucket_key(row(created_at)) == (day, "Hemophilia", "Low")
+
+
+def test_bucket_key_without_created_at_is_today_utc():
+    assert analytics.bucket_key(row(None))[0] == datetime.now(timezone.utc).date().isoformat()
+
+
+def test_accumulate():
+    buckets = analytics.accumulate({}, [row("2026-03-01T10:00:00+00:00", probability=0.25),
+                                        row("2026-03-01T11:00:00+00:00", probability=0.75),
+                                        row("2026-03-01T11:00:00+00:00", risk_level="High", probability=0.9)])
+    assert buckets == {("2026-03-01", "Hemophilia", "Low"): [2, 1.0],
+                       ("2026-03-01", "Hemophilia", "High"): [1, 0.9]}
+
+
+def test_summarize():
+    buckets = [
+        {"day": "2026-03-01", "disease": "Hemophilia", "risk_level": "Low", "prediction_count": 2, "probability_sum": 1.0},
+        {"day": "2026-03-01", "disease": "Hemophilia", "risk_level": "High", "prediction_count": 1, "probability_sum": 0.9},
+        {"day": "2026-03-02", "disease": "Thalassemia", "risk_level": "Low", "prediction_count": 1, "probability_sum": 0.3},
+    ]
+    summary = analytics.summarize(buckets)
+    assert summary["total"]["count"] == 4
+    assert summary["total"]["mean_probability"] == pytest.approx(2.2 / 4)
+    assert summary["total"]["risk_levels"] == {"Very Low": 0, "Low": 3, "Moderate": 0, "High": 1, "Very High": 0}
+    assert [(d["disease"], d["count"]) for d in summary["by_disease"]] == [("Hemophilia", 3), ("Thalassemia", 1)]
+    assert [(s["day"], s["disease"], s["count"]) for s in summary["series"]] == [
+        ("2026-03-01", "Hemophilia", 3), ("2026-03-02", "Thalassemia", 1)]
+
+
+def test_summarize_without_buckets():
+    assert analytics.summarize([])["total"] == {"count": 0, "mean_probability": None,
+                                                 "risk_levels": dict.fromkeys(analytics.RISK_LEVELS, 0)}
+
+
+class RpcStandIn:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def rpc(self, name, params):
+        def execute():
+            if self.fail:
+                raise ConnectionError("down")
+            self.calls.append((name, params))
+        return SimpleNamespace(execute=execute)
+
+
+def test_failed_flush_keeps_deltas():
+    client = RpcStandIn(fail=True)
+    rollups = analytics.Rollups(client)
+    rollups.record([row("2026-03-01T10:00:00+00:00")])
+    assert rollups.flush() is False
+    rollups.record([row("2026-03-01T11:00:00+00:00")])
+    client.fail = False
+    assert rollups.flush() is True
+    assert client.calls == [("apply_prediction_rollups", {"deltas": [
+        {"day": "2026-03-01", "disease": "Hemophilia", "risk_level": "Low", "prediction_count": 2,
+         "probability_sum": 1.0}]})]
+    assert rollups.pending() == 0
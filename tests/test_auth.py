@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from auth import AuthError, TokenExpired, TokenRefresher, TokenVerifier
+
+SECRET = "test-jwt-secret-" * 4
+
+
+def token(url, key=SECRET, algorithm="HS256", expires_in=3600, headers=None, **claims):
+    payload = {"sub": str(uuid.uuid4()), "aud": "authenticated", "iss": f"{url}/auth/v1",
+               "exp": int(time.time()) + expires_in, "email": "u1@example.com", **claims}
+    return jwt.encode(payload, key, algorithm=algorithm, headers=headers)
+
+
+class AuthServer:
+    """Local stand-in for the Supabase auth endpoints the verifier and refresher call."""
+
+    def __init__(self, delay=0.0, status=200):
+        self.refreshes = []
+        self.delay = delay
+        self.status = status
+        self.jwks = {"keys": []}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply(200, server.jwks)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.refreshes.append(body["refresh_token"])
+                time.sleep(server.delay)
+                self._reply(server.status, {"access_token": f"access-{len(server.refreshes)}",
+                                            "refresh_token": f"refresh-{len(server.refreshes)}",
+                                            "expires_at": int(time.time()) + 3600})
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = AuthServer()
+    yield server
+    server.close()
+
+
+URL = "http://127.0.0.1:54321"
+
+
+def test_hs256_token_is_verified_locally_and_memoized():
+    verifier = TokenVerifier(URL, jwt_secret=SECRET)
+    access = token(URL)
+    assert verifier.cached(access) is None
+    claims = verifier.verify(access)
+    assert claims["email"] == "u1@example.com"
+    assert verifier.cached(access) == claims
+    # A memoized token is not decoded again
+    verifier.jwt_secret = "another-secret-of-at-least-32-bytes"
+    assert verifier.verify(access) == claims
+
+
+def test_expired_token():
+    verifier = TokenVerifier(URL, jwt_secret=SECRET)
+    with pytest.raises(TokenExpired):
+        verifier.verify(token(URL, expires_in=-60))
+
+
+def test_memoized_claims_expire_with_the_token():
+    verifier = TokenVerifier(URL, jwt_secret=SECRET, leeway=0)
+    access = token(URL, expires_in=1)
+    verifier.verify(access)
+    time.sleep(1.1)
+    assert verifier.cached(access) is None
+    with pytest.raises(TokenExpired):
+        verifier.verify(access)
+
+
+@pytest.mark.parametrize("access", [
+    token(URL, key="wrong-secret-of-at-least-32-bytes!"),
+    token("http://127.0.0.1:9999"),
+    token(URL, aud="anon"),
+    token(URL, algorithm="HS512"),
+    "not-a-jwt",
+    "",
+])
+def test_invalid_token(access):
+    with pytest.raises(AuthError) as excinfo:
+        TokenVerifier(URL, jwt_secret=SECRET).verify(access)
+    assert not isinstance(excinfo.value, TokenExpired)
+
+
+def test_hs256_without_secret_is_checked_remotely():
+    user = SimpleNamespace(id="u1", email="u1@example.com", user_metadata={"full_name": "U"})
+    calls = []
+    client = SimpleNamespace(auth=SimpleNamespace(
+        get_user=lambda t: calls.append(t) or SimpleNamespace(user=user)))
+    access = token(URL)
+    claims = TokenVerifier(URL, client=client).verify(access)
+    assert calls == [access]
+    assert claims["sub"] == "u1" and claims["user_metadata"] == {"full_name": "U"}
+
+    with pytest.raises(AuthError, match="SUPABASE_JWT_SECRET"):
+        TokenVerifier(URL).verify(token(URL))
+
+
+def test_es256_token_is_checked_against_the_signing_keys(server):
+    key = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(key.public_key()))
+    server.jwks = {"keys": [{**jwk, "kid": "k1", "alg": "ES256", "use": "sig"}]}
+    verifier = TokenVerifier(server.url)
+    claims = verifier.verify(token(server.url, key=key, algorithm="ES256", headers={"kid": "k1"}))
+    assert claims["aud"] == "authenticated"
+
+    other = ec.generate_private_key(ec.SECP256R1())
+    with pytest.raises(AuthError):
+        verifier.verify(token(server.url, key=other, algorithm="ES256", headers={"kid": "k1"}))
+
+
+def test_unreachable_signing_keys_fall_back_to_remote_check():
+    user = SimpleNamespace(id="u2", email="u2@example.com", user_metadata=None)
+    client = SimpleNamespace(auth=SimpleNamespace(get_user=lambda t: SimpleNamespace(user=user)))
+    key = ec.generate_private_key(ec.SECP256R1())
+    access = token(URL, key=key, algorithm="ES256", headers={"kid": "k1"})
+    assert TokenVerifier(URL, client=client).verify(access)["sub"] == "u2"
+
+
+def test_concurrent_refreshes_share_one_request(server):
+    server.delay = 0.2
+    refresher = TokenRefresher(server.url, "anon-key")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(refresher.refresh("refresh-0"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    refresher.close()
+    assert server.refreshes == ["refresh-0"]
+    assert results == [results[0]] * 8
+    assert results[0]["access_token"] == "access-1" and results[0]["refresh_token"] == "refresh-1"
+
+
+def test_background_refresh_is_collected_once_finished(server):
+    server.delay = 0.2
+    refresher = TokenRefresher(server.url, "anon-key", margin=300)
+    assert refresher.due({"exp": time.time() + 60})
+    assert not refresher.due({"exp": time.time() + 3600})
+
+    future = refresher.schedule("refresh-0")
+    assert refresher.collect("refresh-0") is None
+    future.result()
+    assert refresher.collect("refresh-0")["access_token"] == "access-1"
+    # Within the grace period the rotated token is not spent again
+    assert refresher.refresh("refresh-0")["access_token"] == "access-1"
+    assert server.refreshes == ["refresh-0"]
+    refresher.close()
+
+
+def test_rejected_refresh(server):
+    server.status = 400
+    refresher = TokenRefresher(server.url, "anon-key")
+    with pytest.raises(AuthError):
+        refresher.refresh("revoked")
+    assert refresher.collect("revoked") is None
+    with pytest.raises(AuthError):
+        refresher.refresh(None)
+    refresher.close()
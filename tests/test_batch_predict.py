@@ -0,0 +1,81 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch_predict
+import feature_schema
+from inference import load_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return load_engine()
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    df = pd.read_csv(os.path.join(ROOT, "genetic_disease_dataset.csv")).drop("Disease", axis=1)
+    df.columns = [c.lower() for c in df.columns]
+    return df
+
+
+def score_csv(engine, text, chunk_size=batch_predict.DEFAULT_CHUNK_SIZE):
+    chunks = batch_predict.read_chunks(io.StringIO(text), "csv", chunk_size)
+    return pd.concat(batch_predict.score_chunks(engine, chunks), ignore_index=True)
+
+
+def test_bad_cells_flag_only_their_rows(engine, dataset):
+    df = dataset.head(30).astype(object)
+    df.loc[5, "age"] = "abc"
+    df.loc[12, "gender"] = 1.5
+    df.loc[25, "family_history"] = 2
+    out = score_csv(engine, df.to_csv(index=False), chunk_size=10)
+    assert len(out) == 30
+    assert list(out.index[out["error"] != ""]) == [5, 12, 25]
+    assert out.loc[out["error"] == "", "prediction"].notna().all()
+
+
+def test_blank_cells_take_the_defaults(engine):
+    # The bad age sends the chunk down the text path, where the blanks are str cells
+    text = "age,gender,hemoglobin\nabc,1,12\n40, ,12\n41,0,\n"
+    out = score_csv(engine, text)
+    assert list(out["error"]) == ["Invalid numeric value", "", ""]
+
+    raw, valid = batch_predict.frame_to_raw(pd.read_csv(io.StringIO(text), dtype=str))
+    assert list(valid) == [False, True, True]
+    assert raw[1, feature_schema.INDEX["gender"]] == feature_schema.DEFAULTS[feature_schema.INDEX["gender"]]
+    assert raw[2, feature_schema.INDEX["hemoglobin"]] == feature_schema.DEFAULTS[feature_schema.INDEX["hemoglobin"]]
+
+
+def test_csv_blocks_keep_quoted_newlines_together():
+    text = 'id,note\n1,"two\nlines"\n2,plain\n3,"x"\n'
+    blocks = list(batch_predict.csv_blocks(io.StringIO(text.split("\n", 1)[1]), chunk_size=1))
+    assert blocks == ['1,"two\nlines"\n', "2,plain\n", '3,"x"\n']
+
+
+def test_malformed_csv_is_a_value_error(engine):
+    with pytest.raises(ValueError):
+        score_csv(engine, "age,gender\n1,0\n2,0,9,9\n")
+
+
+def test_batch_matches_single_route(app_module, dataset):
+    engine = app_module.model_manager.engine
+    rows = dataset.sample(300, random_state=0).reset_index(drop=True)
+    out = batch_predict.score_frame(engine, rows)
+    for i, row in rows.iterrows():
+        raw = feature_schema.parse_form({k: str(int(v)) if k in ("gender", "family_history", "p53_mutation")
+                                         else str(v) for k, v in row.items()})
+        values = dict(zip(feature_schema.FIELDS, raw))
+        features = dict(zip(feature_schema.COLUMNS, feature_schema.normalize(raw)))
+        pred, proba, risk = app_module.run_prediction(
+            engine, features, len(feature_schema.warning_messages(raw)), values["gender"],
+            values["family_history"], values["hemoglobin"], values["sickled_rbc_percent"],
+            values["brca1_expression"], values["p53_mutation"], values["sweat_chloride"])
+        assert out.loc[i, "prediction"] == pred
+        assert out.loc[i, "probability"] == proba[pred]
+        assert out.loc[i, "risk_level"] == risk
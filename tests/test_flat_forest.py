@@ -0,0 +1,37 @@
+"""The committed flat-array bundle must score exactly like the committed pickle."""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_schema
+from flat_forest import FlatForest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def model():
+    return joblib.load(os.path.join(ROOT, "disease_predictor_model.pkl"))
+
+
+@pytest.fixture(scope="module")
+def X():
+    df = pd.read_csv(os.path.join(ROOT, "genetic_disease_dataset.csv"))
+    return feature_schema.normalize(df[feature_schema.COLUMNS])
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_bundle_matches_pickle(model, X, mmap_mode):
+    flat = FlatForest.load(os.path.join(ROOT, "disease_predictor_model"), mmap_mode=mmap_mode)
+    rows = X.to_numpy(dtype=np.float64)
+    assert np.array_equal(flat.classes_, model.classes_)
+    assert np.array_equal(flat.predict_proba(rows), model.predict_proba(X))
+    assert np.array_equal(flat.predict(rows), model.predict(X))
+
+
+def test_export_matches_pickle(model, X):
+    flat = FlatForest.from_model(model)
+    assert np.array_equal(flat.predict_proba(X.to_numpy(dtype=np.float64)), model.predict_proba(X))
@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from local_store import SQLiteStore, SupabaseSync
+
+
+def prediction(i, **extra):
+    return {"user_id": f"u{i % 3}", "disease": "Hemophilia", "probability": 0.5, "risk_level": "Moderate",
+            "form_data": {"age": str(i)}, "created_at": f"2026-01-01T00:00:{i:02d}+00:00", **extra}
+
+
+class StandIn:
+    """table(name).upsert(rows, on_conflict).execute() into a dict keyed by id."""
+
+    def __init__(self, reject=None, error=None):
+        self.rows = {}
+        self.calls = 0
+        self.reject = reject
+        self.error = error
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        return SimpleNamespace(execute=lambda: self._execute(rows))
+
+    def _execute(self, rows):
+        with self.lock:
+            self.calls += 1
+            if self.error is not None and (self.reject is None or any(self.reject(r) for r in rows)):
+                raise self.error
+            self.rows.update((r["id"], r) for r in rows)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / "predictions.db"))
+    yield store
+    store.close()
+
+
+def test_history_query(store):
+    store.table("predictions").insert([prediction(i) for i in range(12)]).execute()
+    rows = store.table("predictions").select("*").eq("user_id", "u0").order("created_at", desc=True).limit(3).execute().data
+    assert [r["form_data"]["age"] for r in rows] == ["9", "6", "3"]
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE predictions (id TEXT PRIMARY KEY, user_id TEXT, disease TEXT NOT NULL, "
+                 "probability REAL NOT NULL, risk_level TEXT NOT NULL, form_data TEXT NOT NULL, "
+                 "created_at TEXT NOT NULL, updated_at TEXT NOT NULL, synced_at TEXT)")
+    conn.execute("INSERT INTO predictions VALUES ('old', 'u0', 'Hemophilia', 0.5, 'Low', '{}', "
+                 "'2025-01-01T00:00:00+00:00', '2025-01-01T00:00:00+00:00', NULL)")
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(path)
+    columns = {row["name"] for row in store.connection().execute("PRAGMA table_info(predictions)")}
+    assert {"model_version", "sync_rejected_at", "sync_error"} <= columns
+    assert [r["id"] for r in store.unsynced()] == ["old"]
+    store.table("predictions").insert([prediction(1, model_version="abc")]).execute()
+    assert store.pending_sync() == 2
+    store.close()
+
+
+def test_sync_marks_rows_synced(store):
+    store.table("predictions").insert([prediction(i) for i in range(25)]).execute()
+    client = StandIn()
+    sync = SupabaseSync(store, client, batch_size=10)
+    assert sync.sync_once() == 25
+    assert len(client.rows) == 25
+    assert store.pending_sync() == 0
+    assert sync.sync_once() == 0
+
+
+def test_rejected_row_does_not_block_later_rows(store):
+    store.table("predictions").insert([prediction(i) for i in range(25)]).execute()
+    bad = store.unsynced(1)[0]["id"]
+    client = StandIn(reject=lambda r: r["id"] == bad,
+                     error=APIError({"code": "23503", "message": "violates foreign key constraint"}))
+    sync = SupabaseSync(store, client, batch_size=10)
+    assert sync.sync_once() == 24
+    assert bad not in client.rows and len(client.rows) == 24
+    assert store.pending_sync() == 0
+    rejected = store.connection().execute("SELECT sync_error FROM predictions WHERE id = ?", (bad,)).fetchone()
+    assert "23503" in rejected["sync_error"]
+
+    # Later rows keep syncing, and the rejected one is not retried
+    store.table("predictions").insert([prediction(30)]).execute()
+    calls = client.calls
+    assert sync.sync_once() == 1
+    assert client.calls == calls + 1
+
+
+def test_outage_leaves_rows_unsynced(store):
+    store.table("predictions").insert([prediction(i) for i in range(5)]).execute()
+    client = StandIn(error=httpx.ConnectError("connection refused"))
+    sync = SupabaseSync(store, client)
+    with pytest.raises(httpx.ConnectError):
+        sync.sync_once()
+    assert store.pending_sync() == 5
+    assert sync.stats["rejected"] == 0
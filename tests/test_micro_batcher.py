@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+class Model:
+    """predict_proba recording the size and scoring thread of each call."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def predict_proba(self, X):
+        with self.lock:
+            self.calls.append((len(X), threading.current_thread().name))
+        if self.fail:
+            raise ValueError("bad model")
+        return np.column_stack([X[:, 0], 1 - X[:, 0]])
+
+
+def batcher_threads():
+    return [t for t in threading.enumerate() if t.name == "micro-batcher"]
+
+
+def test_concurrent_rows_get_their_own_probabilities():
+    model = Model()
+    batcher = MicroBatcher(model.predict_proba, max_batch_size=8, max_wait=0.05)
+    barrier = threading.Barrier(20)
+    results = {}
+
+    def request(i):
+        barrier.wait()
+        results[i] = batcher.predict(np.array([i / 100, 0.0]))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    for i in range(20):
+        assert results[i] == pytest.approx([i / 100, 1 - i / 100])
+    assert sum(n for n, _ in model.calls) == 20
+    assert max(n for n, _ in model.calls) <= 8
+    assert batcher.stats()["rows"] == 20
+
+
+def test_lone_request_is_not_held_for_max_wait():
+    batcher = MicroBatcher(Model().predict_proba, max_batch_size=8, max_wait=10.0)
+    assert batcher.submit(np.array([0.25, 0.0])).result(timeout=1) == pytest.approx([0.25, 0.75])
+    batcher.close()
+
+
+def test_failed_batch_fails_its_futures():
+    batcher = MicroBatcher(Model(fail=True).predict_proba)
+    with pytest.raises(ValueError):
+        batcher.predict(np.array([0.5, 0.0]))
+    batcher.close()
+
+
+def test_rows_after_close_are_scored_inline():
+    model = Model()
+    batcher = MicroBatcher(model.predict_proba)
+    batcher.predict(np.array([0.5, 0.0]))
+    batcher.close()
+    assert not batcher_threads()
+
+    assert batcher.predict(np.array([0.1, 0.0])) == pytest.approx([0.1, 0.9])
+    assert model.calls[-1] == (1, threading.current_thread().name)
+    # Scoring inline does not bring the background thread back
+    assert not batcher_threads()
+
+
+def test_close_before_first_row_starts_no_thread():
+    batcher = MicroBatcher(Model().predict_proba)
+    batcher.close()
+    assert batcher.predict(np.array([0.3, 0.0])) == pytest.approx([0.3, 0.7])
+    assert not batcher_threads()
+
+
+def test_submit_racing_close_is_always_answered():
+    model = Model()
+    batcher = MicroBatcher(model.predict_proba, max_batch_size=4, max_wait=0.001)
+    futures = []
+    started = threading.Event()
+
+    def submit_many():
+        started.set()
+        for i in range(500):
+            futures.append(batcher.submit(np.array([i / 1000, 0.0])))
+
+    thread = threading.Thread(target=submit_many)
+    thread.start()
+    started.wait()
+    batcher.close()
+    thread.join()
+    # Every row, queued before close() or scored inline after it, resolves
+    for i, future in enumerate(futures):
+        assert future.result(timeout=1) == pytest.approx([i / 1000, 1 - i / 1000])
+    assert sum(n for n, _ in model.calls) == 500
+    assert not batcher_threads()
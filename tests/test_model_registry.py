@@ -0,0 +1,126 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import feature_schema
+import model_registry
+from inference import FEATURE_COLUMNS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLE = os.path.join(ROOT, "disease_predictor_model")
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return str(tmp_path / "models")
+
+
+@pytest.fixture
+def retrained(tmp_path):
+    """Stand-in for a retrained bundle: the committed one with a root threshold moved."""
+    path = tmp_path / "retrained"
+    shutil.copytree(BUNDLE, path)
+    roots = np.load(path / "roots.npy")
+    threshold = np.load(path / "threshold.npy")
+    threshold[roots[0]] += 0.01
+    np.save(path / "threshold.npy", threshold)
+    return str(path)
+
+
+def features():
+    raw = feature_schema.parse_form({"age": "40", "hemoglobin": "12"})
+    return dict(zip(FEATURE_COLUMNS, feature_schema.normalize(raw)))
+
+
+def test_publish_names_a_version_by_its_checksum(registry):
+    version = model_registry.publish(BUNDLE, registry, {"test_accuracy": 0.9})
+    assert model_registry.publish(BUNDLE, registry) == version
+    assert [m["version"] for m in model_registry.list_versions(registry)] == [version]
+    metadata = model_registry.read_metadata(registry, version)
+    assert metadata["test_accuracy"] == 0.9 and metadata["published_at"]
+    assert not [name for name in os.listdir(registry) if name.startswith(".staging")]
+    assert model_registry.load_version(registry, version).version == version
+
+
+def test_tampered_version_is_refused(registry):
+    version = model_registry.publish(BUNDLE, registry)
+    with open(os.path.join(registry, version, "threshold.npy"), "r+b") as f:
+        f.seek(-8, os.SEEK_END)
+        tail = f.read()
+        f.seek(-8, os.SEEK_END)
+        f.write(bytes(b ^ 0xFF for b in tail))
+    with pytest.raises(ValueError, match="checksum"):
+        model_registry.load_version(registry, version)
+
+
+def test_pointer_to_unknown_version_is_refused(registry):
+    os.makedirs(registry)
+    with pytest.raises(ValueError, match="Unknown model version"):
+        model_registry.write_pointer(registry, model_registry.CURRENT, "missing")
+    with pytest.raises(ValueError, match="no CURRENT"):
+        model_registry.ModelManager(registry).load()
+
+
+def test_check_swaps_in_a_new_current_version(registry, retrained):
+    first = model_registry.publish(BUNDLE, registry)
+    second = model_registry.publish(retrained, registry)
+    assert first != second
+    model_registry.write_pointer(registry, model_registry.CURRENT, first)
+    swapped = []
+    manager = model_registry.ModelManager(registry, poll_interval=0, batching={"max_batch_size": 4},
+                                          on_swap=swapped.append)
+    old = manager.load()
+    old.predict_one(features())
+    assert manager.check() is False
+
+    model_registry.write_pointer(registry, model_registry.CURRENT, second)
+    assert manager.check() is True
+    assert manager.engine.version == second
+    assert [e.version for e in swapped] == [first, second]
+    assert manager.stats["reloads"] == 1
+
+    # A request still holding the old engine is scored inline by it, without restarting its thread
+    label, proba = old.predict_one(features())
+    assert label in old.classes_ and proba.sum() == pytest.approx(1.0)
+    assert not old.batcher._thread.is_alive()
+    assert manager.engine.predict_one(features())[1].sum() == pytest.approx(1.0)
+    manager.engine.batcher.close()
+
+
+def test_failed_version_keeps_serving_and_is_not_retried(registry, retrained):
+    first = model_registry.publish(BUNDLE, registry)
+    second = model_registry.publish(retrained, registry)
+    model_registry.write_pointer(registry, model_registry.CURRENT, first)
+    manager = model_registry.ModelManager(registry, poll_interval=0)
+    manager.load()
+    os.remove(os.path.join(registry, second, "roots.npy"))
+
+    model_registry.write_pointer(registry, model_registry.CURRENT, second)
+    assert manager.check() is False
+    assert manager.check() is False
+    assert manager.engine.version == first
+    assert manager.stats["reload_failures"] == 1
+
+
+def test_candidate_is_scored_in_shadow(registry, retrained):
+    first = model_registry.publish(BUNDLE, registry)
+    second = model_registry.publish(retrained, registry)
+    model_registry.write_pointer(registry, model_registry.CURRENT, first)
+    model_registry.write_pointer(registry, model_registry.CANDIDATE, second)
+    manager = model_registry.ModelManager(registry, poll_interval=0)
+    engine = manager.load()
+    assert manager.candidate.version == second
+
+    for _ in range(10):
+        row = features()
+        manager.shadow(row, engine.predict_one(row)[1])
+    manager.close()
+    assert manager.stats["shadow_scored"] == 10
+    assert manager.describe()["shadow_agreement"] is not None
+
+    model_registry.write_pointer(registry, model_registry.CANDIDATE, None)
+    manager.check()
+    assert manager.candidate is None
+    assert not any(t.is_alive() for t in manager._threads.values())
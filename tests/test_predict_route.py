@@ -0,0 +1,55 @@
+import pytest
+
+
+class WriterStandIn:
+    def __init__(self):
+        self.rows = []
+
+    def enqueue(self, row):
+        self.rows.append(row)
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "authenticate", lambda: True)
+    monkeypatch.setattr(app_module, "prediction_writer", WriterStandIn())
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"id": "u1", "email": "u1@example.com"}
+    return client
+
+
+FORM = {"age": "40", "gender": "1", "family_history": "0", "hemoglobin": "14", "sickled_rbc_percent": "0.5"}
+
+
+def test_json_result_carries_the_explanation(app_module, client):
+    response = client.post("/predict?format=json", data=FORM)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["disease"] == app_module.disease_labels[body["prediction"]]
+    assert body["model_version"] == app_module.model_manager.engine.version
+    assert len(body["explanation"]["features"]) == 5
+    assert {"feature", "contribution"} == set(body["explanation"]["features"][0])
+    assert [r["disease"] for r in app_module.prediction_writer.rows] == [body["disease"]]
+    with client.session_transaction() as session:
+        assert "prediction_result" not in session and "_flashes" not in session
+
+
+def test_json_result_lists_warnings_instead_of_flashing(client):
+    body = client.post("/predict?format=json", data={**FORM, "hemoglobin": "40"}).get_json()
+    assert body["warnings"]
+    with client.session_transaction() as session:
+        assert "_flashes" not in session
+
+
+def test_json_error(client):
+    response = client.post("/predict?format=json", data={**FORM, "age": "abc"})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_form_post_still_redirects(client):
+    response = client.post("/predict", data=FORM)
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert "explanation" not in session["prediction_result"]
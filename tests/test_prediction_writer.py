@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from prediction_writer import PredictionWriter, is_permanent
+
+
+class StandIn:
+    """table(name).insert(rows).execute() over a list, failing rows or whole batches on demand."""
+
+    def __init__(self, reject=None, error=None, delay=0.0):
+        self.rows = []
+        self.calls = 0
+        # Rows for which reject(row) is true fail their whole batch with `error`
+        self.reject = reject
+        self.error = error
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        return SimpleNamespace(execute=lambda: self._execute(rows))
+
+    def _execute(self, rows):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            if self.error is not None and (self.reject is None or any(self.reject(r) for r in rows)):
+                raise self.error
+            self.rows.extend(rows)
+
+
+def make_writer(client, tmp_path, **kwargs):
+    return PredictionWriter(client, max_batch_size=8, flush_interval=0.01, backoff_base=0.001, remote=False,
+                            spill_path=str(tmp_path / "spill.jsonl"),
+                            dead_letter_path=str(tmp_path / "dead.jsonl"), **kwargs)
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("error, permanent", [
+    (APIError({"code": "23514", "message": "violates check constraint"}), True),
+    (APIError({"code": "22P02", "message": "invalid input syntax"}), True),
+    (APIError({"code": "42501", "message": "violates row-level security policy"}), False),
+    (APIError({"code": "PGRST204", "message": "Could not find the 'model_version' column"}), False),
+    (APIError({"code": "PGRST301", "message": "JWT expired"}), False),
+    (APIError({"code": 401, "message": "Invalid API key"}), False),
+    (httpx.ConnectError("connection refused"), False),
+])
+def test_is_permanent(error, permanent):
+    assert is_permanent(error) is permanent
+
+
+def test_rejected_rows_are_dead_lettered(tmp_path):
+    client = StandIn(reject=lambda r: r["i"] in (3, 17), error=APIError({"code": "23514", "message": "check"}))
+    writer = make_writer(client, tmp_path)
+    for i in range(40):
+        writer.enqueue({"i": i})
+    writer.close()
+    assert sorted(r["i"] for r in client.rows) == [i for i in range(40) if i not in (3, 17)]
+    assert sorted(r["row"]["i"] for r in read_lines(tmp_path / "dead.jsonl")) == [3, 17]
+    assert writer.stats["retries"] == 0
+    assert not os.path.exists(tmp_path / "spill.jsonl")
+
+
+@pytest.mark.parametrize("error", [
+    APIError({"code": 401, "message": "Invalid API key"}),
+    APIError({"code": "PGRST204", "message": "Could not find the 'model_version' column"}),
+    APIError({"code": "42501", "message": "violates row-level security policy"}),
+])
+def test_deployment_errors_spill_rows_for_replay(tmp_path, error):
+    client = StandIn(error=error)
+    writer = make_writer(client, tmp_path, max_retries=1)
+    for i in range(20):
+        writer.enqueue({"i": i})
+    writer.close()
+    assert client.rows == []
+    assert read_lines(tmp_path / "dead.jsonl") == []
+    assert sorted(r["i"] for r in read_lines(tmp_path / "spill.jsonl")) == list(range(20))
+
+    # Once the deployment is fixed, every row is replayed
+    client.error = None
+    writer.replay_spill()
+    assert sorted(r["i"] for r in client.rows) == list(range(20))
+    assert not os.path.exists(tmp_path / "spill.jsonl")
+
+
+def test_concurrent_replays_insert_rows_once(tmp_path):
+    with open(tmp_path / "spill.jsonl", "w") as f:
+        f.writelines(json.dumps({"i": i}) + "\n" for i in range(50))
+    client = StandIn(delay=0.005)
+    writers = [make_writer(client, tmp_path) for _ in range(2)]
+    threads = [threading.Thread(target=w.replay_spill) for w in writers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(r["i"] for r in client.rows) == list(range(50))
+    assert not os.path.exists(tmp_path / "spill.jsonl.replay")
+
+
+def test_interrupted_replay_resumes_after_written_rows(tmp_path):
+    # A previous replay wrote the first 16 rows, then the worker died
+    with open(tmp_path / "spill.jsonl.replay", "w") as f:
+        f.writelines(json.dumps({"i": i}) + "\n" for i in range(20))
+    with open(tmp_path / "spill.jsonl.replay.offset", "w") as f:
+        f.write("16")
+    client = StandIn()
+    make_writer(client, tmp_path).replay_spill()
+    assert [r["i"] for r in client.rows] == [16, 17, 18, 19]
+    assert not os.path.exists(tmp_path / "spill.jsonl.replay")
+    assert not os.path.exists(tmp_path / "spill.jsonl.replay.offset")
+
+
+def test_replay_without_spill_file_is_a_no_op(tmp_path):
+    client = StandIn()
+    make_writer(client, tmp_path).replay_spill()
+    assert client.calls == 0
@@ -1,30 +1,225 @@
+"""Training pipeline for the disease predictor.
+
+1. Stratified k-fold cross-validation of every candidate in a grid or random
+   search over n_estimators, max_depth and max_features, run on a process pool.
+2. Per-candidate fit time and single-row predict latency (flat-array serving
+   path), so a model can be picked against a latency budget, not only accuracy.
+3. Refit of the selected candidate, evaluation on a held-out split, and export
+   of the pickle and the flat-array serving bundle.
+4. Optionally (--compress-tolerance), compression of the serving bundle to
+   the smallest forest within the accuracy tolerance on a validation split
+   carved out of the training rows (see compress_model.py).
+5. Optionally (--registry), publication of the bundle as a new model version
+   with its evaluation as metadata; running apps load it in the background
+   once it is activated (see model_registry.py).
+
+Usage:
+    python train_model.py                                   # full grid, all cores
+    python train_model.py --search random --n-iter 12 --latency-budget-ms 0.5
+    python train_model.py --search none                     # single 100-tree forest
+    python train_model.py --registry models --activate      # publish and serve the result
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import joblib
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+
+import feature_schema
+from compress_model import compress, holdout_splits
+from compress_model import print_results as print_compression
+from flat_forest import FlatForest, single_row_latency_ms, verify
+from model_registry import CURRENT, publish, write_pointer
+
+PARAM_GRID = {
+    "n_estimators": [25, 50, 100, 200],
+    "max_depth": [None, 6, 10, 16],
+    "max_features": ["sqrt", 0.5, None],
+}
+DEFAULT_PARAMS = {"n_estimators": 100, "max_depth": None, "max_features": "sqrt"}
+
+# Rows used to time single-row prediction for each candidate
+LATENCY_SAMPLES = 200
+
+_X = _y = None
+
+
+def _init_worker(X, y):
+    # Ship the dataset to each worker once rather than with every task
+    global _X, _y
+    _X, _y = X, y
+
+
+def evaluate_candidate(params, folds, seed):
+    X, y = _X, _y
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    accuracies, fit_times, batch_times = [], [], []
+    for train_idx, val_idx in cv.split(X, y):
+        model = RandomForestClassifier(**params, random_state=seed, n_jobs=1)
+        start = time.perf_counter()
+        model.fit(X[train_idx], y[train_idx])
+        fit_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        y_pred = model.predict(X[val_idx])
+        batch_times.append((time.perf_counter() - start) / len(val_idx))
+        accuracies.append(accuracy_score(y[val_idx], y_pred))
+
+    # Latency of the serving path (flat-array forest) for the last fold's model
+    flat = FlatForest.from_model(model)
+    p50, p95 = single_row_latency_ms(flat, X[val_idx][:LATENCY_SAMPLES])
+    return {
+        "params": params,
+        "cv_accuracy": float(np.mean(accuracies)),
+        "cv_accuracy_std": float(np.std(accuracies)),
+        "fit_s": float(np.mean(fit_times)),
+        "batch_predict_us_per_row": float(np.mean(batch_times) * 1e6),
+        "predict_p50_ms": float(p50),
+        "predict_p95_ms": float(p95),
+        "n_nodes": int(len(flat.feature)),
+    }
+
+
+def search_candidates(search, n_iter, seed):
+    if search == "none":
+        return [DEFAULT_PARAMS]
+    if search == "grid":
+        return list(ParameterGrid(PARAM_GRID))
+    return list(ParameterSampler(PARAM_GRID, n_iter=n_iter, random_state=seed))
+
+
+def select_candidate(results, latency_budget_ms=None):
+    eligible = results
+    if latency_budget_ms is not None:
+        eligible = [r for r in results if r["predict_p95_ms"] <= latency_budget_ms]
+        if not eligible:
+            raise SystemExit(f"No candidate meets the {latency_budget_ms} ms p95 latency budget; "
+                             f"fastest was {min(r['predict_p95_ms'] for r in results):.3f} ms")
+    # Most accurate first; among equals, the faster one
+    return max(eligible, key=lambda r: (round(r["cv_accuracy"], 4), -r["predict_p95_ms"]))
+
+
+def print_results(results, chosen):
+    print(f"{'n_est':>6} {'depth':>6} {'feat':>6} {'cv acc':>8} {'± std':>7} {'fit s':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'nodes':>7}")
+    for r in sorted(results, key=lambda r: -r["cv_accuracy"]):
+        p = r["params"]
+        marker = " <" if r is chosen else ""
+        print(f"{p['n_estimators']:>6} {str(p['max_depth']):>6} {str(p['max_features']):>6} "
+              f"{r['cv_accuracy'] * 100:>7.2f}% {r['cv_accuracy_std'] * 100:>6.2f} {r['fit_s']:>7.3f} "
+              f"{r['predict_p50_ms']:>7.3f} {r['predict_p95_ms']:>7.3f} {r['n_nodes']:>7}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the disease predictor with cross-validated model search.")
+    parser.add_argument("--data", default="genetic_disease_dataset.csv")
+    parser.add_argument("--search", choices=["grid", "random", "none"], default="grid")
+    parser.add_argument("--n-iter", type=int, default=12, help="Candidates sampled by --search random")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count(), help="Worker processes for the search")
+    parser.add_argument("--latency-budget-ms", type=float, help="Max p95 single-row predict latency")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-out", default="disease_predictor_model.pkl")
+    parser.add_argument("--bundle-out", default="disease_predictor_model")
+    parser.add_argument("--compress-tolerance", type=float,
+                        help="Shrink the serving bundle, allowing this much validation accuracy drop (e.g. 0.01)")
+    parser.add_argument("--validation-size", type=float,
+                        help="Share of the training rows held out of the fit for compression "
+                             "(default 0.2 with --compress-tolerance, else none)")
+    parser.add_argument("--report", help="Write per-candidate results and the final evaluation as JSON")
+    parser.add_argument("--registry", help="Publish the bundle as a new version in this model registry")
+    parser.add_argument("--activate", action="store_true", help="With --registry, serve the new version")
+    args = parser.parse_args()
+
+    # 1. Load dataset
+    df = pd.read_csv(args.data)
+
+    # 2. Separate features and label; features are normalized exactly as they are at serving time
+    X = feature_schema.normalize(df[feature_schema.COLUMNS])
+    y = df["Disease"]
+
+    # 3. Train-test split (the test split is only used for the final evaluation). Compression picks
+    # among ~100 candidates, so it gets its own validation split out of the training rows
+    validation_size = args.validation_size
+    if validation_size is None:
+        validation_size = 0.2 if args.compress_tolerance is not None else 0
+    X_train, X_val, X_test, y_train, y_val, y_test = holdout_splits(X, y, args.test_size, validation_size, args.seed)
+
+    # 4. Cross-validated search on the training split, one candidate per worker process
+    candidates = search_candidates(args.search, args.n_iter, args.seed)
+    print(f"Evaluating {len(candidates)} candidate(s) with {args.folds}-fold stratified CV "
+          f"on {min(args.n_jobs, len(candidates))} process(es)")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(args.n_jobs, len(candidates)), initializer=_init_worker,
+                             initargs=(X_train.to_numpy(), y_train.to_numpy())) as pool:
+        futures = [pool.submit(evaluate_candidate, params, args.folds, args.seed) for params in candidates]
+        results = [f.result() for f in futures]
+    print(f"Search finished in {time.perf_counter() - start:.1f}s")
+    chosen = select_candidate(results, args.latency_budget_ms)
+    print_results(results, chosen)
+    print(f"\nSelected: {chosen['params']}")
+
+    # 5. Refit the selected candidate on the training split (less any validation rows)
+    model = RandomForestClassifier(**chosen["params"], random_state=args.seed)
+    model.fit(X_train, y_train)
+    # Recorded so compress_model.py can rebuild the splits and score candidates on unseen rows
+    model.holdout_ = {"rows": len(df), "test_size": args.test_size, "validation_size": validation_size,
+                      "seed": args.seed}
+
+    # 6. Evaluate
+    y_pred = model.predict(X_test)
+    accuracy = accuracy_score(y_test, y_pred)
+    print(f"Accuracy: {accuracy * 100:.2f}%")
+    print("\nClassification Report:\n", classification_report(y_test, y_pred))
+    print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
 
-# 1. Load dataset
-df = pd.read_csv("genetic_disease_dataset.csv")
+    # 7. Save model
+    joblib.dump(model, args.model_out)
+    print(f"Model saved as '{args.model_out}'")
 
-# 2. Separate features and label
-X = df.drop("Disease", axis=1)
-y = df["Disease"]
+    # 8. Export flat-array model for serving and check it matches predict_proba on the whole dataset
+    flat = FlatForest.from_model(model)
+    verify(model, flat, X)
+    compression = None
+    if args.compress_tolerance is not None:
+        # 9. Serve the smallest forest that stays within the accuracy tolerance on the validation split
+        flat, compression = compress(flat, X_val, y_val, args.compress_tolerance)
+        print_compression(compression)
+    # Accuracy of the bundle actually served, which differs from the refit's once compressed
+    served_accuracy = float(np.mean(flat.predict(X_test.to_numpy()) == y_test.to_numpy()))
+    if compression:
+        print(f"Compressed bundle accuracy: {served_accuracy * 100:.2f}% (full forest {accuracy * 100:.2f}%)")
+    flat.save(args.bundle_out)
+    print(f"Flat model saved to '{args.bundle_out}/'")
 
-# 3. Train-test split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"candidates": results, "selected": chosen, "test_accuracy": served_accuracy,
+                       "refit_test_accuracy": accuracy,
+                       "seed": args.seed, "folds": args.folds, "compression": compression}, f, indent=2)
+        print(f"Report written to '{args.report}'")
 
-# 4. Train Random Forest
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
+    if args.registry:
+        # 10. Publish as a registry version, with the evaluation as its metadata
+        version = publish(args.bundle_out, args.registry, metadata={
+            # test_accuracy is the published bundle's; refit_test_accuracy the uncompressed forest's
+            "test_accuracy": served_accuracy, "refit_test_accuracy": accuracy,
+            "cv_accuracy": chosen["cv_accuracy"], "params": chosen["params"],
+            "predict_p95_ms": chosen["predict_p95_ms"], "data": args.data, "seed": args.seed,
+            "compression": next((r for r in compression if r.get("selected")), None) if compression else None,
+        })
+        print(f"Published model version {version} to '{args.registry}'")
+        if args.activate:
+            write_pointer(args.registry, CURRENT, version)
+            print(f"Now serving {version}")
 
-# 5. Evaluate
-y_pred = model.predict(X_test)
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Accuracy: {accuracy * 100:.2f}%")
-print("\nClassification Report:\n", classification_report(y_test, y_pred))
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
 
-# 6. Save model
-joblib.dump(model, "disease_predictor_model.pkl")
-print("Model saved as 'disease_predictor_model.pkl'")
+if __name__ == "__main__":
+    main()